@@ -0,0 +1,20 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Performance benchmarks for napper.
+
+``python -m napper.bench run`` starts a local stand-in server (see
+`napper.bench.server`) and runs the suite in `napper.bench.suite`
+against it. Results can be stored as a baseline with ``--save FILE`` and
+compared to a later run with ``--compare FILE`` or
+``python -m napper.bench compare OLD NEW``. ``--uvloop`` runs the client
+on uvloop, so that comparing against a run without it shows what
+changing loops brings. Runs on the same loop can differ by a fifth, so
+repeat both before reading anything into smaller differences.
+
+`napper.bench.sim` simulates a slow and unreliable upstream, for the
+benchmarks and for tests.
+
+``python -m napper.bench.micro`` runs only the attribute traversal
+microbenchmarks.
+"""
@@ -0,0 +1,73 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Command line interface for the benchmark suite.
+
+::
+
+    python -m napper.bench run [--quick] [--uvloop] [--save FILE]
+                               [--compare FILE]
+    python -m napper.bench compare BASELINE CURRENT
+"""
+import argparse
+import sys
+
+from ..util import install_uvloop
+from . import report, suite
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m napper.bench')
+    commands = parser.add_subparsers(dest='command')
+
+    run_p = commands.add_parser('run', help='run the benchmark suite')
+    run_p.add_argument('--quick', action='store_true',
+                       help='do less work per benchmark')
+    run_p.add_argument('--only', action='append', metavar='BENCHMARK',
+                       choices=[b.__name__ for b in suite.BENCHMARKS],
+                       help='only run this benchmark (repeatable)')
+    run_p.add_argument('--uvloop', action='store_true',
+                       help='run the client on uvloop')
+    run_p.add_argument('--address',
+                       help='use an already running stand-in server')
+    run_p.add_argument('--save', metavar='FILE',
+                       help='store the results as a baseline')
+    run_p.add_argument('--compare', metavar='FILE',
+                       help='compare the results against a baseline')
+
+    cmp_p = commands.add_parser('compare', help='compare two result files')
+    cmp_p.add_argument('baseline')
+    cmp_p.add_argument('current')
+    cmp_p.add_argument('--threshold', type=float, default=0.05,
+                       help='relative change considered noise')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        if args.uvloop and not install_uvloop():
+            parser.error('uvloop is not installed')
+        errors = {}
+        results = suite.run_suite(args.quick, args.only, args.address,
+                                  errors=errors)
+        if args.compare:
+            print(report.format_comparison(
+                report.compare(report.load(args.compare), results)))
+        else:
+            print(report.format_results(results))
+        if args.save:
+            report.save(results, args.save, errors)
+        for name, error in errors.items():
+            print('{0} failed:\n{1}'.format(name, error), file=sys.stderr)
+        if errors:
+            return 1
+    elif args.command == 'compare':
+        print(report.format_comparison(report.compare(
+            report.load(args.baseline), report.load(args.current),
+            args.threshold)))
+    else:
+        parser.print_help()
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,116 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Microbenchmarks for napper's attribute magic.
+
+These exercise the paths that go through `napper.util.metafunc` without
+doing any I/O: building requests from attribute chains and traversing
+upgraded response objects.
+"""
+import sys
+import timeit
+
+from ..request import Session
+from ..response import upgrade_object
+from ..restspec import RestSpec
+from ..util import m, rag
+
+
+RESPONSE = {
+    "num": 3,
+    "object": {
+        "prop1": "hello",
+        "nested": {"deeper": {"value": 42}},
+    },
+    "list": [{"id": i} for i in range(10)],
+    "ham": "spam",
+}
+
+
+def make_site(address='http://www.example.org'):
+    spec = RestSpec()
+    spec.address = address
+    return Session(spec, None)
+
+
+def make_response(site=None):
+    if site is None:
+        site = make_site()
+    req = site.res.get()
+    return upgrade_object(RESPONSE, m(req))
+
+
+def benchmarks():
+    """Returns a list of ``(name, function)`` pairs to time."""
+    site = make_site()
+    resp = make_response(site)
+    req = site.res.get()
+    template = site.repos['{owner}']['{repo}'].issues.prepare('get')
+
+    def view():
+        m(resp)
+
+    def build_request():
+        site.repos.epsy.napper.issues.get()
+
+    def build_request_items():
+        site['repos']['epsy']['napper']['issues'].get()
+
+    def build_request_template():
+        template(owner='epsy', repo='napper')
+
+    def request_attr():
+        rag(req, 'url')
+
+    def response_item():
+        resp['num']
+
+    def response_attr():
+        resp.num
+
+    def response_deep_attr():
+        resp.object.nested.deeper.value
+
+    def response_deep_item():
+        resp['object']['nested']['deeper']['value']
+
+    def response_list_item():
+        resp.list[5].id
+
+    return [
+        ('m(obj)', view),
+        ('site.a.b.c.d.get()', build_request),
+        ("site['a']['b']['c']['d'].get()", build_request_items),
+        ('template(a=..., b=...)', build_request_template),
+        ('rag(request, attr)', request_attr),
+        ("resp['key']", response_item),
+        ('resp.key', response_attr),
+        ('resp.a.b.c.d', response_deep_attr),
+        ("resp['a']['b']['c']['d']", response_deep_item),
+        ('resp.list[i].key', response_list_item),
+    ]
+
+
+def time_function(func, repeat=5, min_time=0.2):
+    """Returns the best time per call of ``func``, in seconds."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(number, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(repeat=5):
+    """Runs all microbenchmarks and returns ``{name: seconds per call}``."""
+    return {name: time_function(func, repeat=repeat)
+            for name, func in benchmarks()}
+
+
+def main(argv=None):
+    results = run()
+    width = max(len(name) for name in results)
+    for name, secs in results.items():
+        print('{0:<{1}}  {2:10.0f} ns'.format(name, width, secs * 1e9))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
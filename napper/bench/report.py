@@ -0,0 +1,103 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Storing benchmark results as baselines and comparing them."""
+import collections
+import json
+import platform
+import sys
+import time
+
+from .suite import METRICS
+
+
+Comparison = collections.namedtuple(
+    'Comparison', 'name unit old new change verdict')
+
+
+def save(results, path, errors=None):
+    """Writes ``results`` to ``path`` along with a description of the
+    environment they were obtained in and the ``errors`` of benchmarks
+    that failed, as recorded by `.suite.run_suite`."""
+    import aiohttp
+    data = {
+        'results': results,
+        'errors': errors or {},
+        'environment': {
+            'python': sys.version,
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'aiohttp': aiohttp.__version__,
+        },
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    """Reads the results stored in ``path`` by `save`"""
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(old, new, threshold=0.05):
+    """Compares two sets of results metric by metric.
+
+    :param threshold: relative changes below this are reported as noise
+    :returns: a list of `Comparison`
+    """
+    ret = []
+    for name in list(METRICS) + sorted((set(old) | set(new)) - set(METRICS)):
+        if name not in old and name not in new:
+            continue
+        metric = METRICS.get(name)
+        unit = metric.unit if metric is not None else ''
+        o = old.get(name)
+        n = new.get(name)
+        change = None
+        verdict = ''
+        if o is None:
+            verdict = 'new'
+        elif n is None:
+            verdict = 'missing'
+        elif o:
+            change = (n - o) / abs(o)
+            if abs(change) < threshold or metric is None:
+                verdict = ''
+            elif (change > 0) == metric.higher_is_better:
+                verdict = 'better'
+            else:
+                verdict = 'worse'
+        ret.append(Comparison(name, unit, o, n, change, verdict))
+    return ret
+
+
+def _fmt(value):
+    if value is None:
+        return '-'
+    return '{0:.4g}'.format(value)
+
+
+def format_results(results):
+    width = max(len(name) for name in results) if results else 0
+    lines = []
+    for name, value in results.items():
+        metric = METRICS.get(name)
+        unit = metric.unit if metric is not None else ''
+        lines.append('{0:<{1}}  {2:>12} {3}'.format(
+            name, width, _fmt(value), unit))
+    return '\n'.join(lines)
+
+
+def format_comparison(comparisons):
+    width = max((len(c.name) for c in comparisons), default=0)
+    lines = ['{0:<{1}}  {2:>12} {3:>12} {4:>8}'.format(
+        'metric', width, 'baseline', 'current', 'change')]
+    for c in comparisons:
+        change = '-' if c.change is None else '{0:+.1%}'.format(c.change)
+        lines.append('{0:<{1}}  {2:>12} {3:>12} {4:>8}  {5} {6}'.format(
+            c.name, width, _fmt(c.old), _fmt(c.new), change, c.unit,
+            c.verdict).rstrip())
+    return '\n'.join(lines)
@@ -0,0 +1,225 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""A local stand-in server serving synthetic data for the benchmarks.
+
+Routes:
+
+``/items/{id}``
+    A JSON object describing item ``id``, with a nested object, a list
+    and permalinks. ``?size=N`` pads the object's description to ``N``
+    characters.
+
+``/pages``
+    A paginated collection: ``{"items": [...], "next": url}``.
+    ``?per_page=N&pages=P&page=I`` selects the layout and current page.
+
+``/drip``
+    ``?lines=N&size=S`` streams ``N`` JSON objects, one per line, each
+    padded to about ``S`` bytes, flushing every ``?every=K`` lines.
+
+``/blob``
+    ``?size=N`` streams ``N`` bytes of binary data. Byte ranges are
+    served unless ``?ranges=0``; the ETag changes with the size.
+
+``/upload``
+    Reads the posted body as it arrives and describes it:
+    ``{"size": N, "sha1": hex digest, "chunked": bool}``.
+"""
+import asyncio
+import hashlib
+import json
+import socket
+import threading
+
+from aiohttp import web
+
+
+def make_item(i, size=0):
+    return {
+        "id": i,
+        "name": "item-{0}".format(i),
+        "url": "/items/{0}".format(i),
+        "owner": {
+            "login": "user{0}".format(i % 97),
+            "id": i % 97,
+            "html_url": "/users/user{0}".format(i % 97),
+        },
+        "tags": ["tag{0}".format(j) for j in range(i % 5)],
+        "score": i * 0.5,
+        "public": bool(i % 2),
+        "description": "x" * size,
+    }
+
+
+def _int_arg(request, name, default):
+    try:
+        return int(request.query.get(name, default))
+    except ValueError:
+        raise web.HTTPBadRequest(text="Bad value for " + name)
+
+
+async def item(request):
+    i = int(request.match_info['id'])
+    return web.json_response(make_item(i, _int_arg(request, 'size', 0)))
+
+
+async def pages(request):
+    per_page = _int_arg(request, 'per_page', 30)
+    page_count = _int_arg(request, 'pages', 10)
+    page = _int_arg(request, 'page', 1)
+    size = _int_arg(request, 'size', 0)
+    start = (page - 1) * per_page
+    ret = {"items": [make_item(i, size)
+                     for i in range(start, start + per_page)]}
+    if page < page_count:
+        ret["next"] = str(request.url.update_query(page=page + 1))
+    return web.json_response(ret)
+
+
+async def drip(request):
+    lines = _int_arg(request, 'lines', 1000)
+    size = _int_arg(request, 'size', 0)
+    every = max(_int_arg(request, 'every', 16), 1)
+    resp = web.StreamResponse(
+        headers={'Content-Type': 'application/x-ndjson; charset=utf-8'})
+    await resp.prepare(request)
+    buf = []
+    for i in range(lines):
+        buf.append(json.dumps(make_item(i, size)).encode() + b'\n')
+        if len(buf) >= every:
+            await resp.write(b''.join(buf))
+            buf = []
+    if buf:
+        await resp.write(b''.join(buf))
+    await resp.write_eof()
+    return resp
+
+
+_BLOB_CHUNK = bytes(range(256)) * 257
+
+
+async def blob(request):
+    size = _int_arg(request, 'size', 1 << 20)
+    etag = '"blob-{0}"'.format(size)
+    resp = web.StreamResponse()
+    resp.content_type = 'application/octet-stream'
+    resp.etag = etag[1:-1]
+    start, end = 0, size
+    if _int_arg(request, 'ranges', 1):
+        resp.headers['Accept-Ranges'] = 'bytes'
+        if_range = request.headers.get('If-Range')
+        if 'Range' in request.headers and if_range in (None, etag):
+            try:
+                start, end, _ = request.http_range.indices(size)
+            except ValueError:
+                raise web.HTTPRequestRangeNotSatisfiable(
+                    headers={'Content-Range': 'bytes */{0}'.format(size)})
+            if start >= end:
+                raise web.HTTPRequestRangeNotSatisfiable(
+                    headers={'Content-Range': 'bytes */{0}'.format(size)})
+            resp.set_status(206)
+            resp.headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                start, end - 1, size)
+    resp.content_length = end - start
+    await resp.prepare(request)
+    step = len(_BLOB_CHUNK) - 256
+    for pos in range(start, end, step):
+        offset = pos % 256
+        await resp.write(_BLOB_CHUNK[offset:offset + min(step, end - pos)])
+    await resp.write_eof()
+    return resp
+
+
+async def upload(request):
+    h = hashlib.sha1()
+    size = 0
+    while True:
+        chunk = await request.content.readany()
+        if not chunk:
+            break
+        h.update(chunk)
+        size += len(chunk)
+    return web.json_response({
+        "size": size,
+        "sha1": h.hexdigest(),
+        "chunked": request.headers.get('Transfer-Encoding') == 'chunked',
+    })
+
+
+def make_app():
+    app = web.Application()
+    app.router.add_get('/items/{id}', item)
+    app.router.add_get('/pages', pages)
+    app.router.add_get('/drip', drip)
+    app.router.add_get('/blob', blob)
+    app.router.add_post('/upload', upload)
+    app.router.add_put('/upload', upload)
+    return app
+
+
+class BenchServer:
+    """Serves ``app`` on a local port from a background thread.
+
+    The server runs its own event loop so that its work is kept apart
+    from the client's. Use as a context manager, or call `start` and
+    `stop`. The base URL is available as `address` once started.
+    """
+    def __init__(self, app=None, host='127.0.0.1', port=0):
+        self.app = make_app() if app is None else app
+        self.host = host
+        self.port = port
+        self.address = None
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._error = None
+
+    def __repr__(self):
+        return '<BenchServer [{0}]>'.format(self.address)
+
+    def start(self):
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        host, port = sock.getsockname()[:2]
+        self.address = 'http://{0}:{1}'.format(host, port)
+        self._thread = threading.Thread(
+            target=self._run, args=(sock,), name='napper-bench-server',
+            daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def _run(self, sock):
+        loop = self._loop = asyncio.SelectorEventLoop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(self.app, access_log=None)
+        try:
+            loop.run_until_complete(runner.setup())
+            loop.run_until_complete(web.SockSite(runner, sock).start())
+        except Exception as exc:
+            self._error = exc
+            self._ready.set()
+            return
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            loop.run_until_complete(runner.cleanup())
+            loop.close()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, typ, val, tb):
+        self.stop()
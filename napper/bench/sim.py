@@ -0,0 +1,197 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""A simulated upstream injecting latency and faults.
+
+`SimulatedServer` is a transport answering requests with an application
+served in-process (the stand-in server of `napper.bench.server` unless
+told otherwise), degraded in a controlled way::
+
+    sim = SimulatedServer(latency=lognormal(0.05, 0.5),
+                          errors={429: 0.05, 503: 0.01},
+                          bandwidth=256 * 1024, capacity=20, seed=1)
+    async with factory(transport=sim) as site:
+        ...
+
+In tests, `napper.tests.util.Tests.simulate` routes an existing
+session's requests through a simulator instead.
+
+Latencies are given in seconds, either as a number or as a distribution:
+a function taking a `random.Random` instance and returning a number.
+`fixed`, `uniform`, `exponential` and `lognormal` build common ones.
+"""
+import asyncio
+import collections
+import json
+import math
+import random
+
+import aiohttp
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from ..transport import Transport, AppTransport, InProcessResponse
+from .server import make_app
+
+
+def fixed(seconds):
+    return lambda rng: seconds
+
+
+def uniform(low, high):
+    return lambda rng: rng.uniform(low, high)
+
+
+def exponential(mean):
+    return lambda rng: rng.expovariate(1 / mean)
+
+
+def lognormal(median, sigma):
+    """A long-tailed distribution, the usual shape of server latencies"""
+    mu = math.log(median)
+    return lambda rng: rng.lognormvariate(mu, sigma)
+
+
+_WIRE_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+_REASONS = {
+    429: 'Too Many Requests',
+    500: 'Internal Server Error',
+    502: 'Bad Gateway',
+    503: 'Service Unavailable',
+    504: 'Gateway Timeout',
+}
+
+
+class SimulatedServer(Transport):
+    """Answers requests with ``app`` after injecting latency and faults.
+
+    :param app: an aiohttp or ASGI application, or a `.transport.Transport`
+        producing the responses that get through
+    :param latency: time spent before the response's headers are sent
+    :param errors: ``{status: rate}``: the proportion of requests failed
+        with each status instead of reaching ``app``
+    :param retry_after: value of the ``Retry-After`` header of 429 and
+        503 responses, if any
+    :param resets: the proportion of requests whose connection is dropped
+        before a response is sent
+    :param bandwidth: bytes per second at which each response body is
+        sent, or None for no limit
+    :param chunk_size: bodies are sent in chunks of this size, which
+        together with ``bandwidth`` makes slow-drip responses
+    :param capacity: how many requests are worked on at once; further
+        requests wait their turn, so latency rises with load
+    :param seed: seeds the random generator, for reproducible runs
+
+    ``stats`` counts requests by outcome (``'ok'``, ``'reset'`` or the
+    injected status) and ``peak_in_flight`` is the most requests that
+    were worked on at the same time.
+    """
+    def __init__(self, app=None, *, latency=0, errors=None, retry_after=None,
+                 resets=0, bandwidth=None, chunk_size=2 ** 14,
+                 capacity=None, seed=None):
+        if app is None:
+            app = make_app()
+        self.upstream = app if isinstance(app, Transport) \
+            else AppTransport(app)
+        self.latency = latency
+        self.errors = dict(errors or {})
+        self.retry_after = retry_after
+        self.resets = resets
+        self.bandwidth = bandwidth
+        self.chunk_size = chunk_size
+        self.capacity = capacity
+        self.random = random.Random(seed)
+        self.stats = collections.Counter()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._slots = None if capacity is None \
+            else asyncio.Semaphore(capacity)
+
+    def __repr__(self):
+        return '<SimulatedServer {0!r}>'.format(self.upstream)
+
+    def sample(self, value):
+        """Returns a value drawn from ``value`` if it is a distribution"""
+        return value(self.random) if callable(value) else value
+
+    def outcome(self):
+        """Returns the injected status or ``'reset'`` for the next request,
+        or None to let it through"""
+        x = self.random.random()
+        if x < self.resets:
+            return 'reset'
+        x -= self.resets
+        for status, rate in self.errors.items():
+            if x < rate:
+                return status
+            x -= rate
+        return None
+
+    async def request(self, method, url, *args, **kwargs):
+        if self._slots is None:
+            response = await self._respond(method, url, args, kwargs)
+        else:
+            async with self._slots:
+                response = await self._respond(method, url, args, kwargs)
+        if self.bandwidth is None:
+            return response
+        return self._throttle(method, url, response)
+
+    async def _respond(self, method, url, args, kwargs):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            delay = self.sample(self.latency)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            outcome = self.outcome()
+            self.stats[outcome or 'ok'] += 1
+            if outcome == 'reset':
+                raise aiohttp.ServerDisconnectedError()
+            if outcome is not None:
+                return self._error(method, url, outcome)
+            return await self.upstream.request(method, url, *args, **kwargs)
+        finally:
+            self.in_flight -= 1
+
+    def _error(self, method, url, status):
+        headers = CIMultiDict(
+            [('Content-Type', 'application/json; charset=utf-8')])
+        if self.retry_after is not None and status in (429, 503):
+            headers['Retry-After'] = str(self.retry_after)
+        reason = _REASONS.get(status, 'Error')
+        response = InProcessResponse(method.upper(), str(url))
+        response.start(status, reason, CIMultiDictProxy(headers))
+        response.content.feed_data(json.dumps({'error': reason}).encode())
+        response.content.feed_eof()
+        return response
+
+    def _throttle(self, method, url, upstream):
+        response = InProcessResponse(method.upper(), str(url))
+        response.start(upstream.status, getattr(upstream, 'reason', None),
+                       CIMultiDictProxy(CIMultiDict(
+                           (k, v) for k, v in upstream.headers.items()
+                           if k.lower() not in _WIRE_HEADERS)))
+        response.producer = asyncio.ensure_future(
+            self._drip(response.content, upstream))
+        return response
+
+    async def _drip(self, content, upstream):
+        try:
+            while True:
+                chunk = await upstream.content.read(self.chunk_size)
+                if not chunk:
+                    break
+                await asyncio.sleep(len(chunk) / self.bandwidth)
+                content.feed_data(chunk)
+                await content.drain()
+            content.feed_eof()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            content.set_exception(exc)
+        finally:
+            await upstream.release()
+
+    async def close(self):
+        await self.upstream.close()
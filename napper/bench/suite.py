@@ -0,0 +1,626 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Benchmarks running napper against the local stand-in server.
+
+Each benchmark is a coroutine function registered with `benchmark`. It
+receives a `BenchContext` and returns a mapping of metric names, as
+declared with `metric`, to measured values.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import gc
+import io
+import json
+import math
+import os
+import tempfile
+import time
+import traceback
+import tracemalloc
+
+from .. import columns, crawl, download, instrument, limit, retry
+from ..cassette import RecordingTransport, ReplayTransport
+from ..request import SessionFactory
+from ..response import BytesResponse, DrippingResponse, JsonResponse
+from ..restspec import RestSpec
+from ..sync import SyncSession
+from ..transport import AppTransport
+from ..util import get_aiter, install_uvloop, rag, run
+from . import micro, sim
+from .server import BenchServer, make_app, make_item
+
+
+Metric = collections.namedtuple('Metric', 'name unit higher_is_better')
+
+METRICS = collections.OrderedDict()
+BENCHMARKS = []
+
+
+def metric(name, unit, higher_is_better):
+    METRICS[name] = Metric(name, unit, higher_is_better)
+
+
+metric('requests_per_sec', 'req/s', True)
+metric('latency_p50', 'ms', False)
+metric('latency_p90', 'ms', False)
+metric('latency_p99', 'ms', False)
+metric('instrumented_requests_per_sec', 'req/s', True)
+metric('inprocess_requests_per_sec', 'req/s', True)
+metric('sync_requests_per_sec', 'req/s', True)
+metric('replay_requests_per_sec', 'req/s', True)
+metric('faulty_requests_per_sec', 'req/s', True)
+metric('faulty_latency_p99', 'ms', False)
+metric('pagination_items_per_sec', 'items/s', True)
+metric('crawl_items_per_sec', 'items/s', True)
+metric('crawl_scaling', 'x', True)
+metric('json_loop_lag', 'ms', False)
+metric('json_sliced_loop_lag', 'ms', False)
+metric('json_process_loop_lag', 'ms', False)
+metric('json_sparse_eager', 'ms', False)
+metric('json_sparse_lazy', 'ms', False)
+metric('json_sparse_eager_memory', 'MB', False)
+metric('json_sparse_lazy_memory', 'MB', False)
+metric('memory_per_item', 'bytes', False)
+metric('dripping_lines_per_sec', 'lines/s', True)
+metric('upload_mb_per_sec', 'MB/s', True)
+metric('download_mb_per_sec', 'MB/s', True)
+metric('download_peak_memory', 'MB', False)
+metric('ranged_download_mb_per_sec', 'MB/s', True)
+metric('ranged_download_speedup', 'x', True)
+metric('budget_mb_per_sec', 'MB/s', True)
+metric('budget_peak_memory', 'MB', False)
+metric('upload_peak_memory', 'MB', False)
+metric('fetcher_evals_per_sec', 'evals/s', True)
+metric('fetcher_batch_evals_per_sec', 'evals/s', True)
+metric('columns_items_per_sec', 'items/s', True)
+metric('columns_memory_per_item', 'bytes', False)
+for _name, _ in micro.benchmarks():
+    metric('attr: ' + _name, 'ns', False)
+del _name
+
+
+def benchmark(func):
+    BENCHMARKS.append(func)
+    return func
+
+
+def make_spec(address):
+    """Returns the restspec describing the stand-in server"""
+    obj = {
+        "base_address": address,
+        "permalink_attribute": [
+            {"context": "attribute"}, {"matches": {"suffix": "url"}}],
+        "paginated_object": {
+            "when": {"attr_exists": "items"},
+            "content": {"attr": "items"},
+            "next": {"attr": "next"},
+        },
+    }
+    return RestSpec.from_file(io.StringIO(json.dumps(obj)))
+
+
+class BenchContext:
+    """What benchmarks need to reach the stand-in server.
+
+    :param address: the base URL of the server
+    :param quick: if true, benchmarks should do less work so that the
+        suite runs fast, at the expense of precision
+    """
+    def __init__(self, address, quick=False):
+        self.address = address
+        self.quick = quick
+        self.spec = make_spec(address)
+        self.factory = SessionFactory(self.spec)
+
+    def scale(self, n):
+        return max(n // 10, 1) if self.quick else n
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return float('nan')
+    k = max(math.ceil(pct / 100 * len(values)) - 1, 0)
+    return values[min(k, len(values) - 1)]
+
+
+class LoopLag:
+    """Measures how late the event loop runs a callback scheduled every
+    ``interval`` seconds while the ``async with`` block runs. The
+    largest delay, in seconds, is available as ``max`` afterwards."""
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.max = 0
+        self._due = None
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            self._due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.max = max(self.max, loop.time() - self._due)
+
+    async def __aenter__(self):
+        self._task = asyncio.ensure_future(self._run())
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, typ, val, tb):
+        # the last tick may be overdue without having had a chance to run
+        self.max = max(self.max, asyncio.get_event_loop().time() - self._due)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def drain_paginator(paginator):
+    """Fetches every item of ``paginator`` and returns how many there were"""
+    i = 0
+    while True:
+        try:
+            await paginator.item(i)
+        except IndexError:
+            return i
+        i += 1
+
+
+async def _requests(ctx, concurrency=32, **factory_kwargs):
+    count = ctx.scale(2000)
+    latencies = []
+    loop = asyncio.get_event_loop()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(site, i):
+        async with sem:
+            start = loop.time()
+            await site.items[str(i % 100)].get()
+            latencies.append(loop.time() - start)
+
+    async with ctx.factory(**factory_kwargs) as site:
+        await one(site, 0)
+        del latencies[:]
+        start = time.perf_counter()
+        await asyncio.gather(*(one(site, i) for i in range(count)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return count / elapsed, latencies
+
+
+@benchmark
+async def bench_requests(ctx):
+    rate, latencies = await _requests(ctx)
+    return {
+        'requests_per_sec': rate,
+        'latency_p50': percentile(latencies, 50) * 1000,
+        'latency_p90': percentile(latencies, 90) * 1000,
+        'latency_p99': percentile(latencies, 99) * 1000,
+    }
+
+
+@benchmark
+async def bench_instrumented_requests(ctx):
+    rate, _ = await _requests(
+        ctx, instrumentation=[instrument.Instrumentation()])
+    return {'instrumented_requests_per_sec': rate}
+
+
+@benchmark
+async def bench_inprocess_requests(ctx):
+    """Requests to the server's application in the same process, which
+    mostly measures napper's own overhead"""
+    rate, _ = await _requests(ctx, transport=AppTransport(make_app()))
+    return {'inprocess_requests_per_sec': rate}
+
+
+def _sync_requests(ctx, threads=32):
+    count = ctx.scale(2000)
+    with SyncSession(ctx.factory) as client:
+        site = client.site
+
+        def one(i):
+            client.wait(site.items[str(i % 100)].get())
+        one(0)
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+            list(pool.map(one, range(count)))
+        return count / (time.perf_counter() - start)
+
+
+@benchmark
+async def bench_sync_requests(ctx):
+    """Requests made from a pool of threads through one `SyncSession`"""
+    rate = await asyncio.get_event_loop().run_in_executor(
+        None, _sync_requests, ctx)
+    return {'sync_requests_per_sec': rate}
+
+
+@benchmark
+async def bench_replay_requests(ctx):
+    """Requests answered from a cassette recorded beforehand"""
+    fd, path = tempfile.mkstemp(suffix='.cassette')
+    os.close(fd)
+    os.unlink(path)
+    try:
+        recorder = RecordingTransport(path, AppTransport(make_app()))
+        async with ctx.factory(transport=recorder) as site:
+            for i in range(100):
+                await site.items[str(i)].get()
+        rate, _ = await _requests(ctx, transport=ReplayTransport(path))
+    finally:
+        os.unlink(path)
+    return {'replay_requests_per_sec': rate}
+
+
+@benchmark
+async def bench_faulty_requests(ctx):
+    """Requests to a simulated upstream with long-tailed latency that
+    turns some requests away, retried by the client"""
+    server = sim.SimulatedServer(
+        make_app(), latency=sim.lognormal(0.002, 0.75),
+        errors={429: 0.05, 503: 0.02}, capacity=16, seed=0)
+    policy = retry.RetryPolicy(backoff=0.001, max_backoff=0.01,
+                               budget=retry.RetryBudget(ratio=0.2))
+    rate, latencies = await _requests(ctx, transport=server, retry=policy)
+    return {
+        'faulty_requests_per_sec': rate,
+        'faulty_latency_p99': percentile(latencies, 99) * 1000,
+    }
+
+
+@benchmark
+async def bench_pagination(ctx):
+    pages = ctx.scale(50)
+    async with ctx.factory() as site:
+        start = time.perf_counter()
+        paginator = await site.pages.get(per_page=100, pages=pages)
+        count = await drain_paginator(paginator)
+        elapsed = time.perf_counter() - start
+    return {'pagination_items_per_sec': count / elapsed}
+
+
+def _static_app(body, content_type):
+    from aiohttp import web
+
+    async def handler(request):
+        return web.Response(body=body, content_type=content_type)
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', handler)
+    return app
+
+
+@benchmark
+async def bench_json_offload(ctx):
+    """How long parsing a large JSON response keeps the event loop from
+    running other tasks: in one go, in slices and in another process"""
+    count = ctx.scale(40000)
+    body = json.dumps({"items": [make_item(i) for i in range(count)]})
+    app = _static_app(body.encode(), 'application/json')
+    results = {}
+    for name, offload, executor in (
+            ('json_loop_lag', False, None),
+            ('json_sliced_loop_lag', True, None),
+            ('json_process_loop_lag', True,
+             concurrent.futures.ProcessPoolExecutor(1))):
+        if executor is not None:
+            executor.submit(len, '').result()  # start the worker beforehand
+        try:
+            async with ctx.factory(transport=AppTransport(app)) as site:
+                req = site.big.get()
+                req.response_type = JsonResponse(
+                    offload_size=2 ** 16 if offload else None,
+                    executor=executor)
+                async with LoopLag() as lag:
+                    await req
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        results[name] = lag.max * 1000
+    return results
+
+
+@benchmark
+async def bench_lazy_json(ctx):
+    """Reads three fields of a large object, parsing the response fully
+    or lazily"""
+    body = json.dumps(dict(
+        make_item(0, 1 << 18),
+        history=[make_item(i) for i in range(ctx.scale(5000))]))
+    app = _static_app(body.encode(), 'application/json')
+    results = {}
+
+    async def read(site, lazy):
+        req = site.big.get()
+        req.response_type = JsonResponse(lazy=lazy)
+        await rag(req, 'response')()
+        start = time.perf_counter()
+        obj = await req
+        fields = obj.id, obj.name, obj.score
+        elapsed = time.perf_counter() - start
+        assert fields == (0, 'item-0', 0.0)
+        return obj, elapsed
+
+    async with ctx.factory(transport=AppTransport(app)) as site:
+        for name, lazy in (('eager', False), ('lazy', True)):
+            _, elapsed = await read(site, lazy)
+            results['json_sparse_' + name] = elapsed * 1000
+            tracemalloc.start()
+            try:
+                obj, _ = await read(site, lazy)
+                held, _ = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            del obj
+            results['json_sparse_{0}_memory'.format(name)] = held / 1e6
+    return results
+
+
+async def _crawl_item(site, i):
+    item = await site.items[str(i % 100)].get()
+    return item.id
+
+
+async def _crawl_rate(ctx, processes):
+    count = ctx.scale(4000)
+    start = time.perf_counter()
+    async for _ in crawl.crawl(ctx.factory, _crawl_item, range(count),
+                               processes=processes, ordered=False):
+        pass
+    return count / (time.perf_counter() - start)
+
+
+@benchmark
+async def bench_crawl(ctx):
+    """Items fetched by a crawl with a worker process per CPU, and how
+    many times faster that is than with a single worker"""
+    single = await _crawl_rate(ctx, 1)
+    rate = await _crawl_rate(ctx, max(os.cpu_count() or 1, 2))
+    return {'crawl_items_per_sec': rate, 'crawl_scaling': rate / single}
+
+
+@benchmark
+async def bench_memory(ctx):
+    pages = ctx.scale(20)
+    async with ctx.factory() as site:
+        await site.items['0'].get()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            paginator = await site.pages.get(per_page=100, pages=pages)
+            count = await drain_paginator(paginator)
+            gc.collect()
+            after, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del paginator
+    return {'memory_per_item': (after - before) / count}
+
+
+_COLUMNS = {
+    'id': {'attr': 'id'},
+    'name': {'attr': 'name'},
+    'login': [{'attr': 'owner'}, {'attr': 'login'}],
+    'score': {'attr': 'score'},
+    'public': {'attr': 'public'},
+}
+
+
+@benchmark
+async def bench_columns(ctx):
+    """Collects five fields of a paginated collection into columns, and
+    the memory the columns hold per item"""
+    pages = ctx.scale(50)
+    async with ctx.factory() as site:
+        await site.items['0'].get()
+        start = time.perf_counter()
+        cols = await columns.collect(
+            site.pages.get(per_page=100, pages=pages), _COLUMNS)
+        elapsed = time.perf_counter() - start
+        count = len(cols['id'])
+        del cols
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            cols = await columns.collect(
+                site.pages.get(per_page=100, pages=pages), _COLUMNS)
+            gc.collect()
+            after, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del cols
+    return {'columns_items_per_sec': count / elapsed,
+            'columns_memory_per_item': (after - before) / count}
+
+
+@benchmark
+async def bench_dripping(ctx):
+    lines = ctx.scale(20000)
+    async with ctx.factory() as site:
+        req = site.drip.get(lines=lines)
+        req.response_type = DrippingResponse(JsonResponse())
+        count = 0
+        start = time.perf_counter()
+        async with await req as dripper:
+            itor = await get_aiter(dripper)
+            anext = type(itor).__anext__
+            while True:
+                try:
+                    await anext(itor)
+                except StopAsyncIteration:
+                    break
+                count += 1
+        elapsed = time.perf_counter() - start
+    return {'dripping_lines_per_sec': count / elapsed}
+
+
+@benchmark
+async def bench_upload(ctx):
+    """Uploads a file, which is streamed rather than read into memory"""
+    size = ctx.scale(10) * (8 << 20)
+    with tempfile.TemporaryFile() as f:
+        chunk = os.urandom(1 << 20)
+        for _ in range(size >> 20):
+            f.write(chunk)
+        f.flush()
+        del chunk
+        async with ctx.factory() as site:
+            await site.upload.post(b'')
+            f.seek(0)
+            tracemalloc.start()
+            try:
+                start = time.perf_counter()
+                result = await site.upload.post(f)
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+    assert result.size == size
+    return {'upload_mb_per_sec': size / elapsed / 1e6,
+            'upload_peak_memory': peak / 1e6}
+
+
+@benchmark
+async def bench_download(ctx):
+    """Downloads a large body to a file, with a checksum"""
+    size = ctx.scale(10) * (8 << 20)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'blob')
+        async with ctx.factory() as site:
+            await site.items['0'].get()
+            req = site.blob.get(size=size)
+            req.response_type = download.FileResponse(path, checksum='md5')
+            tracemalloc.start()
+            try:
+                start = time.perf_counter()
+                result = await req
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+    assert result.size == size
+    return {'download_mb_per_sec': size / elapsed / 1e6,
+            'download_peak_memory': peak / 1e6}
+
+
+@benchmark
+async def bench_ranged_download(ctx):
+    """Downloads a body from a simulated upstream capping each
+    connection's bandwidth, over one connection then in parts over 8"""
+    size = ctx.scale(10) * (2 << 20)
+    server = sim.SimulatedServer(make_app(), latency=0.01,
+                                 bandwidth=16 << 20, chunk_size=2 ** 16)
+    timings = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'blob')
+        async with ctx.factory(transport=server) as site:
+            req = site.blob.get(size=size)
+            req.response_type = download.FileResponse(path)
+            start = time.perf_counter()
+            await req
+            timings.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            result = await download.download_ranges(
+                site.blob.get(size=size), path,
+                part_size=size // 32, connections=8)
+            timings.append(time.perf_counter() - start)
+    assert result.size == size
+    single, ranged = timings
+    return {'ranged_download_mb_per_sec': size / ranged / 1e6,
+            'ranged_download_speedup': single / ranged}
+
+
+@benchmark
+async def bench_memory_budget(ctx):
+    """Reads 1MB bodies 64 at a time under a 4MB memory budget"""
+    count = ctx.scale(200)
+    size = 1 << 20
+    budget = limit.MemoryBudget(4 << 20)
+    sem = asyncio.Semaphore(64)
+
+    async def one(site):
+        async with sem:
+            req = site.blob.get(size=size)
+            req.response_type = BytesResponse()
+            assert len(await req) == size
+
+    async with ctx.factory(memory_budget=budget) as site:
+        await site.items['0'].get()
+        start = time.perf_counter()
+        await asyncio.gather(*(one(site) for _ in range(count)))
+        elapsed = time.perf_counter() - start
+    return {'budget_mb_per_sec': count * size / elapsed / 1e6,
+            'budget_peak_memory': budget.peak / 1e6}
+
+
+@benchmark
+async def bench_fetcher(ctx):
+    """Evaluates the restspec on a page and its items' string attributes,
+    one value at a time and with `.restspec.Fetcher.many`"""
+    spec = ctx.spec
+    page = {"items": [make_item(i) for i in range(100)]}
+    attrs = [(key, value) for item in page["items"]
+             for key, value in item.items() if isinstance(value, str)]
+    rounds = ctx.scale(200)
+    evals = rounds * (2 + len(attrs))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        spec.is_paginator_object(page)
+        spec.paginator_content(page)
+        for key, value in attrs:
+            spec.is_permalink_attr(value, {'attribute': key})
+    elapsed = time.perf_counter() - start
+    strings = [value for _, value in attrs]
+    contexts = [{'attribute': key} for key, _ in attrs]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        spec.is_paginator_object.many([page])
+        spec.paginator_content.many([page])
+        spec.is_permalink_attr.many(strings, contexts)
+    batch_elapsed = time.perf_counter() - start
+    return {'fetcher_evals_per_sec': evals / elapsed,
+            'fetcher_batch_evals_per_sec': evals / batch_elapsed}
+
+
+@benchmark
+async def bench_micro(ctx):
+    return {'attr: ' + name: secs * 1e9
+            for name, secs in micro.run(repeat=2 if ctx.quick else 5).items()}
+
+
+def run_suite(quick=False, only=None, address=None, uvloop=False,
+              errors=None):
+    """Runs the benchmarks and returns ``{metric name: value}``.
+
+    :param quick: do less work per benchmark
+    :param only: if given, a collection of benchmark function names to run
+    :param address: use a server at this address instead of starting one
+    :param uvloop: run the benchmarks on uvloop; the stand-in server
+        keeps using an asyncio loop so that only the client changes
+    :param errors: if given, a dict in which benchmarks that raise an
+        exception are recorded, by name, as their formatted traceback.
+        The remaining benchmarks still run. Otherwise, the exception
+        propagates.
+    """
+    if uvloop and not install_uvloop():
+        raise RuntimeError("uvloop is not installed")
+    if address is None:
+        with BenchServer() as server:
+            return run_suite(quick, only, server.address, errors=errors)
+    ctx = BenchContext(address, quick)
+    results = collections.OrderedDict()
+    for bench in BENCHMARKS:
+        if only and bench.__name__ not in only:
+            continue
+        try:
+            results.update(run(bench(ctx), debug=False))
+        except Exception:
+            if errors is None:
+                raise
+            errors[bench.__name__] = traceback.format_exc()
+    return results
@@ -0,0 +1,146 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Request bodies sent as they are read.
+
+Pass a binary file object, a memory-mapped file or an async iterator of
+bytes as a request's body and it is streamed rather than loaded whole::
+
+    with open('export.csv', 'rb') as f:
+        await site.imports.post(f)
+
+The body is sent with a ``Content-Length`` header when its size is known,
+as for regular files and buffers, and with chunked transfer encoding
+otherwise. Wrap the source in `StreamBody` to set the size or the chunk
+size yourself.
+"""
+import asyncio
+import io
+import mmap
+import os
+
+
+class StreamBody:
+    """A request body read chunk by chunk while it is sent.
+
+    :param source: a binary file object, a buffer such as an
+        `mmap.mmap`, an async iterable or an iterable of bytes
+    :param size: the body's length in bytes. Found out for buffers and
+        regular files if not given.
+    :param chunk_size: how much is read from files and buffers at once
+
+    Buffers and seekable files can be sent several times, for instance
+    when a request is retried. Files are read from their position when
+    the body was created. Iterators can only be sent once.
+    """
+    def __init__(self, source, *, size=None, chunk_size=2 ** 16):
+        self.source = source
+        self.chunk_size = chunk_size
+        self._buffer = None
+        self._start = None
+        self._consumed = False
+        if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            self._buffer = memoryview(source).cast('B')
+            if size is None:
+                size = len(self._buffer)
+        elif hasattr(source, 'read'):
+            if not _is_binary_file(source):
+                raise TypeError("Cannot stream a request body from text"
+                                " file {0!r}".format(source))
+            self._start = _tell(source)
+            if size is None and self._start is not None:
+                size = _file_size(source, self._start)
+        elif not (hasattr(source, '__aiter__')
+                  or hasattr(source, '__iter__')):
+            raise TypeError("Cannot stream a request body from {0!r}"
+                            .format(source))
+        self.size = size
+
+    def __repr__(self):
+        return '<StreamBody {0!r} [{1} bytes]>'.format(
+            self.source, '?' if self.size is None else self.size)
+
+    @property
+    def replayable(self):
+        """Whether the body can be sent again"""
+        return self._buffer is not None or self._start is not None
+
+    async def chunks(self):
+        """Yields the body's chunks. Each call starts over, or raises
+        `RuntimeError` if the body cannot be sent again."""
+        if self._consumed and not self.replayable:
+            raise RuntimeError(
+                "{0!r} was already sent and cannot be sent again"
+                .format(self))
+        self._consumed = True
+        source = self.source
+        if self._buffer is not None:
+            buf = self._buffer
+            for i in range(0, len(buf), self.chunk_size):
+                yield buf[i:i + self.chunk_size]
+        elif hasattr(source, 'read'):
+            if self._start is not None:
+                source.seek(self._start)
+            loop = asyncio.get_event_loop()
+            while True:
+                chunk = await loop.run_in_executor(
+                    None, source.read, self.chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+        elif hasattr(source, '__aiter__'):
+            async for chunk in source:
+                yield chunk
+        else:
+            for chunk in source:
+                yield chunk
+
+    async def read(self):
+        """Returns the whole body"""
+        return b''.join([bytes(chunk) async for chunk in self.chunks()])
+
+
+def _is_binary_file(f):
+    if isinstance(f, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    if isinstance(f, io.TextIOBase):
+        return False
+    try:
+        return isinstance(f.read(0), (bytes, bytearray))
+    except Exception:
+        return False
+
+
+def _tell(f):
+    try:
+        if f.seekable():
+            return f.tell()
+    except (AttributeError, OSError, ValueError):
+        pass
+    return None
+
+
+def _file_size(f, start):
+    try:
+        return os.fstat(f.fileno()).st_size - start
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pass
+    try:
+        end = f.seek(0, io.SEEK_END)
+    except OSError:
+        return None
+    finally:
+        f.seek(start)
+    return end - start
+
+
+def stream_body(data):
+    """Returns ``data`` as a `StreamBody` if it is a binary file, memory
+    map or iterator to stream rather than a value to send as is. Text
+    files are left to the HTTP client, which encodes them."""
+    if isinstance(data, StreamBody):
+        return data
+    if isinstance(data, mmap.mmap) or hasattr(data, '__aiter__') \
+            or hasattr(data, 'read') and _is_binary_file(data):
+        return StreamBody(data)
+    return data
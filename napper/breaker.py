@@ -0,0 +1,158 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Failing fast while an upstream is down.
+
+Pass a `CircuitBreaker` to the session factory::
+
+    async with factory(circuit_breaker=CircuitBreaker()) as site:
+        ...
+
+Each origin has a circuit. It opens after ``threshold`` consecutive
+failures, that is exceptions or server error responses, and requests to
+that origin then raise `.errors.CircuitOpenError` right away instead of
+being sent. After ``reset_timeout`` seconds the circuit is half-open: a
+few probe requests are let through, and it closes if they succeed or
+opens again otherwise. State changes are reported to the session's
+instrumentation through `.instrument.Instrumentation.circuit_changed`.
+
+A breaker may be shared by several sessions.
+"""
+import time
+import urllib.parse
+
+from .errors import CircuitOpenError
+
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+def origin_of(url):
+    """Returns the ``scheme://host[:port]`` part of ``url``"""
+    parts = urllib.parse.urlsplit(url)
+    return '{0}://{1}'.format(parts.scheme, parts.netloc.lower())
+
+
+class Circuit:
+    """The state of one origin's circuit.
+
+    The methods returning a state change return it as an ``(old state,
+    new state)`` tuple, or None if the state did not change.
+
+    `acquire` returns a token to pass back with the request's outcome.
+    Outcomes of requests sent before the last state change are ignored,
+    so that a request sent while the circuit was closed cannot count as
+    a probe once it is half-open.
+    """
+    __slots__ = ('breaker', 'origin', 'state', 'failures', 'opened',
+                 'probes', 'successes', 'generation')
+
+    def __init__(self, breaker, origin):
+        self.breaker = breaker
+        self.origin = origin
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = None
+        self.probes = 0
+        self.successes = 0
+        self.generation = 0
+
+    def __repr__(self):
+        return '<Circuit {0} {1}>'.format(self.origin, self.state)
+
+    def _set_state(self, state):
+        old = self.state
+        if old == state:
+            return None
+        self.state = state
+        self.generation += 1
+        self.failures = 0
+        self.probes = 0
+        self.successes = 0
+        if state == OPEN:
+            self.opened = self.breaker.clock()
+        return old, state
+
+    def acquire(self):
+        """Called before sending a request. Raises
+        `.errors.CircuitOpenError` if it should not be sent, otherwise
+        returns the request's token and the state change."""
+        change = None
+        if self.state == OPEN:
+            retry_in = self.opened + self.breaker.reset_timeout \
+                - self.breaker.clock()
+            if retry_in > 0:
+                raise CircuitOpenError(self.origin, retry_in)
+            change = self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self.probes >= self.breaker.half_open_requests:
+                raise CircuitOpenError(self.origin, 0.0)
+            self.probes += 1
+        return self.generation, change
+
+    def success(self, token):
+        if token != self.generation:
+            return None
+        if self.state == HALF_OPEN:
+            self.probes -= 1
+            self.successes += 1
+            if self.successes >= self.breaker.half_open_requests:
+                return self._set_state(CLOSED)
+        self.failures = 0
+        return None
+
+    def failure(self, token):
+        if token != self.generation:
+            return None
+        if self.state == HALF_OPEN:
+            return self._set_state(OPEN)
+        self.failures += 1
+        if self.state == CLOSED and self.failures >= self.breaker.threshold:
+            return self._set_state(OPEN)
+        return None
+
+    def cancelled(self, token):
+        """Called when a request was interrupted before its outcome was
+        known"""
+        if token == self.generation and self.state == HALF_OPEN:
+            self.probes -= 1
+
+
+class CircuitBreaker:
+    """Keeps a `Circuit` per origin.
+
+    :param threshold: number of consecutive failures opening a circuit
+    :param reset_timeout: seconds an open circuit waits before letting
+        probe requests through
+    :param half_open_requests: number of probes sent concurrently by a
+        half-open circuit, and of successes needed to close it
+    """
+    def __init__(self, threshold=5, reset_timeout=30, *,
+                 half_open_requests=1, clock=time.monotonic):
+        if threshold < 1 or half_open_requests < 1:
+            raise ValueError("threshold and half_open_requests must be"
+                             " positive")
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_requests = half_open_requests
+        self.clock = clock
+        self.circuits = {}
+
+    def __repr__(self):
+        return '<CircuitBreaker [{0}]>'.format(', '.join(
+            '{0}: {1}'.format(origin, circuit.state)
+            for origin, circuit in self.circuits.items()))
+
+    def circuit(self, url):
+        """Returns the `Circuit` for the origin of ``url``"""
+        origin = origin_of(url)
+        try:
+            return self.circuits[origin]
+        except KeyError:
+            ret = self.circuits[origin] = Circuit(self, origin)
+            return ret
+
+    def state(self, url):
+        return self.circuit(url).state
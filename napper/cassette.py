@@ -0,0 +1,217 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Recording traffic to a cassette file and replaying it.
+
+Record by wrapping the transport that reaches the real API::
+
+    recorder = RecordingTransport('api.cassette', AiohttpTransport(session))
+    async with factory(transport=recorder) as site:
+        ...
+
+Then replay at full speed, without network access::
+
+    async with factory(transport=ReplayTransport('api.cassette')) as site:
+        ...
+
+A cassette is a file of records appended one after the other. Each
+record holds a request's key, a small JSON header with the response's
+status and headers, and the response body as is. The key is a hash of
+the request's method, full URL and body. When replaying, the file is
+memory-mapped and only the fixed-size record prefixes are read to build
+the index, so opening a cassette stays fast however large it is.
+Responses are recreated on demand and their bodies streamed from the
+mapping.
+
+Requests that were recorded several times are answered with each
+recorded response in turn, starting over after the last one.
+"""
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from .body import StreamBody
+from .errors import UnrecordedRequestError
+from .transport import Transport, InProcessResponse, encode_request
+
+
+MAGIC = b'NAPPER-CASSETTE-1\n'
+
+_RECORD = struct.Struct('>4s16sIQ')
+_RECORD_MAGIC = b'NREC'
+
+#: Headers describing the body as sent over the wire, which no longer
+#: apply to the decoded body stored in cassettes
+_WIRE_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+CHUNK_SIZE = 2 ** 16
+
+
+def request_key(method, url, body=b''):
+    """Returns the key a request is recorded under"""
+    h = hashlib.sha1()
+    h.update(method.upper().encode('ascii'))
+    h.update(b' ')
+    h.update(str(url).encode('utf-8'))
+    h.update(b'\n')
+    h.update(body)
+    return h.digest()[:16]
+
+
+async def _read_stream(kwargs):
+    """Reads a streamed body in full, as it is needed for the key"""
+    data = kwargs.get('data')
+    if isinstance(data, StreamBody):
+        kwargs = dict(kwargs, data=await data.read())
+    return kwargs
+
+
+def _encode(method, url, kwargs):
+    url, _, body = encode_request(
+        url, kwargs.get('params'), kwargs.get('data'), kwargs.get('json'),
+        kwargs.get('headers'))
+    return str(url), request_key(method, url, body)
+
+
+class RecordingTransport(Transport):
+    """Sends requests through ``transport`` and appends each exchange to
+    the cassette at ``path``.
+
+    Response bodies are read in full before being returned, so that the
+    record can be written in one go.
+    """
+    def __init__(self, path, transport):
+        self.path = path
+        self.transport = transport
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+            self.file.flush()
+
+    def __repr__(self):
+        return '<RecordingTransport {0!r}>'.format(self.path)
+
+    async def request(self, method, url, *args, **kwargs):
+        kwargs = await _read_stream(kwargs)
+        full_url, key = _encode(method, url, kwargs)
+        response = await self.transport.request(method, url, *args, **kwargs)
+        try:
+            body = await response.read()
+        finally:
+            await response.release()
+        headers = [(k, v) for k, v in response.headers.items()
+                   if k.lower() not in _WIRE_HEADERS]
+        self.write(key, {
+            'method': method.upper(), 'url': full_url,
+            'status': response.status,
+            'reason': getattr(response, 'reason', None),
+            'headers': headers,
+        }, body)
+        ret = InProcessResponse(method.upper(), full_url)
+        ret.start(response.status, getattr(response, 'reason', None),
+                  CIMultiDictProxy(CIMultiDict(headers)))
+        ret.content.feed_data(body)
+        ret.content.feed_eof()
+        return ret
+
+    def write(self, key, meta, body):
+        meta = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+        self.file.write(b''.join([
+            _RECORD.pack(_RECORD_MAGIC, key, len(meta), len(body)),
+            meta, body]))
+        self.file.flush()
+
+    async def close(self):
+        self.file.close()
+        await self.transport.close()
+
+
+class ReplayTransport(Transport):
+    """Answers requests with the responses recorded in the cassette at
+    ``path``, raising `.errors.UnrecordedRequestError` for the others."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size <= len(MAGIC):
+                self.map = b''
+            else:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = {}
+        self.replays = {}
+        self._read_index()
+
+    def __repr__(self):
+        return '<ReplayTransport {0!r} [{1} requests]>'.format(
+            self.path, len(self.index))
+
+    def _read_index(self):
+        data = self.map
+        if not data:
+            return
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("{0} is not a napper cassette".format(self.path))
+        pos = len(MAGIC)
+        end = len(data)
+        index = self.index
+        while pos + _RECORD.size <= end:
+            magic, key, meta_len, body_len = _RECORD.unpack_from(data, pos)
+            if magic != _RECORD_MAGIC:
+                raise ValueError("Corrupt record at offset {0} of {1}"
+                                 .format(pos, self.path))
+            record_end = pos + _RECORD.size + meta_len + body_len
+            if record_end > end:
+                break  # truncated by an interrupted recording
+            index.setdefault(key, []).append(pos)
+            pos = record_end
+
+    def lookup(self, key):
+        """Returns ``(meta dict, body memoryview)`` of the next response
+        recorded for ``key``"""
+        offsets = self.index[key]
+        n = self.replays.get(key, 0)
+        self.replays[key] = n + 1
+        pos = offsets[n % len(offsets)]
+        _, _, meta_len, body_len = _RECORD.unpack_from(self.map, pos)
+        start = pos + _RECORD.size
+        meta = json.loads(bytes(self.map[start:start + meta_len]))
+        start += meta_len
+        return meta, memoryview(self.map)[start:start + body_len]
+
+    async def request(self, method, url, *args, **kwargs):
+        full_url, key = _encode(method, url, await _read_stream(kwargs))
+        try:
+            meta, body = self.lookup(key)
+        except KeyError:
+            raise UnrecordedRequestError(method.upper(), full_url) from None
+        response = InProcessResponse(method.upper(), full_url)
+        response.start(meta['status'], meta['reason'],
+                       CIMultiDictProxy(CIMultiDict(meta['headers'])))
+        if len(body) <= CHUNK_SIZE:
+            response.content.feed_data(body)
+            response.content.feed_eof()
+            body.release()
+        else:
+            response.producer = asyncio.ensure_future(
+                self._stream(response.content, body))
+        return response
+
+    async def _stream(self, content, body):
+        try:
+            for i in range(0, len(body), CHUNK_SIZE):
+                content.feed_data(body[i:i + CHUNK_SIZE])
+                await content.drain()
+        finally:
+            body.release()
+            content.feed_eof()
+
+    async def close(self):
+        if self.map:
+            try:
+                self.map.close()
+            except BufferError:
+                pass  # bodies still being streamed hold views on it
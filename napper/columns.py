@@ -0,0 +1,225 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Collecting fields of many response items into columns.
+
+`collect` evaluates one restspec fetcher per field on every item of a
+list or paginated collection and stores the results in compact typed
+arrays, a page at a time, rather than as one dict per item::
+
+    users = await site.users.get()
+    cols = await users.to_columns({
+        'id': {'attr': 'id'},
+        'login': {'attr': 'login'},
+        'company': [{'attr': 'profile'}, {'attr': 'company'}],
+    })
+    cols['id'].values     # array('q', [...]) or a numpy array
+
+Numbers and booleans go in `array.array` objects, or NumPy arrays if
+NumPy is installed. Strings are dictionary-encoded: each distinct string
+is stored once in ``categories`` and ``values`` holds their indexes.
+Other values, or columns mixing types, are kept in lists.
+"""
+import array
+import inspect
+import json
+
+from . import response
+from .restspec import Fetcher, NoValue, WarnOnUnusedKeys
+
+
+try:
+    import numpy as _numpy
+except ImportError:
+    _numpy = None
+
+
+_TYPECODES = {'bool': 'b', 'int': 'q', 'float': 'd', 'str': 'i'}
+_DTYPES = {'bool': 'bool', 'int': 'int64', 'float': 'float64',
+           'str': 'int32'}
+_INT_RANGE = range(-2 ** 63, 2 ** 63)
+
+
+def _kind_of(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int' if value in _INT_RANGE else 'object'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, str):
+        return 'str'
+    return 'object'
+
+
+def _common_kind(a, b):
+    if a is None or a == b:
+        return b
+    if {a, b} == {'int', 'float'}:
+        return 'float'
+    return 'object'
+
+
+class Column:
+    """A column of values collected by `collect`.
+
+    :ivar kind: ``'bool'``, ``'int'``, ``'float'``, ``'str'`` or
+        ``'object'``, or None if every value was missing
+    :ivar values: an `array.array` or NumPy array, or a list for the
+        ``'object'`` kind. For strings, indexes into ``categories``.
+    :ivar categories: the distinct strings of a ``'str'`` column, in the
+        order they were first seen, or None
+    :ivar valid: None if no value is missing, otherwise a `bytearray`
+        holding 0 where the value is missing. Missing values are stored
+        as 0, or -1 for strings.
+    """
+    def __init__(self):
+        self.kind = None
+        self.values = []
+        self.categories = None
+        self.valid = None
+        self._codes = None
+
+    def __repr__(self):
+        return '<Column {0} [{1} values]>'.format(self.kind, len(self))
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        if self.valid is not None and not self.valid[i]:
+            return None
+        value = self.values[i]
+        if self.kind == 'str':
+            return self.categories[value]
+        if self.kind == 'bool':
+            return bool(value)
+        return value.item() if hasattr(value, 'item') else value
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def to_list(self):
+        """Returns the values as a list, with None for missing ones"""
+        return list(self)
+
+    def _append_missing(self):
+        if self.valid is None:
+            self.valid = bytearray(b'\1') * len(self.values)
+        self.valid.append(0)
+        if self.kind == 'str':
+            self.values.append(-1)
+        elif self.kind in _TYPECODES:
+            self.values.append(0)
+        else:
+            self.values.append(None)
+
+    def append(self, value):
+        if value is None:
+            self._append_missing()
+            return
+        kind = _kind_of(value)
+        if kind != self.kind:
+            self._convert(_common_kind(self.kind, kind))
+        if self.valid is not None:
+            self.valid.append(1)
+        if self.kind == 'str':
+            code = self._codes.get(value)
+            if code is None:
+                code = self._codes[value] = len(self.categories)
+                self.categories.append(value)
+            self.values.append(code)
+        elif self.kind == 'float':
+            self.values.append(float(value))
+        else:
+            self.values.append(value)
+
+    def _convert(self, kind):
+        """Switches to storing values of ``kind``, converting the values
+        stored so far"""
+        if kind == self.kind:
+            return
+        old = list(self)
+        self.kind = kind
+        self.valid = None
+        self.categories = self._codes = None
+        if kind == 'str':
+            self.categories = []
+            self._codes = {}
+        if kind in _TYPECODES:
+            self.values = array.array(_TYPECODES[kind])
+        else:
+            self.values = []
+        for value in old:
+            self.append(value)
+
+    def _finish(self, use_numpy):
+        self._codes = None
+        if use_numpy and self.kind in _DTYPES:
+            self.values = _numpy.frombuffer(
+                self.values, dtype=_DTYPES[self.kind])
+        return self
+
+
+def fetcher(path):
+    """Returns a `.restspec.Fetcher` for ``path``, given as a fetcher or
+    as in a restspec file"""
+    if isinstance(path, Fetcher):
+        return path
+    return Fetcher.from_restspec(
+        json.loads(json.dumps(path), object_hook=WarnOnUnusedKeys))
+
+
+async def _pages(source):
+    """Yields the raw items of ``source`` a page at a time"""
+    if inspect.isawaitable(source):
+        source = await source
+    if isinstance(source, response.PaginatorObject):
+        yield source.cache
+        if source.done:
+            return
+        page = source.pages[-1]
+        while True:
+            page = await source._page_after(page)
+            if page is None:
+                return
+            yield list(source.spec.paginator_content(page))
+    elif isinstance(source, response.ResponseList):
+        yield source.val
+    else:
+        yield source
+
+
+async def collect(source, fields, *, numpy=None):
+    """Collects fields of every item of ``source`` into `Column` objects.
+
+    :param source: a `.response.ResponseList`, a
+        `.response.PaginatorObject`, whose pages are fetched without
+        being kept, a request for either, or a sequence of items
+    :param fields: a mapping of column names to the path of the value
+        in each item, as a `.restspec.Fetcher` or in restspec syntax,
+        e.g. ``[{"attr": "owner"}, {"attr": "login"}]``. Items lacking
+        the value have it missing in the column.
+    :param numpy: whether to return NumPy arrays. By default, they are
+        returned if NumPy is installed.
+
+    Returns a dict mapping each name in ``fields`` to its `Column`.
+    """
+    if numpy is None:
+        numpy = _numpy is not None
+    elif numpy and _numpy is None:
+        raise RuntimeError("NumPy is not installed")
+    getters = [(name, fetcher(path)) for name, path in fields.items()]
+    columns = {name: Column() for name, _ in getters}
+    appenders = [(getter, columns[name].append) for name, getter in getters]
+    async for items in _pages(source):
+        for item in items:
+            context = {'root': item, 'value': item}
+            for getter, append in appenders:
+                try:
+                    value = getter(item, context)
+                except NoValue:
+                    value = None
+                append(value)
+    return {name: column._finish(numpy) for name, column in columns.items()}
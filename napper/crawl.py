@@ -0,0 +1,135 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Spreading a crawl across processes.
+
+A single event loop runs out of CPU time decoding and upgrading
+responses well before the network is saturated. `crawl` splits a list
+of work units, such as IDs or page numbers, into batches that are run by
+a pool of worker processes, each with its own loop and session::
+
+    async def fetch_item(site, i):
+        item = await site.items[str(i)].get()
+        return item.name
+
+    async for name in crawl(factory, fetch_item, range(100000)):
+        ...
+
+``job`` is called as ``await job(site, unit)`` in a worker. It and the
+session factory are sent to the workers by pickling, so they must be
+defined at module level (`functools.partial` objects are fine), and so
+must the values ``job`` returns: return plain data extracted from the
+responses rather than the response objects themselves.
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import multiprocessing.util
+import os
+
+
+class _Worker:
+    """The loop and session of a worker process, kept between batches"""
+    def __init__(self, factory):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.manager = None
+        self.site = self.loop.run_until_complete(self._open(factory))
+        multiprocessing.util.Finalize(self, self.close, exitpriority=10)
+
+    async def _open(self, factory):
+        self.manager = factory()
+        return await type(self.manager).__aenter__(self.manager)
+
+    def run(self, job, units, concurrency):
+        return self.loop.run_until_complete(
+            self._run(job, units, concurrency))
+
+    async def _run(self, job, units, concurrency):
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(unit):
+            async with sem:
+                return await job(self.site, unit)
+        return await asyncio.gather(*(one(unit) for unit in units))
+
+    def close(self):
+        self.loop.run_until_complete(
+            type(self.manager).__aexit__(self.manager, None, None, None))
+        self.loop.close()
+
+
+_worker = None
+
+
+def _init_worker(factory):
+    global _worker
+    _worker = _Worker(factory)
+
+
+def _run_batch(job, units, concurrency):
+    return _worker.run(job, units, concurrency)
+
+
+def batches(units, size):
+    """Splits ``units`` into lists of ``size`` consecutive units. Ranges
+    are split into smaller ranges, which are cheaper to send."""
+    if isinstance(units, range):
+        for i in range(0, len(units), size):
+            yield units[i:i + size]
+        return
+    itor = iter(units)
+    while True:
+        batch = list(itertools.islice(itor, size))
+        if not batch:
+            return
+        yield batch
+
+
+async def crawl(factory, job, units, *, processes=None, batch_size=64,
+                concurrency=16, ordered=True):
+    """Runs ``job`` on each of ``units`` across worker processes and
+    yields the results.
+
+    :param factory: called without arguments in each worker to create
+        the session's context manager, e.g. a `.SessionFactory`
+    :param job: a coroutine function called as ``job(site, unit)``
+    :param processes: the number of worker processes, by default the
+        number of CPUs
+    :param batch_size: units sent to a worker at once
+    :param concurrency: requests each worker has in flight at once
+    :param ordered: if true, results come in the order of ``units``.
+        Otherwise they come as soon as their batch is done.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    loop = asyncio.get_event_loop()
+    pending = batches(units, batch_size)
+    executor = concurrent.futures.ProcessPoolExecutor(
+        processes, initializer=_init_worker, initargs=(factory,))
+    running = []
+    try:
+        while True:
+            for batch in itertools.islice(
+                    pending, 2 * processes - len(running)):
+                running.append(loop.run_in_executor(
+                    executor, _run_batch, job, batch, concurrency))
+            if not running:
+                return
+            if ordered:
+                done = running.pop(0)
+                results = await done
+            else:
+                finished, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED)
+                done = finished.pop()
+                running.remove(done)
+                results = done.result()
+            for result in results:
+                yield result
+    finally:
+        # Waiting for the workers would block the loop until the batches
+        # they already started are done; they exit on their own instead.
+        for fut in running:
+            fut.cancel()
+        executor.shutdown(wait=False)
@@ -0,0 +1,475 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Downloading response bodies straight to disk.
+
+Set a request's response type to `FileResponse` to have its body written
+to a file chunk by chunk as it arrives::
+
+    req = site.artifacts['build.tar.gz'].get()
+    req.response_type = FileResponse('build.tar.gz', checksum='sha256')
+    download = await req
+    print(download.size, download.checksum)
+
+Large resources served with ``Accept-Ranges: bytes`` can be fetched in
+parts over several connections at once with `download_ranges`::
+
+    download = await download_ranges(
+        site.artifacts['image.iso'].get(), 'image.iso', connections=8)
+
+If it fails, calling it again with the same path only fetches the parts
+that are missing.
+"""
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import re
+
+import aiohttp
+
+from .errors import ChecksumError, ResourceChangedError, http
+from .request import Request
+from .response import ResponseType
+from .util import rag
+
+
+Download = collections.namedtuple('Download', 'path size checksum')
+Download.__doc__ = """The result of a `FileResponse`.
+
+``path`` is None if the body was written to a file descriptor or object
+given by the caller. ``checksum`` is the hex digest of the body, or None
+if no checksum was asked for."""
+
+
+def preallocate(fd, size):
+    """Reserves ``size`` bytes for the file open as ``fd``, so that it is
+    less fragmented and running out of space shows up early"""
+    if size <= 0:
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, size)
+
+
+def content_length(response):
+    """Returns the length of ``response``'s body as it will be read, or
+    None if unknown"""
+    headers = response.headers
+    if headers.get('Content-Encoding', 'identity') != 'identity':
+        return None  # the length is that of the encoded body
+    try:
+        return int(headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+class FileResponse(ResponseType):
+    """Writes response bodies to a file as they arrive.
+
+    :param target: a path, a file descriptor or a binary file object to
+        write to. Paths are created or truncated; descriptors and file
+        objects are written from their current position and left open.
+    :param preallocate: if true and the response has a
+        ``Content-Length``, reserve that much space before writing to a
+        path, or to a file descriptor at its start
+    :param checksum: the name of a `hashlib` algorithm to hash the body
+        with as it is written
+    :param expected: the expected hex digest. On a mismatch,
+        `.errors.ChecksumError` is raised and, if ``target`` is a path,
+        the file is deleted.
+    :param chunk_size: the most that is read from the response at once
+
+    Awaiting the request returns a `Download`. The bodies of error
+    responses are not written, but kept in memory for the exception.
+    """
+    def __init__(self, target, *, preallocate=True, checksum=None,
+                 expected=None, chunk_size=2 ** 16, **kwargs):
+        super().__init__(**kwargs)
+        if expected is not None and checksum is None:
+            raise ValueError("An expected checksum needs the name of the"
+                             " algorithm, pass checksum=")
+        self.target = target
+        self.preallocate = preallocate
+        self.checksum = checksum
+        self.expected = expected
+        self.chunk_size = chunk_size
+
+    def __repr__(self):
+        return '<FileResponse {0!r}>'.format(self.target)
+
+    def _open(self):
+        """Returns ``(write, fd, path)``. ``fd`` is None for file objects
+        and ``path`` is None for targets not opened here."""
+        target = self.target
+        if isinstance(target, int):
+            return _fd_writer(target), target, None
+        if hasattr(target, 'write'):
+            return target.write, None, None
+        path = os.fspath(target)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        return _fd_writer(fd), fd, path
+
+    async def parse_response(self, response):
+        response = await super().parse_response(response)
+        if not issubclass(http.cls_for_code(response.status), http.Success):
+            return await response.read()  # error bodies stay in memory
+        write, fd, path = self._open()
+        try:
+            size, digest = await self._write(response, write, fd)
+        except BaseException:
+            if path is not None:
+                os.close(fd)
+                os.unlink(path)
+            raise
+        finally:
+            await response.release()
+        if path is not None:
+            os.close(fd)
+        return Download(path, size, digest)
+
+    async def _write(self, response, write, fd):
+        h = None if self.checksum is None else hashlib.new(self.checksum)
+        length = content_length(response)
+        preallocated = (
+            self.preallocate and length is not None and fd is not None
+            and os.lseek(fd, 0, os.SEEK_CUR) == 0)
+        if preallocated:
+            preallocate(fd, length)
+        reader = response.content
+        size = 0
+        while True:
+            chunk = await reader.read(self.chunk_size)
+            if not chunk:
+                break
+            write(chunk)
+            if h is not None:
+                h.update(chunk)
+            size += len(chunk)
+        if preallocated and size < length:
+            os.ftruncate(fd, size)
+        digest = None if h is None else h.hexdigest()
+        if self.expected is not None and digest != self.expected.lower():
+            raise ChecksumError(self.expected, digest)
+        return size, digest
+
+
+def _fd_writer(fd):
+    def write(data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    return write
+
+
+_CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+)')
+
+
+def parse_content_range(value):
+    """Returns ``(start, end, total)`` from a ``Content-Range`` header,
+    with ``end`` excluded, or None if it has no complete range"""
+    match = _CONTENT_RANGE.fullmatch(value.strip())
+    if match is None:
+        return None
+    start, last, total = map(int, match.groups())
+    return start, last + 1, total
+
+
+def _validator(headers):
+    """Returns the value identifying this version of a resource in an
+    ``If-Range`` header, or None"""
+    etag = headers.get('ETag')
+    if etag is not None and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+
+def _range_request(request, start, end, validator):
+    """Returns a copy of ``request`` asking for bytes ``start`` to
+    ``end`` of its resource"""
+    kwargs = dict(rag(request, 'kwargs'))
+    headers = dict(kwargs.get('headers') or ())
+    headers['Range'] = 'bytes={0}-{1}'.format(start, end - 1)
+    if validator is not None:
+        headers['If-Range'] = validator
+    kwargs['headers'] = headers
+    ret = Request(rag(request, 'site'), rag(request, 'method'),
+                  rag(request, 'url'), **kwargs)
+    for name in ('retry', 'timeout', 'deadline', 'endpoint'):
+        setattr(ret, name, rag(request, name))
+    return ret
+
+
+class _PartResponse(ResponseType):
+    def __init__(self, download, start, end, **kwargs):
+        super().__init__(**kwargs)
+        self.download = download
+        self.start = start
+        self.end = end
+
+    async def parse_response(self, response):
+        response = await super().parse_response(response)
+        if not issubclass(http.cls_for_code(response.status), http.Success):
+            return await response.read()
+        try:
+            await self.download.receive(response, self.start, self.end)
+        finally:
+            await response.release()
+
+
+class _RangedDownload:
+    def __init__(self, request, target, part_size, connections, chunk_size):
+        self.request = request
+        self.part_size = part_size
+        self.connections = connections
+        self.chunk_size = chunk_size
+        self.size = None
+        self.validator = None
+        self.done = set()
+        self.probing = False
+        self.whole = False
+        if isinstance(target, str) or hasattr(target, '__fspath__'):
+            self.path = os.fspath(target)
+            self.state_path = self.path + '.parts'
+            self.buffer = None
+            self.created = not os.path.exists(self.path)
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        else:
+            self.path = self.state_path = self.fd = None
+            self.buffer = memoryview(target).cast('B')
+            if self.buffer.readonly:
+                self.buffer.release()
+                raise TypeError("Cannot download into read-only {0!r}"
+                                .format(target))
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        else:
+            self.buffer.release()
+
+    def load_state(self):
+        """Picks up the parts saved by an earlier attempt"""
+        if self.state_path is None:
+            return
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get('part_size') != self.part_size \
+                or os.fstat(self.fd).st_size != state.get('size'):
+            return
+        self.size = state['size']
+        self.validator = state['validator']
+        self.done = set(state['done'])
+
+    def save_state(self):
+        if self.state_path is None or self.validator is None \
+                or self.size is None or self.whole:
+            return
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'size': self.size, 'validator': self.validator,
+                       'part_size': self.part_size,
+                       'done': sorted(self.done)}, f)
+        os.replace(tmp, self.state_path)
+
+    def remove_state(self):
+        if self.state_path is not None:
+            try:
+                os.unlink(self.state_path)
+            except FileNotFoundError:
+                pass
+
+    def missing(self):
+        count = -(-self.size // self.part_size)
+        return [i for i in range(count) if i not in self.done]
+
+    def write_at(self, pos, data):
+        if self.fd is None:
+            if pos + len(data) > len(self.buffer):
+                raise ValueError(
+                    "The body does not fit in the target's {0} bytes"
+                    .format(len(self.buffer)))
+            self.buffer[pos:pos + len(data)] = data
+            return
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.fd, view, pos)
+            view = view[written:]
+            pos += written
+
+    async def run(self):
+        if self.size is not None:
+            parts = self.missing()
+            if not parts:
+                return
+        else:
+            parts = [0]
+        self.probing = True
+        await self.fetch(parts[0])
+        self.probing = False
+        if self.whole:
+            return
+        pending = iter(self.missing())
+
+        async def worker():
+            for i in pending:
+                await self.fetch(i)
+        workers = [asyncio.ensure_future(worker())
+                   for _ in range(self.connections)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for fut in workers:
+                fut.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+
+    async def fetch(self, i):
+        start = i * self.part_size
+        end = start + self.part_size
+        if self.size is not None:
+            end = min(end, self.size)
+        req = _range_request(self.request, start, end, self.validator)
+        req.response_type = _PartResponse(self, start, end)
+        await req
+        if not self.whole:
+            self.done.add(i)
+            self.save_state()
+
+    async def receive(self, response, start, end):
+        if response.status != 206:
+            if not self.probing:
+                raise ResourceChangedError(rag(self.request, 'url'))
+            # ranges are not supported, or the resource changed since the
+            # saved parts were fetched
+            return await self.receive_whole(response)
+        crange = parse_content_range(response.headers.get('Content-Range', ''))
+        validator = _validator(response.headers)
+        if self.size is None:
+            if crange is None or crange[0] != start:
+                raise ValueError("Unexpected Content-Range {0!r}".format(
+                    response.headers.get('Content-Range')))
+            self.begin(crange[2], validator)
+            end = min(end, self.size)
+        if crange != (start, end, self.size) or validator != self.validator:
+            raise ResourceChangedError(rag(self.request, 'url'))
+        await self.write(response, start, end)
+
+    def begin(self, size, validator):
+        self.size = size
+        self.validator = validator
+        if self.fd is None:
+            if size > len(self.buffer):
+                raise ValueError(
+                    "{0} bytes do not fit in the target's {1} bytes"
+                    .format(size, len(self.buffer)))
+        else:
+            os.ftruncate(self.fd, 0)
+            preallocate(self.fd, size)
+
+    async def receive_whole(self, response):
+        self.whole = True
+        self.done.clear()
+        self.validator = None
+        self.remove_state()
+        length = content_length(response)
+        if self.fd is not None:
+            os.ftruncate(self.fd, 0)
+            if length is not None:
+                preallocate(self.fd, length)
+        self.size = await self.write(response, 0, None)
+        if self.fd is not None:
+            os.ftruncate(self.fd, self.size)
+
+    async def write(self, response, pos, end):
+        reader = response.content
+        while True:
+            chunk = await reader.read(self.chunk_size)
+            if not chunk:
+                break
+            if end is not None and pos + len(chunk) > end:
+                raise aiohttp.ClientPayloadError(
+                    "Response payload is longer than its range")
+            self.write_at(pos, chunk)
+            pos += len(chunk)
+        if end is not None and pos != end:
+            raise aiohttp.ClientPayloadError(
+                "Response payload is not completed")
+        return pos
+
+    def digest(self, checksum):
+        h = hashlib.new(checksum)
+        if self.fd is None:
+            h.update(self.buffer[:self.size])
+            return h.hexdigest()
+        for pos in range(0, self.size, 1 << 20):
+            h.update(os.pread(self.fd, 1 << 20, pos))
+        return h.hexdigest()
+
+
+async def download_ranges(request, target, *, part_size=2 ** 22,
+                          connections=4, checksum=None, expected=None,
+                          resume=True, chunk_size=2 ** 16):
+    """Downloads the body of ``request`` in parts fetched concurrently.
+
+    :param request: an unsent GET request for the resource, such as
+        ``site.artifacts['image.iso'].get()``
+    :param target: a path, created if needed and preallocated to the
+        resource's size, or a writable buffer at least that large such as
+        an `mmap.mmap`
+    :param part_size: the size in bytes of the range each request asks
+        for
+    :param connections: how many parts are fetched at once
+    :param checksum: the name of a `hashlib` algorithm to hash the body
+        with once it is complete
+    :param expected: the expected hex digest, see `FileResponse`
+    :param resume: if true and ``target`` is a path, pick up the parts
+        that an earlier call saved next to it, in ``<path>.parts``
+    :param chunk_size: the most that is read from a response at once
+
+    The first part's response tells the size of the resource. If the
+    server does not support ranges, the body is downloaded over one
+    connection instead. Parts are only saved to be resumed if the
+    resource has a strong ``ETag`` or a ``Last-Modified`` date, which
+    are sent in ``If-Range`` headers so that a resource that changed is
+    downloaded anew. If it changes while the other parts are being
+    fetched, `.errors.ResourceChangedError` is raised.
+
+    Returns a `Download`.
+    """
+    if expected is not None and checksum is None:
+        raise ValueError("An expected checksum needs the name of the"
+                         " algorithm, pass checksum=")
+    download = _RangedDownload(request, target, part_size, connections,
+                               chunk_size)
+    try:
+        if resume:
+            download.load_state()
+        try:
+            await download.run()
+        except ResourceChangedError:
+            download.remove_state()
+            raise
+        except BaseException:
+            if download.path is not None and download.created \
+                    and download.size is None:
+                os.unlink(download.path)  # nothing to resume from
+            raise
+        digest = None
+        if checksum is not None:
+            digest = await asyncio.get_event_loop().run_in_executor(
+                None, download.digest, checksum)
+            if expected is not None and digest != expected.lower():
+                download.remove_state()
+                if download.path is not None:
+                    os.unlink(download.path)
+                raise ChecksumError(expected, digest)
+        download.remove_state()
+        return Download(download.path, download.size, digest)
+    finally:
+        download.close()
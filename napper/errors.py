@@ -1,6 +1,7 @@
 # napper -- A REST Client for Python
 # Copyright (C) 2016 by Yann Kaiser and contributors.
 # See AUTHORS and COPYING for details.
+import asyncio
 
 
 class CrossOriginRequestError(Exception):
@@ -16,6 +17,83 @@ class CrossOriginRequestError(Exception):
             self, self.method.upper())
 
 
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to an origin whose circuit
+    breaker is open"""
+    def __init__(self, origin, retry_in):
+        super().__init__(origin, retry_in)
+        self.origin = origin
+        self.retry_in = retry_in
+
+    def __str__(self):
+        return 'Circuit open for {0.origin}, retry in {0.retry_in:.1f}s' \
+            .format(self)
+
+
+class RequestTimeoutError(asyncio.TimeoutError):
+    """Raised when a stage of a request (``'headers'``, ``'parse'``) or
+    its deadline (``'deadline'``) ran out of time"""
+    def __init__(self, stage, seconds):
+        super().__init__(stage, seconds)
+        self.stage = stage
+        self.seconds = seconds
+
+    def __str__(self):
+        return 'Request {0.stage} timed out after {0.seconds:.3f}s' \
+            .format(self)
+
+
+class UnrecordedRequestError(LookupError):
+    """Raised by `.cassette.ReplayTransport` for requests missing from
+    its cassette"""
+    def __init__(self, method, url):
+        super().__init__(method, url)
+        self.method = method
+        self.url = url
+
+    def __str__(self):
+        return 'No recorded response for {0.method} {0.url}'.format(self)
+
+
+class BodyTooLargeError(ValueError):
+    """Raised when a response body is larger than the size allowed for
+    it. ``size`` is its ``Content-Length``, or how much of it was read
+    before the limit was crossed."""
+    def __init__(self, url, limit, size):
+        super().__init__(url, limit, size)
+        self.url = url
+        self.limit = limit
+        self.size = size
+
+    def __str__(self):
+        return 'Body of {0.url} exceeds {0.limit} bytes ({0.size} bytes)' \
+            .format(self)
+
+
+class ChecksumError(ValueError):
+    """Raised when a downloaded body does not match its expected
+    checksum"""
+    def __init__(self, expected, actual):
+        super().__init__(expected, actual)
+        self.expected = expected
+        self.actual = actual
+
+    def __str__(self):
+        return 'Checksum mismatch: expected {0.expected}, got {0.actual}' \
+            .format(self)
+
+
+class ResourceChangedError(Exception):
+    """Raised when a resource downloaded in parts changes before all of
+    them were fetched"""
+    def __init__(self, url):
+        super().__init__(url)
+        self.url = url
+
+    def __str__(self):
+        return '{0.url} changed while it was being downloaded'.format(self)
+
+
 class UnknownParameters(UserWarning):
     pass
 
@@ -0,0 +1,124 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Hedging GET requests against slow responses.
+
+Pass a `HedgePolicy` to the session factory::
+
+    async with factory(hedging=HedgePolicy(0.05)) as site:
+        ...
+
+When the response headers of a GET request haven't arrived after the
+hedging delay, the same request is sent again and whichever response
+arrives first is used. The other one is cancelled, or released if it
+arrived too. Only GET requests are hedged, as sending another request
+must be harmless.
+
+The delay can be fixed, or follow a percentile of the time the endpoint
+usually takes to respond, in which case the session must collect
+statistics.
+"""
+import asyncio
+
+from .retry import RetryBudget
+
+
+_unset = object()
+
+
+class HedgePolicy:
+    """Decides whether and when to send a duplicate request.
+
+    :param delay: seconds to wait for response headers before hedging.
+        If None, the ``percentile`` of the endpoint's observed time to
+        response headers is used, once ``min_samples`` responses were
+        observed.
+    :param min_delay: the percentile-based delay is never shorter than
+        this many seconds
+    :param budget: a `.retry.RetryBudget` shared by all requests using
+        this policy, limiting hedges to a fraction of the requests made,
+        or None for no limit. The default allows 5% extra requests.
+    """
+    def __init__(self, delay=None, *, percentile=95, min_samples=20,
+                 min_delay=0.001, budget=_unset):
+        self.delay = delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget = (RetryBudget(ratio=0.05, reserve=5)
+                       if budget is _unset else budget)
+
+    def __repr__(self):
+        if self.delay is None:
+            return '<HedgePolicy p{0}>'.format(self.percentile)
+        return '<HedgePolicy {0}s>'.format(self.delay)
+
+    def delay_for(self, stats):
+        """Returns how long to wait before hedging a request, or None if
+        it should not be hedged.
+
+        :param stats: the `.stats.EndpointStats` of the request's
+            endpoint, or None
+        """
+        if self.delay is not None:
+            return self.delay
+        if stats is None:
+            return None
+        histogram = stats.response_latency
+        if histogram.count < self.min_samples:
+            return None
+        return max(histogram.percentile(self.percentile), self.min_delay)
+
+    def started(self):
+        """Called for every request that may be hedged"""
+        if self.budget is not None:
+            self.budget.deposit()
+
+    def withdraw(self):
+        """Returns True if a hedge may be sent"""
+        return self.budget is None or self.budget.withdraw()
+
+
+async def _discard(task):
+    try:
+        response = await task
+    except (Exception, asyncio.CancelledError):
+        return
+    await response.release()
+
+
+async def hedge(send, delay, allow):
+    """Awaits ``send()``, calling it again if it hasn't returned after
+    ``delay`` seconds and ``allow()`` returns True. The first successful
+    result is used, the other is cancelled or released.
+
+    :returns: ``(response, sent, won)`` where ``sent`` tells if a second
+        request was sent and ``won`` if its response was used
+    """
+    first = asyncio.ensure_future(send())
+    try:
+        done, _ = await asyncio.wait([first], timeout=delay)
+    except asyncio.CancelledError:
+        first.cancel()
+        raise
+    if done or not allow():
+        return (await first), False, False
+    second = asyncio.ensure_future(send())
+    winner = None
+    try:
+        pending = {first, second}
+        while pending and winner is None:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in (first, second):
+                if task in done and task.exception() is None:
+                    winner = task
+                    break
+    finally:
+        for task in (first, second):
+            if task is not winner:
+                task.cancel()
+                asyncio.ensure_future(_discard(task))
+    if winner is None:
+        return first.result(), True, False
+    return winner.result(), True, winner is second
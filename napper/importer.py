@@ -17,7 +17,7 @@ class RestSpecFinder(importlib.abc.MetaPathFinder):
     def find_spec(self, fullname, path, target=None):
         _, _, mod = fullname.rpartition('.')
         modfile = mod + '.restspec.json'
-        for p in path:
+        for p in sys.path if path is None else path:
             filename = os.path.join(p, modfile)
             if os.path.exists(filename):
                 return importlib.machinery.ModuleSpec(
@@ -0,0 +1,250 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Per-request timing instrumentation.
+
+Pass `Instrumentation` instances to a `SessionFactory`::
+
+    async with factory(instrumentation=[MyInstrumentation()]) as site:
+        ...
+
+Each request then carries a `RequestTimings` which is filled in as the
+request goes through its stages (``'response'``, ``'parse'`` and
+``'upgrade'``) and handed to the instrumentation's methods. When napper
+creates the `aiohttp.ClientSession` itself, connection-level events are
+recorded as well through `trace_config`. Requests made on sessions
+without instrumentation carry no timings and pay nothing.
+"""
+import time
+
+import aiohttp
+
+
+clock = time.monotonic
+
+
+class RequestTimings:
+    """Timestamps, from `clock`, of the events in a request's life.
+
+    Timestamps are ``None`` for events that did not happen (yet). The
+    properties compute the durations of each phase from them.
+    """
+    __slots__ = (
+        'created', 'status', 'attempts', 'reused_connection',
+        'response_start', 'response_end',
+        'pool_wait_start', 'pool_wait_end',
+        'dns_start', 'dns_end',
+        'connect_start', 'connect_end',
+        'headers_sent', 'body_end',
+        'parse_start', 'parse_end',
+        'upgrade_start', 'upgrade_end',
+        )
+
+    durations = (
+        'queueing', 'pool_wait', 'dns', 'connect', 'ttfb', 'response',
+        'transfer', 'parse', 'upgrade', 'total')
+
+    def __init__(self, created=None):
+        for name in RequestTimings.__slots__:
+            setattr(self, name, None)
+        self.created = clock() if created is None else created
+        self.attempts = 0
+        self.reused_connection = False
+
+    def __repr__(self):
+        return '<RequestTimings {0}>'.format(', '.join(
+            '{0}={1:.3f}ms'.format(k, v * 1000)
+            for k, v in self.as_dict().items() if v is not None))
+
+    @staticmethod
+    def _diff(start, end):
+        if start is None or end is None:
+            return None
+        return end - start
+
+    @property
+    def queueing(self):
+        """From creating the request to starting to send it"""
+        return self._diff(self.created, self.response_start)
+
+    @property
+    def pool_wait(self):
+        """Waiting for a free connection in the pool"""
+        return self._diff(self.pool_wait_start, self.pool_wait_end)
+
+    @property
+    def dns(self):
+        return self._diff(self.dns_start, self.dns_end)
+
+    @property
+    def connect(self):
+        """Establishing a new connection, including DNS resolution"""
+        return self._diff(self.connect_start, self.connect_end)
+
+    @property
+    def ttfb(self):
+        """From sending the request to receiving the response headers"""
+        sent = (self.headers_sent or self.connect_end or self.pool_wait_end
+                or self.response_start)
+        return self._diff(sent, self.response_end)
+
+    @property
+    def response(self):
+        """The whole ``'response'`` stage, up to the response headers"""
+        return self._diff(self.response_start, self.response_end)
+
+    @property
+    def transfer(self):
+        """Reading the response body, if it was observed"""
+        return self._diff(self.parse_start, self.body_end)
+
+    @property
+    def parse(self):
+        """The ``'parse'`` stage, less the body transfer if known"""
+        return self._diff(self.body_end or self.parse_start, self.parse_end)
+
+    @property
+    def upgrade(self):
+        return self._diff(self.upgrade_start, self.upgrade_end)
+
+    @property
+    def total(self):
+        return self._diff(
+            self.created,
+            self.upgrade_end or self.parse_end or self.response_end)
+
+    def as_dict(self):
+        """Returns ``{duration name: seconds or None}``"""
+        return {name: getattr(self, name) for name in self.durations}
+
+    def mark(self, field, value):
+        """Records a connection-level event"""
+        setattr(self, field, value)
+
+
+class AttemptTimings(RequestTimings):
+    """Connection-level timings of one of several concurrent attempts at
+    sending a request, such as a hedged request and its duplicate.
+
+    Events are kept apart from the request's `RequestTimings` until
+    `win` is called, after which they are also recorded there.
+    """
+    __slots__ = ('request_timings', 'won')
+
+    connection_fields = (
+        'reused_connection', 'pool_wait_start', 'pool_wait_end',
+        'dns_start', 'dns_end', 'connect_start', 'connect_end',
+        'headers_sent', 'body_end')
+
+    def __init__(self, request_timings):
+        super().__init__(request_timings.created)
+        self.request_timings = request_timings
+        self.won = False
+
+    def mark(self, field, value):
+        setattr(self, field, value)
+        if self.won:
+            setattr(self.request_timings, field, value)
+
+    def win(self):
+        """Reports this attempt's events, past and future, in the
+        request's timings"""
+        self.won = True
+        for field in self.connection_fields:
+            setattr(self.request_timings, field, getattr(self, field))
+
+
+class Instrumentation:
+    """Receives events from the requests of a `Session`.
+
+    Subclass and override the methods of interest. They are called
+    synchronously from the request's task, so they should return
+    quickly.
+    """
+    def request_started(self, request, timings):
+        """Called before a request is handed to the HTTP session"""
+
+    def stage_finished(self, request, stage, timings, exc):
+        """Called when ``stage`` (``'response'``, ``'parse'`` or
+        ``'upgrade'``) ends. ``exc`` is the exception it raised, if any."""
+
+    def circuit_changed(self, origin, old, new):
+        """Called when the `.breaker.Circuit` of ``origin`` goes from
+        state ``old`` to ``new`` (``'closed'``, ``'open'`` or
+        ``'half-open'``)"""
+
+
+class Stage:
+    """Context manager marking the start and end of a request stage and
+    notifying the session's instrumentation."""
+    __slots__ = ('instrumentation', 'request', 'timings', 'name')
+
+    def __init__(self, instrumentation, request, timings, name):
+        self.instrumentation = instrumentation
+        self.request = request
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        now = clock()
+        setattr(self.timings, self.name + '_start', now)
+        if self.name == 'response':
+            self.timings.attempts += 1
+            for inst in self.instrumentation:
+                inst.request_started(self.request, self.timings)
+        return self.timings
+
+    def __exit__(self, typ, val, tb):
+        setattr(self.timings, self.name + '_end', clock())
+        for inst in self.instrumentation:
+            inst.stage_finished(self.request, self.name, self.timings, val)
+
+
+class NullStage:
+    """Stand-in for `Stage` on requests without timings"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, typ, val, tb):
+        pass
+
+
+null_stage = NullStage()
+
+
+def _mark(field):
+    async def _on_event(session, ctx, params):
+        timings = ctx.trace_request_ctx
+        if isinstance(timings, RequestTimings):
+            timings.mark(field, clock())
+    return _on_event
+
+
+async def _on_reuseconn(session, ctx, params):
+    timings = ctx.trace_request_ctx
+    if isinstance(timings, RequestTimings):
+        timings.mark('reused_connection', True)
+
+
+def trace_config():
+    """Returns an `aiohttp.TraceConfig` that records connection-level
+    events in the `RequestTimings` passed as ``trace_request_ctx``."""
+    ret = aiohttp.TraceConfig()
+    for signal, field in [
+            ('on_connection_queued_start', 'pool_wait_start'),
+            ('on_connection_queued_end', 'pool_wait_end'),
+            ('on_dns_resolvehost_start', 'dns_start'),
+            ('on_dns_resolvehost_end', 'dns_end'),
+            ('on_connection_create_start', 'connect_start'),
+            ('on_connection_create_end', 'connect_end'),
+            ('on_request_headers_sent', 'headers_sent'),
+            ('on_response_chunk_received', 'body_end'),
+            ]:
+        try:
+            getattr(ret, signal).append(_mark(field))
+        except AttributeError:
+            pass
+    ret.on_connection_reuseconn.append(_on_reuseconn)
+    return ret
@@ -0,0 +1,404 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Parsing large JSON documents without stalling the event loop.
+
+`json.loads` parses a document in one go, during which no other task
+runs: tens of milliseconds per megabyte. `loads_in_slices` walks the
+outer levels of the document itself and hands each value below them to
+the standard library's C scanner, giving way to other tasks whenever a
+time slice is used up. Documents made of a long list of records, the
+usual shape of large API responses, are thereby split at the records.
+
+`lazy_loads` instead indexes where the values of the document's outer
+object or array start and parses each of them only when it is looked
+up, one level at a time. Reading a few fields out of a large document
+then costs little more than finding them.
+"""
+import array
+import asyncio
+import collections.abc
+import gc
+import json
+import json.decoder
+import re
+import threading
+
+
+_WS = re.compile(r'[ \t\n\r]*')
+_WS_CHARS = frozenset(' \t\n\r')
+
+#: how many values are parsed between looks at the clock
+_CHECK_EVERY = 16
+
+_decoder = json.JSONDecoder()
+_scan_once = _decoder.scan_once
+_scanstring = json.decoder.scanstring
+
+
+class _gc_paused:
+    """Pauses the cyclic garbage collector: parsing allocates many
+    containers, none of them garbage, which would otherwise set off
+    collection after collection.
+
+    The collector is shared by the whole process, so it is left alone
+    outside the main thread, where the event loop or other threads may
+    be allocating meanwhile."""
+    def __enter__(self):
+        self.enabled = (gc.isenabled() and
+                        threading.current_thread() is threading.main_thread())
+        if self.enabled:
+            gc.disable()
+
+    def __exit__(self, typ, val, tb):
+        if self.enabled:
+            gc.enable()
+
+
+def loads(text, pause_gc=False):
+    """`json.loads`, with the garbage collector paused if ``pause_gc`` is
+    true, as is worth it for large documents parsed in worker processes.
+    """
+    if not pause_gc:
+        return json.loads(text)
+    with _gc_paused():
+        return json.loads(text)
+
+
+def _error(msg, text, idx):
+    return json.JSONDecodeError(msg, text, idx)
+
+
+class _SlicedParser:
+    def __init__(self, text, timeslice, depth):
+        self.text = text
+        self.timeslice = timeslice
+        self.depth = depth
+        self.loop = asyncio.get_event_loop()
+        self.deadline = None
+
+    async def parse(self):
+        text = self.text
+        self.deadline = self.loop.time() + self.timeslice
+        value, end = await self.value(_WS.match(text, 0).end(), self.depth)
+        end = _WS.match(text, end).end()
+        if end != len(text):
+            raise _error("Extra data", text, end)
+        return value
+
+    async def give_way(self):
+        await asyncio.sleep(0)
+        self.deadline = self.loop.time() + self.timeslice
+
+    def scan(self, idx):
+        try:
+            return _scan_once(self.text, idx)
+        except StopIteration as exc:
+            raise _error("Expecting value", self.text, exc.value) from None
+
+    async def value(self, idx, depth):
+        c = self.text[idx:idx + 1]
+        if depth and c == '[':
+            return await self.array(idx + 1, depth - 1)
+        if depth and c == '{':
+            return await self.object(idx + 1, depth - 1)
+        return self.scan(idx)
+
+    async def array(self, idx, depth):
+        text = self.text
+        ret = []
+        idx = _WS.match(text, idx).end()
+        if text[idx:idx + 1] == ']':
+            return ret, idx + 1
+        append = ret.append
+        scan = _scan_once
+        time = self.loop.time
+        n = 0
+        while True:
+            n += 1
+            if not n % _CHECK_EVERY and time() >= self.deadline:
+                await self.give_way()
+            if depth:
+                item, idx = await self.value(idx, depth)
+            else:
+                try:
+                    item, idx = scan(text, idx)
+                except StopIteration as exc:
+                    raise _error("Expecting value", text, exc.value) \
+                        from None
+            append(item)
+            c = text[idx:idx + 1]
+            if c in _WS_CHARS:
+                idx = _WS.match(text, idx).end()
+                c = text[idx:idx + 1]
+            if c == ']':
+                return ret, idx + 1
+            if c != ',':
+                raise _error("Expecting ',' delimiter", text, idx)
+            idx += 1
+            if text[idx:idx + 1] in _WS_CHARS:
+                idx = _WS.match(text, idx).end()
+
+    async def object(self, idx, depth):
+        text = self.text
+        ret = {}
+        idx = _WS.match(text, idx).end()
+        if text[idx:idx + 1] == '}':
+            return ret, idx + 1
+        while True:
+            if self.loop.time() >= self.deadline:
+                await self.give_way()
+            if text[idx:idx + 1] != '"':
+                raise _error("Expecting property name enclosed in double "
+                             "quotes", text, idx)
+            key, idx = _scanstring(text, idx + 1)
+            idx = _WS.match(text, idx).end()
+            if text[idx:idx + 1] != ':':
+                raise _error("Expecting ':' delimiter", text, idx)
+            idx = _WS.match(text, idx + 1).end()
+            if depth:
+                ret[key], idx = await self.value(idx, depth)
+            else:
+                ret[key], idx = self.scan(idx)
+            idx = _WS.match(text, idx).end()
+            c = text[idx:idx + 1]
+            if c == '}':
+                return ret, idx + 1
+            if c != ',':
+                raise _error("Expecting ',' delimiter", text, idx)
+            idx = _WS.match(text, idx + 1).end()
+
+
+async def loads_in_slices(text, timeslice=0.005, depth=2):
+    """Parses the JSON document ``text`` like `json.loads`, letting other
+    tasks run at least every ``timeslice`` seconds.
+
+    :param depth: how many levels of arrays and objects are walked
+        through here; values nested deeper are each parsed in one go
+    """
+    return await _SlicedParser(text, timeslice, depth).parse()
+
+
+_unparsed = object()
+
+
+def _scan(text, idx, inline_size):
+    """Returns the value starting at ``idx`` and where it ends. Values
+    spanning more than ``inline_size`` characters are returned as
+    ``_unparsed``, and strings among them are skipped without being
+    decoded. Other large values are parsed and dropped: no pure-Python
+    scan outruns the C scanner, even when its result is thrown away."""
+    if text[idx:idx + 1] == '"':
+        end = text.find('"', idx + 1)
+        while end > 0 and text[end - 1] == '\\':
+            i = end - 1
+            while text[i - 1] == '\\':
+                i -= 1
+            if not (end - i) % 2:
+                break  # the backslashes escape each other
+            end = text.find('"', end + 1)
+        if end < 0:
+            raise _error("Unterminated string starting at", text, idx)
+        if end - idx >= inline_size:
+            return _unparsed, end + 1
+        return _scanstring(text, idx + 1)
+    try:
+        value, end = _scan_once(text, idx)
+    except StopIteration as exc:
+        raise _error("Expecting value", text, exc.value) from None
+    if end - idx > inline_size:
+        return _unparsed, end
+    return value, end
+
+
+def _index_object(text, idx, inline_size):
+    offsets = {}
+    values = {}
+    idx = _WS.match(text, idx + 1).end()
+    if text[idx:idx + 1] == '}':
+        return offsets, values, idx + 1
+    while True:
+        if text[idx:idx + 1] != '"':
+            raise _error("Expecting property name enclosed in double "
+                         "quotes", text, idx)
+        key, idx = _scanstring(text, idx + 1)
+        if text[idx:idx + 1] != ':':
+            idx = _WS.match(text, idx).end()
+            if text[idx:idx + 1] != ':':
+                raise _error("Expecting ':' delimiter", text, idx)
+        idx += 1
+        if text[idx:idx + 1] in _WS_CHARS:
+            idx = _WS.match(text, idx).end()
+        offsets[key] = idx
+        value, idx = _scan(text, idx, inline_size)
+        if value is not _unparsed:
+            values[key] = value
+        else:
+            values.pop(key, None)
+        c = text[idx:idx + 1]
+        if c in _WS_CHARS:
+            idx = _WS.match(text, idx).end()
+            c = text[idx:idx + 1]
+        if c == '}':
+            return offsets, values, idx + 1
+        if c != ',':
+            raise _error("Expecting ',' delimiter", text, idx)
+        idx += 1
+        if text[idx:idx + 1] in _WS_CHARS:
+            idx = _WS.match(text, idx).end()
+
+
+def _index_array(text, idx, inline_size):
+    offsets = array.array('q')
+    values = []
+    idx = _WS.match(text, idx + 1).end()
+    if text[idx:idx + 1] == ']':
+        return offsets, values, idx + 1
+    add_offset = offsets.append
+    add_value = values.append
+    while True:
+        add_offset(idx)
+        value, idx = _scan(text, idx, inline_size)
+        add_value(value)
+        c = text[idx:idx + 1]
+        if c in _WS_CHARS:
+            idx = _WS.match(text, idx).end()
+            c = text[idx:idx + 1]
+        if c == ']':
+            return offsets, values, idx + 1
+        if c != ',':
+            raise _error("Expecting ',' delimiter", text, idx)
+        idx += 1
+        if text[idx:idx + 1] in _WS_CHARS:
+            idx = _WS.match(text, idx).end()
+
+
+def _value_at(text, idx, inline_size):
+    c = text[idx:idx + 1]
+    if c == '{':
+        return LazyObject(text, idx, inline_size)
+    if c == '[':
+        return LazyArray(text, idx, inline_size)
+    try:
+        return _scan_once(text, idx)[0]
+    except StopIteration as exc:
+        raise _error("Expecting value", text, exc.value) from None
+
+
+class LazyObject(collections.abc.Mapping):
+    """A JSON object from ``text`` whose large values are parsed when
+    first looked up, objects and arrays among them lazily as well.
+
+    Values spanning at most ``inline_size`` characters are parsed right
+    away, as indexing them would cost more.
+    """
+    __slots__ = ('_text', '_start', '_end', '_inline_size', '_offsets',
+                 '_values')
+
+    def __init__(self, text, start=0, inline_size=512):
+        self._text = text
+        self._start = start
+        self._inline_size = inline_size
+        self._offsets, self._values, self._end = _index_object(
+            text, start, inline_size)
+
+    def __repr__(self):
+        return repr(self.load())
+
+    def __getitem__(self, key):
+        try:
+            return self._values[key]
+        except KeyError:
+            pass
+        ret = self._values[key] = _value_at(
+            self._text, self._offsets[key], self._inline_size)
+        return ret
+
+    def __contains__(self, key):
+        return key in self._offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __iter__(self):
+        return iter(self._offsets)
+
+    def load(self):
+        """Returns the object fully parsed, as a `dict`"""
+        return loads(self._text[self._start:self._end])
+
+
+class LazyArray(collections.abc.Sequence):
+    """A JSON array from ``text`` whose large items are parsed when first
+    looked up, like the values of a `LazyObject`."""
+    __slots__ = ('_text', '_start', '_end', '_inline_size', '_offsets',
+                 '_values')
+
+    def __init__(self, text, start=0, inline_size=512):
+        self._text = text
+        self._start = start
+        self._inline_size = inline_size
+        self._offsets, self._values, self._end = _index_array(
+            text, start, inline_size)
+
+    def __repr__(self):
+        return repr(self.load())
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        ret = self._values[i]
+        if ret is _unparsed:
+            ret = self._values[i] = _value_at(
+                self._text, self._offsets[i], self._inline_size)
+        return ret
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        for i in range(len(self._values)):
+            yield self[i]
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, LazyArray)):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+    def load(self):
+        """Returns the array fully parsed, as a `list`"""
+        return loads(self._text[self._start:self._end])
+
+
+def lazy_loads(text, inline_size=512):
+    """Parses the JSON document ``text`` lazily.
+
+    Objects and arrays are returned as `LazyObject` and `LazyArray`,
+    which index where their values start and parse the values larger
+    than ``inline_size`` characters only on first access. Values that
+    are never looked up are not validated, and the text is kept for as
+    long as any of the lazy values are.
+
+    Large values that are skipped still go through the C scanner, save
+    for strings, so this mostly saves memory, and time when the document
+    holds large strings. Reading every value of many small objects costs
+    more than `loads`.
+    """
+    idx = _WS.match(text, 0).end()
+    c = text[idx:idx + 1]
+    if c == '{' or c == '[':
+        value = (LazyObject if c == '{' else LazyArray)(
+            text, idx, inline_size)
+        end = value._end
+    else:
+        try:
+            value, end = _scan_once(text, idx)
+        except StopIteration as exc:
+            raise _error("Expecting value", text, exc.value) from None
+    end = _WS.match(text, end).end()
+    if end != len(text):
+        raise _error("Extra data", text, end)
+    return value
@@ -0,0 +1,431 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Limiting the rate and concurrency at which a session sends requests,
+and the size of the response bodies it reads."""
+import asyncio
+import codecs
+import collections
+import time
+
+import aiohttp
+
+from .errors import BodyTooLargeError
+from .util import UniversalDetector
+
+
+class TokenBucket:
+    """Token bucket rate limiter.
+
+    Tokens accrue at ``rate`` per second up to ``burst``. Each request
+    takes one; when none are left, requests wait their turn in the order
+    they arrived.
+
+    :param remaining_header: if set, the name of a response header giving
+        the number of requests left in the server's current window
+    :param reset_header: the name of a response header giving when the
+        server's window resets, either as a UNIX timestamp or as a number
+        of seconds from now
+    """
+    def __init__(self, rate, burst=1, *, remaining_header=None,
+                 reset_header=None, clock=time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = burst
+        self.remaining_header = remaining_header
+        self.reset_header = reset_header
+        self.clock = clock
+        self.tokens = float(burst)
+        self.updated = clock()
+
+    @classmethod
+    def from_rate_limit(cls, rate_limit, **kwargs):
+        """Builds a bucket from a `.restspec.RateLimit`, or returns None"""
+        if rate_limit is None:
+            return None
+        return cls(rate_limit.requests / rate_limit.per, rate_limit.burst,
+                   remaining_header=rate_limit.remaining_header,
+                   reset_header=rate_limit.reset_header, **kwargs)
+
+    def __repr__(self):
+        return '<TokenBucket {0:.3g}/s, {1:.1f} tokens>'.format(
+            self.rate, self.tokens)
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self):
+        """Takes a token and returns how long to wait before using it.
+
+        The balance goes negative when requests are queued, so that later
+        reservations wait behind earlier ones."""
+        now = self.clock()
+        self._refill(now)
+        self.tokens -= 1
+        delay = max(self.updated - now, 0.0)
+        if self.tokens < 0:
+            delay += -self.tokens / self.rate
+        return delay
+
+    async def acquire(self):
+        """Waits for a token. The token is given back if the wait is
+        cancelled."""
+        delay = self.reserve()
+        if delay > 0:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.tokens += 1
+                raise
+
+    def update(self, remaining, reset_in):
+        """Adapts to the server's view of the current window: ``remaining``
+        requests are allowed in the next ``reset_in`` seconds."""
+        if reset_in <= 0:
+            return
+        now = self.clock()
+        self._refill(now)
+        if remaining <= 0:
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = max(self.updated, now + reset_in)
+        else:
+            self.rate = remaining / reset_in
+            self.tokens = min(self.tokens, float(remaining))
+
+    def update_from_headers(self, headers):
+        """Calls `update` with values from rate limiting response headers,
+        if present."""
+        if self.remaining_header is None or not headers:
+            return
+        try:
+            remaining = int(headers[self.remaining_header])
+            reset = float(headers[self.reset_header])
+        except (KeyError, TypeError, ValueError):
+            return
+        if reset > 1e9:
+            reset -= time.time()
+        self.update(remaining, reset)
+
+
+class AdaptiveConcurrency:
+    """Limits the number of requests in flight, adapting the limit with
+    additive increase, multiplicative decrease (AIMD).
+
+    While responses succeed and their latency stays within ``tolerance``
+    times the usual latency, the limit grows by ``increase`` per
+    ``limit`` completed requests, but only while the limit is actually
+    being reached. Server errors, 429 responses, exceptions and latency
+    spikes multiply it by ``backoff``, at most once per round trip.
+
+    A request holds its slot until its response headers arrive.
+
+    :param smoothing: weight of each new sample in the moving average
+        of latency
+    :param min_latency: latencies below this many seconds are never
+        considered spikes
+    """
+    def __init__(self, initial=8, *, min_limit=1, max_limit=256,
+                 increase=1.0, backoff=0.5, tolerance=2.0, smoothing=0.05,
+                 min_latency=0.001, clock=time.monotonic):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.smoothing = smoothing
+        self.min_latency = min_latency
+        self.clock = clock
+        self.in_flight = 0
+        self.baseline = None
+        self.last_decrease = float('-inf')
+        self._waiters = collections.deque()
+
+    def __repr__(self):
+        return '<AdaptiveConcurrency limit={0} in_flight={1}>'.format(
+            int(self.limit), self.in_flight)
+
+    def _has_room(self):
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self):
+        """Waits for a slot and returns the time it was obtained, to be
+        passed back to `release`."""
+        if self._has_room() and not self._waiters:
+            self.in_flight += 1
+            return self.clock()
+        fut = asyncio.Future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.in_flight -= 1
+                self._wake()
+            raise
+        return self.clock()
+
+    def _wake(self):
+        while self._waiters and self._has_room():
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.in_flight += 1
+                fut.set_result(None)
+
+    def release(self, started, overloaded=False, measure=True):
+        """Frees the slot obtained at ``started``.
+
+        :param overloaded: True if the request failed in a way showing
+            the server is overloaded
+        :param measure: False if the request was interrupted and should
+            not affect the limit
+        """
+        now = self.clock()
+        latency = now - started
+        saturated = self.in_flight >= int(self.limit) or self._waiters
+        self.in_flight -= 1
+        if not measure:
+            self._wake()
+            return
+        if not overloaded and self.baseline is not None:
+            overloaded = latency > max(self.tolerance * self.baseline,
+                                       self.min_latency)
+        if overloaded:
+            if started > self.last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.last_decrease = now
+        else:
+            if self.baseline is None:
+                self.baseline = latency
+            else:
+                self.baseline += self.smoothing * (latency - self.baseline)
+            if saturated:
+                self.limit = min(self.max_limit,
+                                 self.limit + self.increase / self.limit)
+        self._wake()
+
+
+class MemoryBudget:
+    """Limits the memory held by response bodies read whole.
+
+    Bodies count against the budget as they are read, or from when they
+    start being read if their ``Content-Length`` is known, until the
+    response they belong to is parsed. Requests sent but still waiting
+    for their response headers count as the average body read so far.
+    As in TCP's slow start, only one such request is allowed at first,
+    and one more after each body read, so that bodies are seen before
+    many requests are sent. When there is no room left, new requests
+    wait before being sent, in the order they arrived. Bodies already
+    being read carry on so that they can free their memory, which means
+    the budget can be overrun by as much as the bodies being read exceed
+    the average.
+
+    :param smoothing: weight of each new body in the average body size
+    """
+    def __init__(self, limit, *, smoothing=0.2):
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        self.limit = limit
+        self.smoothing = smoothing
+        self.used = 0
+        self.peak = 0
+        self.admitting = 0
+        self.window = 1
+        self.body_size = 0.0
+        self._waiters = collections.deque()
+
+    def __repr__(self):
+        return '<MemoryBudget {0}/{1} bytes>'.format(self.used, self.limit)
+
+    def _has_room(self):
+        return (self.admitting < self.window and
+                self.used + self.admitting * self.body_size < self.limit)
+
+    async def wait(self):
+        """Waits until there is room for another response. Call
+        `admitted` once its headers arrived or it failed."""
+        if self._has_room() and not self._waiters:
+            self.admitting += 1
+            return
+        fut = asyncio.Future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.admitted()
+            raise
+
+    def admitted(self):
+        """Tells the budget that a request `wait` let through got its
+        response headers or failed"""
+        self.admitting -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self._has_room():
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.admitting += 1
+                fut.set_result(None)
+
+    def observe(self, size):
+        """Updates the average body size with a body of ``size`` bytes"""
+        if self.window == 1:
+            self.body_size = float(size)
+        else:
+            self.body_size += self.smoothing * (size - self.body_size)
+        self.window += 1
+        self._wake()
+
+    def charge(self, size):
+        """Counts ``size`` more bytes as held"""
+        self.used += size
+        self.peak = max(self.peak, self.used)
+
+    def credit(self, size):
+        """Counts ``size`` bytes as freed"""
+        self.used -= size
+        self._wake()
+
+
+class LimitedStream:
+    """Wraps a response's ``content`` stream, raising
+    `.errors.BodyTooLargeError` once more than ``max_size`` bytes were
+    read from it"""
+    def __init__(self, stream, max_size, url, chunk_size=2 ** 16):
+        self.stream = stream
+        self.max_size = max_size
+        self.url = url
+        self.chunk_size = chunk_size
+        self.size = 0
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def _count(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            raise BodyTooLargeError(self.url, self.max_size, self.size)
+        return data
+
+    async def read(self, n=-1):
+        if n >= 0:
+            return self._count(await self.stream.read(n))
+        chunks = []
+        while True:
+            chunk = await self.read(self.chunk_size)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    async def readany(self):
+        return self._count(await self.stream.readany())
+
+    async def readline(self):
+        return self._count(await self.stream.readline())
+
+
+class LimitedResponse:
+    """Wraps a response so that its body is read at most ``max_size``
+    bytes at a time, counting against ``budget``, a `MemoryBudget`, when
+    read whole.
+
+    A ``Content-Length`` above ``max_size`` fails here, closing the
+    response before anything is read from it, however the body is read
+    afterwards. Call `free` once the body is no longer needed.
+    """
+    def __init__(self, response, max_size=None, budget=None):
+        self.response = response
+        self.max_size = max_size
+        self.budget = budget
+        try:
+            self._check_length()
+        except BodyTooLargeError:
+            response.close()
+            raise
+        self.content = LimitedStream(response.content, max_size, response.url)
+        self.held = 0
+        self._body = None
+
+    def __repr__(self):
+        return '<LimitedResponse {0!r}>'.format(self.response)
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def _length(self):
+        try:
+            return int(self.response.headers['Content-Length'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _check_length(self):
+        length = self._length()
+        if self.max_size is not None and length is not None \
+                and length > self.max_size:
+            raise BodyTooLargeError(self.response.url, self.max_size, length)
+
+    def _hold(self, size):
+        if self.budget is not None and size > self.held:
+            self.budget.charge(size - self.held)
+            self.held = size
+
+    async def read(self):
+        if self._body is not None:
+            return self._body
+        self._hold(self._length() or 0)
+        try:
+            chunks = []
+            size = 0
+            while True:
+                chunk = await self.content.read(self.content.chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                self._hold(size)
+                chunks.append(chunk)
+        except BaseException:
+            self.free()
+            self.response.close()
+            raise
+        self._body = b''.join(chunks)
+        if self.budget is not None:
+            self.budget.observe(size)
+        await self.response.release()
+        return self._body
+
+    def get_encoding(self):
+        """Returns the charset from the ``Content-Type`` header, or
+        detects it from the body once it was read"""
+        content_type = self.response.headers.get(
+            aiohttp.hdrs.CONTENT_TYPE, '').lower()
+        mimetype = aiohttp.helpers.parse_mimetype(content_type)
+        encoding = mimetype.parameters.get('charset')
+        if encoding:
+            try:
+                return codecs.lookup(encoding).name
+            except LookupError:
+                pass
+        if mimetype.type == 'application' and mimetype.subtype == 'json':
+            return 'utf-8'
+        if self._body is None:
+            raise RuntimeError("The body must be read to detect its encoding")
+        detector = UniversalDetector()
+        detector.feed(self._body)
+        detector.close()
+        return detector.result['encoding'] or 'utf-8'
+
+    async def text(self, encoding=None):
+        body = await self.read()
+        return body.decode(encoding or self.get_encoding())
+
+    def free(self):
+        """Gives the memory counted for the body back to the budget"""
+        if self.held:
+            self.budget.credit(self.held)
+            self.held = 0
@@ -1,12 +1,25 @@
 # napper -- A REST Client for Python
 # Copyright (C) 2016 by Yann Kaiser and contributors.
 # See AUTHORS and COPYING for details.
+import asyncio
+import string
+
 import aiohttp
 
+from .body import stream_body
 from .restspec import RestSpec
 from .response import JsonResponse
-from .errors import CrossOriginRequestError, http
-from .util import m, rag, METHODS, metafunc, getattribute_common, run_once_as_task
+from .errors import CrossOriginRequestError, RequestTimeoutError, http
+from .hedge import hedge
+from .limit import LimitedResponse, MemoryBudget, TokenBucket
+from .instrument import (
+    AttemptTimings, RequestTimings, Stage, null_stage, trace_config)
+from .stats import StatsCollector
+from .timeout import Deadline, time_left, within
+from .transport import AiohttpTransport
+from .util import (
+    m, rag, METHODS, metafunc, getattribute_common, getattribute_attrs,
+    run_once_as_task, get_aiter)
 
 
 class SessionFactory:
@@ -22,44 +35,138 @@ class SessionFactory:
     def __repr__(self):
         return "<SessionFactory [{}]>".format(self.address)
 
-    def __call__(self, session=None, proxy=None):
+    def __call__(self, session=None, proxy=None, **kwargs):
         """
         :param session: An `aiohttp.ClientSession` object
         :param proxy: If session is unset, an http proxy addess. See
             the documentation on `aiohttp.ProxyConnector`
+
+        Other keyword arguments are passed on to `Session`. No HTTP
+        session is created if a ``transport`` is given.
         """
-        if session is None:
+        if session is None and kwargs.get('transport') is None:
             conn = None
+            session_kwargs = {}
             if proxy is not None:
                 conn = aiohttp.ProxyConnector(proxy=proxy)
-            session = aiohttp.ClientSession(connector=conn)
-        return SessionManager(self.spec, session)
+            if kwargs.get('instrumentation'):
+                session_kwargs['trace_configs'] = [trace_config()]
+            session = aiohttp.ClientSession(connector=conn, **session_kwargs)
+        return SessionManager(self.spec, session, **kwargs)
 
 
 class SessionManager:
-    def __init__(self, spec, http_session):
+    def __init__(self, spec, http_session, **kwargs):
         self.spec = spec
         self.http_session = http_session
+        self.kwargs = kwargs
 
     async def __aenter__(self):
-        return Session(self.spec, self.http_session)
+        return Session(self.spec, self.http_session, **self.kwargs)
 
     async def __aexit__(self, typ, val, tb):
-        self.http_session.close()
+        if self.http_session is not None:
+            await self.http_session.close()
+        transport = self.kwargs.get('transport')
+        if transport is not None:
+            await transport.close()
 
 
 _unset = object()
 
 
+def _cached_child(self, name):
+    """Returns ``self[name]``, reusing the builder from earlier accesses.
+
+    Only used for attribute access, whose names come from source code,
+    so that the cache stays bounded when items are computed at runtime.
+    """
+    children = self.children
+    try:
+        return children[name]
+    except KeyError:
+        ret = children[name] = self._real_object[name]
+        return ret
+
+
 class Session:
+    """The site object requests are built from.
+
+    :param spec: The `.restspec.RestSpec` describing the site
+    :param session: The `aiohttp.ClientSession` requests are sent with,
+        unless ``transport`` is set
+    :param transport: A `.transport.Transport` requests are sent with.
+        Defaults to an `.transport.AiohttpTransport` wrapping ``session``.
+    :param instrumentation: A sequence of `.instrument.Instrumentation`
+        objects notified of each request's timings. Connection-level
+        timings are only recorded if the `SessionFactory` created the
+        HTTP session.
+    :param stats: If true, collect request statistics, queryable with
+        ``site.stats()``. May be a `.stats.StatsCollector` instance.
+    :param retry: A `.retry.RetryPolicy` applied to requests that don't
+        set their own.
+    :param rate_limiter: A `.limit.TokenBucket` requests wait on before
+        being sent. By default, one is made from the restspec's
+        ``rate_limit`` section, if any. Pass None to disable.
+    :param concurrency: A `.limit.AdaptiveConcurrency` limiting the
+        number of requests in flight. Its current limit is reported as
+        the ``concurrency_limit`` gauge in statistics.
+    :param hedging: A `.hedge.HedgePolicy` for GET requests. Hedges sent
+        and won are counted as the ``hedges_sent`` and ``hedges_won``
+        counters in statistics.
+    :param timeout: A `.timeout.Timeout` applied to requests that don't
+        set their own.
+    :param circuit_breaker: A `.breaker.CircuitBreaker` making requests
+        fail fast while their origin is failing. The number of circuits
+        not closed is reported as the ``circuits_open`` gauge.
+    :param max_body_size: The largest response body in bytes that
+        response types which don't set their own ``max_size`` may read.
+        Larger bodies raise `.errors.BodyTooLargeError` as soon as
+        their ``Content-Length`` or what was read shows it.
+    :param memory_budget: A `.limit.MemoryBudget`, or a number of bytes
+        to make one with, that requests wait on before being sent while
+        the bodies being read take too much memory.
+    """
     @property
     def site(self):
         return self
 
-    def __init__(self, spec, session, *args, **kwargs):
+    def __init__(self, spec, session, *args, instrumentation=(),
+                 stats=False, retry=None, rate_limiter=_unset,
+                 concurrency=None, hedging=None,
+                 timeout=None, circuit_breaker=None, transport=None,
+                 max_body_size=None, memory_budget=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.spec = spec
         self.session = session
+        if transport is None:
+            transport = AiohttpTransport(session)
+        self.transport = transport
+        self.children = {}
+        instrumentation = list(instrumentation)
+        if stats is True:
+            stats = StatsCollector()
+        elif stats is False:
+            stats = None
+        if stats is not None:
+            instrumentation.append(stats)
+        self.instrumentation = instrumentation
+        self.stats_collector = stats
+        self.retry = retry
+        if rate_limiter is _unset:
+            rate_limiter = TokenBucket.from_rate_limit(spec.rate_limit)
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        if hedging is not None and hedging.delay is None and stats is None:
+            raise ValueError("Hedging without a fixed delay requires"
+                             " statistics, pass stats=True")
+        self.hedging = hedging
+        self.timeout = timeout
+        self.circuit_breaker = circuit_breaker
+        self.max_body_size = max_body_size
+        if isinstance(memory_budget, int):
+            memory_budget = MemoryBudget(memory_budget)
+        self.memory_budget = memory_budget
 
     @metafunc
     def __repr__(self):
@@ -69,7 +176,18 @@ class Session:
     def __getitem__(self, name):
         return RequestBuilder(self, (name,))
 
-    __getattribute__ = getattribute_common(__getitem__)
+    __getattribute__ = getattribute_attrs('stats')(metafunc(_cached_child))
+
+    @metafunc
+    def stats(self):
+        """Returns the `.stats.StatsCollector` of this session.
+
+        Available as ``site.stats()``; use ``site['stats']`` for a path
+        named "stats"."""
+        if self.stats_collector is None:
+            raise ValueError("Statistics are not enabled for this session,"
+                             " pass stats=True to the SessionFactory")
+        return self.stats_collector
 
     @metafunc
     def build_request(self, method, path, **kwargs):
@@ -77,10 +195,142 @@ class Session:
         return Request(self, method, jpath, **kwargs)
 
     @metafunc
-    def _request(self, method, url, *args, **kwargs):
+    async def _request(self, method, url, *args, request=None, **kwargs):
+        """Sends a request through the HTTP session.
+
+        :param request: the `Request` being sent, if any, for statistics
+        """
         if not self.spec.is_same_origin(url):
             raise CrossOriginRequestError(self, method, url, (), {})
-        return self.session.request(method, url, *args, **kwargs)
+        hedging = self.hedging
+        if hedging is None or method != 'GET':
+            return await self._send(method, url, *args, **kwargs)
+        stats = self.stats_collector
+        endpoint = None
+        if stats is not None and request is not None:
+            endpoint = stats.stats_for(request)
+        hedging.started()
+        delay = hedging.delay_for(endpoint)
+        if delay is None:
+            return await self._send(method, url, *args, **kwargs)
+        # each attempt records its own connection events, and only those
+        # of the response used (or the first attempt's) are reported
+        timings = kwargs.pop('trace_request_ctx', None)
+        attempts = []
+
+        def send():
+            if timings is None:
+                return self._send(method, url, *args, **kwargs)
+            attempt = AttemptTimings(timings)
+            attempts.append(attempt)
+            return self._send(method, url, *args,
+                              trace_request_ctx=attempt, **kwargs)
+        try:
+            response, sent, won = await hedge(send, delay, hedging.withdraw)
+        except Exception:
+            if attempts:
+                attempts[0].win()
+            raise
+        if attempts:
+            attempts[1 if won else 0].win()
+        if endpoint is not None and sent:
+            endpoint.counters['hedges_sent'] += 1
+            if won:
+                endpoint.counters['hedges_won'] += 1
+        return response
+
+    @metafunc
+    async def _send(self, method, url, *args, headers_deadline=None,
+                    deadline=None, **kwargs):
+        """Sends a request once the session's limits allow it, reporting
+        its outcome to the circuit breaker and concurrency limit.
+
+        :param headers_deadline: when waiting on the limits and for the
+            response headers must be over, raising a ``'headers'``
+            `.errors.RequestTimeoutError`
+        :param deadline: the request's `.timeout.Deadline`
+        """
+        def bounded(awaitable):
+            return within(awaitable, time_left(None, headers_deadline),
+                          'headers', deadline)
+        breaker = self.circuit_breaker
+        circuit = token = None
+        if breaker is not None:
+            circuit = breaker.circuit(url)
+            token, change = circuit.acquire()
+            self._circuit_changed(circuit, change)
+        try:
+            started = await self._wait_to_send(bounded)
+        except BaseException:
+            if circuit is not None:
+                circuit.cancelled(token)
+            raise
+        concurrency = self.concurrency
+        budget = self.memory_budget
+        try:
+            response = await bounded(
+                self.transport.request(method, url, *args, **kwargs))
+        except asyncio.CancelledError:
+            if concurrency is not None:
+                concurrency.release(started, measure=False)
+            if circuit is not None:
+                circuit.cancelled(token)
+            raise
+        except Exception:
+            if concurrency is not None:
+                concurrency.release(started, overloaded=True)
+                self._report_concurrency()
+            if circuit is not None:
+                self._circuit_changed(circuit, circuit.failure(token))
+            raise
+        finally:
+            if budget is not None:
+                budget.admitted()
+        if self.rate_limiter is not None:
+            self.rate_limiter.update_from_headers(response.headers)
+        cls = http.cls_for_code(response.status)
+        if concurrency is not None:
+            concurrency.release(started, overloaded=issubclass(
+                cls, (http.ServerError, http.TooManyRequests)))
+            self._report_concurrency()
+        if circuit is not None:
+            if issubclass(cls, http.ServerError):
+                self._circuit_changed(circuit, circuit.failure(token))
+            else:
+                self._circuit_changed(circuit, circuit.success(token))
+        return response
+
+    @metafunc
+    def _circuit_changed(self, circuit, change):
+        if change is not None:
+            for inst in self.instrumentation:
+                inst.circuit_changed(circuit.origin, *change)
+
+    @metafunc
+    async def _wait_to_send(self, bounded):
+        """Waits until the memory budget, rate limit and concurrency limit
+        allow sending a request. Returns the concurrency limit's token, if
+        any."""
+        budget = self.memory_budget
+        if budget is not None:
+            await bounded(budget.wait())
+        try:
+            if self.rate_limiter is not None:
+                await bounded(self.rate_limiter.acquire())
+            if self.concurrency is not None:
+                return await bounded(self.concurrency.acquire())
+            return None
+        except BaseException:
+            if budget is not None:
+                budget.admitted()
+            raise
+
+    @metafunc
+    def _report_concurrency(self):
+        stats = self.stats_collector
+        if stats is not None:
+            stats.set_gauge('concurrency_limit', int(self.concurrency.limit))
+            stats.set_gauge('requests_in_flight', self.concurrency.in_flight)
 
 
 class RequestBuilder(object):
@@ -88,6 +338,7 @@ class RequestBuilder(object):
         self.site = site
         self.spec = rag(site, 'spec')
         self.path = path
+        self.children = {}
 
     @metafunc
     def __repr__(self):
@@ -104,6 +355,12 @@ class RequestBuilder(object):
                             " (Forgot to use '.get()' ?)")
         elif path[-1] == 'request':
             method, = args
+        elif path[-1] == 'prepare':
+            method, = args
+            if method not in METHODS:
+                raise TypeError(
+                    "{0!r} is not a request method".format(method))
+            return RequestTemplate(self.site, method, path[:-1])
         else:
             *path, method = path
             kwargs['params'] = params
@@ -118,7 +375,50 @@ class RequestBuilder(object):
     def __getitem__(self, name):
         return RequestBuilder(self.site, self.path + (name,))
 
-    __getattribute__ = getattribute_common(__getitem__)
+    __getattribute__ = getattribute_common(metafunc(_cached_child))
+
+
+class RequestTemplate(object):
+    """A request whose URL is built once, save for its placeholders.
+
+    Obtained with ``site.path.to.resource.prepare(method)``. Path segments
+    may contain `str.format` replacement fields::
+
+        issues = site.repos['{owner}']['{repo}'].issues.prepare('get')
+        req = issues(owner='epsy', repo='napper', state='open')
+
+    Keyword arguments that fill a replacement field are substituted into
+    the URL, the others are sent as query parameters. Literal braces in
+    path segments must be doubled.
+    """
+    def __init__(self, site, method, path):
+        self.site = site
+        self.method = method
+        self.url = rag(site, 'spec').join_path_template(path)
+        self.endpoint = '/' + '/'.join(path)
+        self.fields = frozenset(
+            field for _, field, _, _ in string.Formatter().parse(self.url)
+            if field is not None)
+
+    def __repr__(self):
+        return '<RequestTemplate [{0} {1}]>'.format(
+            self.method.upper(), self.url)
+
+    def __call__(self, *args, **params):
+        url = self.url
+        if self.fields:
+            try:
+                url = url.format_map(
+                    {field: params.pop(field) for field in self.fields})
+            except KeyError as exc:
+                raise TypeError("Missing value for placeholder {0}"
+                                .format(exc.args[0])) from None
+        kwargs = {'params': params}
+        if args:
+            kwargs['data'], = args
+        ret = Request(self.site, self.method, url, **kwargs)
+        ret.endpoint = self.endpoint
+        return ret
 
 
 class Request(object):
@@ -127,11 +427,18 @@ class Request(object):
         :param site: a `Site` instance passed through `.util.m`
         :param method: a request method ('get', 'post', ...)
         :param url: a full request URL
+
+        A ``data`` keyword argument that is a file, a memory map or an
+        async iterator is streamed, see `.body`.
         """
         self.site = site
         self.method = method.upper()
         self.url = url
+        if kwargs.get('data') is not None:
+            kwargs['data'] = stream_body(kwargs['data'])
         self.kwargs = kwargs
+        self.timings = (RequestTimings() if rag(site, 'instrumentation')
+                        else None)
 
     def __repr__(self):
         return '<Request [{0} {1}]>'.format(
@@ -146,22 +453,134 @@ class Request(object):
 
     response_type = JsonResponse()
 
+    endpoint = None
+    """What the request is accounted under in statistics. Derived from
+    the URL if None."""
+
+    @metafunc
+    def _stage(self, name):
+        timings = self.timings
+        if timings is None:
+            return null_stage
+        return Stage(self.site.instrumentation, self._real_object,
+                     timings, name)
+
+    retry = None
+    """A `.retry.RetryPolicy` for this request. If None, the session's
+    policy is used. If False, the request is never retried."""
+
+    timeout = None
+    """A `.timeout.Timeout` for this request. If None, the session's is
+    used."""
+
+    deadline = None
+    """A `.timeout.Deadline` for this request, also applied to the
+    requests chained from it and to the page fetches of its paginated
+    response."""
+
+    _deadline = None
+
+    @metafunc
+    def _timeout(self):
+        timeout = self.timeout
+        if timeout is None:
+            timeout = self.site.timeout
+        return timeout
+
+    @metafunc
+    def _past_deadline(self, delay):
+        deadline = self._deadline
+        return deadline is not None and delay >= deadline.remaining()
+
+    @metafunc
+    async def _attempt(self):
+        kwargs = self.kwargs
+        timeout = self._timeout()
+        headers_deadline = None
+        if timeout is not None:
+            client_timeout = timeout.client_timeout()
+            if client_timeout is not None:
+                kwargs = dict(kwargs, timeout=client_timeout)
+            if timeout.headers is not None:
+                headers_deadline = Deadline(timeout.headers)
+        with self._stage('response') as timings:
+            if timings is not None:
+                kwargs = dict(kwargs, trace_request_ctx=timings)
+            r = await self.site._request(
+                self.method, self.url, request=self._real_object,
+                headers_deadline=headers_deadline, deadline=self._deadline,
+                **kwargs)
+            if timings is not None:
+                timings.status = r.status
+        return r
+
     @run_once_as_task
     @metafunc
     async def response(self):
-        self._response = r = await self.site._request(
-            self.method, self.url, **self.kwargs)
+        timeout = self._timeout()
+        if timeout is not None and timeout.total is not None:
+            self._deadline = Deadline.earliest(
+                self.deadline, Deadline(timeout.total))
+        else:
+            self._deadline = self.deadline
+        policy = self.retry
+        if policy is None:
+            policy = self.site.retry
+        if not policy:
+            self._response = r = await self._attempt()
+            return r
+        policy.started()
+        attempt = 0
+        while True:
+            try:
+                r = await self._attempt()
+            except Exception as exc:
+                delay = policy.delay_for_exception(exc, attempt)
+                if delay is None or self._past_deadline(delay):
+                    raise
+            else:
+                delay = policy.delay_for_response(r, attempt, self.expected)
+                if delay is None or self._past_deadline(delay):
+                    break
+                await r.release()
+            attempt += 1
+            stats = self.site.stats_collector
+            if stats is not None:
+                stats.incr(self._real_object, 'retries')
+            await asyncio.sleep(delay)
+        self._response = r
         return r
 
     @run_once_as_task
     @metafunc
     async def parsed_response(self):
-        return await self.response_type.parse_response(await self.response())
+        response = await self.response()
+        timeout = self._timeout()
+        seconds = None if timeout is None else timeout.parse
+        max_size = self.response_type.max_size
+        if max_size is None:
+            max_size = self.site.max_body_size
+        budget = self.site.memory_budget
+        with self._stage('parse'):
+            if max_size is not None or budget is not None:
+                response = LimitedResponse(response, max_size, budget)
+            try:
+                return await within(
+                    self.response_type.parse_response(response),
+                    seconds, 'parse', self._deadline)
+            except RequestTimeoutError:
+                await response.release()
+                raise
+            finally:
+                if budget is not None:
+                    response.free()
 
     @run_once_as_task
     @metafunc
     async def upgraded_response(self):
-        return self.response_type.upgrade(await self.parsed_response(), self)
+        parsed = await self.parsed_response()
+        with self._stage('upgrade'):
+            return self.response_type.upgrade(parsed, self)
 
     expected = http.Success
 
@@ -181,10 +600,26 @@ class Request(object):
 
     __iter__ = __await__ # compatibility with yield from (i.e. in __await__)
 
-    async def __aiter__(self):
+    def __aiter__(self):
         """Iterate over the elements returned from the request"""
-        resp = await self
-        return await type(resp).__aiter__(resp)
+        return RequestIterator(self)
+
+
+class RequestIterator:
+    """Sends a request once iteration starts, then iterates over the
+    elements it returned"""
+    def __init__(self, request):
+        self.request = request
+        self.itor = None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.itor is None:
+            resp = await self.request
+            self.itor = await get_aiter(resp)
+        return await type(self.itor).__anext__(self.itor)
 
 
 # def find_permalink(obj, name):
@@ -237,7 +672,11 @@ class MultiRequestBuilder(object):
 
     @metafunc
     def __await__(self):
-        ret = yield from self.datasource
+        datasource = self.datasource
+        deadline = None
+        if isinstance(datasource, Request):
+            deadline = rag(datasource, 'deadline')
+        ret = yield from datasource
         for typ, *args in self.actions:
             if typ == 'attr':
                 attr, = args
@@ -247,7 +686,11 @@ class MultiRequestBuilder(object):
                 ret = ret[key]
             elif typ == 'call':
                 fargs, fkwargs = args
-                ret = yield from ret(*fargs, **fkwargs)
+                ret = ret(*fargs, **fkwargs)
+                if deadline is not None and isinstance(ret, Request):
+                    ret.deadline = Deadline.earliest(
+                        rag(ret, 'deadline'), deadline)
+                ret = yield from ret
             else:
                 raise NotImplementedError('Unknown action ' + typ)
         #while not isinstance(ret, JsonResponse):
@@ -1,22 +1,37 @@
 # napper -- A REST Client for Python
 # Copyright (C) 2016 by Yann Kaiser and contributors.
 # See AUTHORS and COPYING for details.
-import json
+import asyncio
 import collections.abc
 
 import aiohttp
 
-from . import request, restspec
+from . import columns, jsonparse, request, restspec
 from .util import requestmethods, rag, getattribute_dict, metafunc, METHODS, UniversalDetector
 
 
 class ResponseType:
+    """Reads responses and upgrades what was read.
+
+    :param max_size: the largest body in bytes that responses of this
+        type may have, or None to use the session's ``max_body_size``.
+        Larger bodies raise `.errors.BodyTooLargeError`.
+    """
+    max_size = None
+
+    def __init__(self, *, max_size=None):
+        self.max_size = max_size
+
     async def parse_response(self, response):
         return response
 
     def upgrade(self, data, request):
         return data
 
+    def upgrade_many(self, data, request):
+        """Upgrades each item of ``data``"""
+        return [self.upgrade(item, request) for item in data]
+
 
 class TextResponse(ResponseType):
     def __init__(self, *, encoding=None, **kwargs):
@@ -34,16 +49,50 @@ class BytesResponse(ResponseType):
 
 
 class JsonResponse(TextResponse):
+    """Parses responses as JSON.
+
+    :param offload_size: bodies of at least this many characters are
+        parsed so that other requests keep being served meanwhile. None,
+        the default, parses every body in one go on the event loop.
+    :param executor: a `concurrent.futures.Executor` parsing the bodies
+        above ``offload_size``, or None to parse them on the loop with
+        `.jsonparse.loads_in_slices`. The standard `json` module holds
+        the GIL while parsing, and results from a process pool must be
+        unpickled, so the latter usually stalls the loop the least.
+    :param lazy: if true, objects and arrays are parsed with
+        `.jsonparse.lazy_loads`, their values only when first looked up.
+        This saves memory when only a few fields of large documents are
+        read. ``offload_size`` is then ignored.
+    """
+    def __init__(self, *, offload_size=None, executor=None, lazy=False,
+                 **kwargs):
+        super().__init__(**kwargs)
+        self.offload_size = offload_size
+        self.executor = executor
+        self.lazy = lazy
+
     async def parse_response(self, response):
-        return json.loads(await super().parse_response(response))
+        text = await super().parse_response(response)
+        if self.lazy:
+            return jsonparse.lazy_loads(text)
+        if self.offload_size is None or len(text) < self.offload_size:
+            return jsonparse.loads(text)
+        if self.executor is None:
+            return await jsonparse.loads_in_slices(text)
+        return await asyncio.get_event_loop().run_in_executor(
+            self.executor, jsonparse.loads, text, True)
 
     def upgrade(self, data, request):
         return upgrade_object(super().upgrade(data, request), request)
 
+    def upgrade_many(self, data, request):
+        return upgrade_objects(data, request)
+
 
 class DrippingResponse(ResponseType):
     def __init__(self, item_type, *, separator=b'\n', include_separator=True,
-                                     remainder='return'):
+                                     remainder='return', **kwargs):
+        super().__init__(**kwargs)
         self.item_type = item_type
         self.separator = separator
         self.include_separator = include_separator
@@ -70,24 +119,21 @@ class DrippedTextResponse(TextResponse):
         response = dripper.response
 
         content_type = response.headers.get(aiohttp.hdrs.CONTENT_TYPE, '').lower()
-        _, _, _, params = aiohttp.helpers.parse_mimetype(content_type)
+        params = aiohttp.helpers.parse_mimetype(content_type).parameters
         self.encoding = params.get('charset')
 
         if self.encoding is not None:
             return self.encoding
 
-        reader = dripper.response.content
-
         detector = UniversalDetector()
         detector.feed(value)
-        detector.feed(reader._buffer)
-
-        pos = len(reader._buffer)
+        detector.feed(bytes(dripper._buffer))
 
-        while not detector.done and not reader._eof:
-            await reader._wait_for_data('DrippedTextResponse._get_encoding')
-            detector.feed(reader._buffer[pos:])
-            pos = len(reader._buffer)
+        while not detector.done:
+            chunk = await dripper._read_more()
+            if not chunk:
+                break
+            detector.feed(chunk)
 
         if not detector.done:
             detector.close()
@@ -114,11 +160,14 @@ class ResponseReleaser:
 
 
 class Dripper:
+    chunk_size = 2 ** 16
+
     def __init__(self, response_type, response, request):
         self.response_type = response_type
         self.response = response
         self.request = request
-        self._buffer = b''
+        self._buffer = bytearray()
+        self._eof = False
         self._finished = False
 
         self.item_type = self.response_type.item_type
@@ -137,21 +186,27 @@ class Dripper:
         else:
             return type('Dripped' + typ.__name__, (typ, mixin), {})
 
-    async def __aiter__(self):
+    def __aiter__(self):
         return self
 
     async def __anext__(self):
         if self._finished:
             raise StopAsyncIteration
-        reader = self.response.content
         rt = self.response_type
         sep = rt.separator
-        while sep not in reader._buffer:
-            if reader._eof:
+        buf = self._buffer
+        start = 0
+        while True:
+            end = buf.find(sep, start)
+            if end >= 0:
+                break
+            start = max(0, len(buf) - len(sep) + 1)
+            if not await self._read_more():
                 self._finished = True
                 if rt.remainder == 'return':
-                    remainder = await reader.read()
-                    if remainder:
+                    if buf:
+                        remainder = bytes(buf)
+                        del buf[:]
                         return await self.return_value(remainder)
                 elif rt.remainder == 'ignore':
                     pass
@@ -160,9 +215,22 @@ class Dripper:
                 else:
                     raise ValueError("Bad value for remainder handling")
                 raise StopAsyncIteration
-            await reader._wait_for_data('dripper.__anext__')
-        return await self.return_value(
-            await reader.read(len(sep) + reader._buffer.index(sep)))
+        end += len(sep)
+        value = bytes(buf[:end])
+        del buf[:end]
+        return await self.return_value(value)
+
+    async def _read_more(self):
+        """Reads the next chunk of the body into the buffer and returns
+        it, or returns an empty chunk if the body is over"""
+        if self._eof:
+            return b''
+        chunk = await self.response.content.read(self.chunk_size)
+        if chunk:
+            self._buffer += chunk
+        else:
+            self._eof = True
+        return chunk
 
     async def return_value(self, value):
         parsed = await self.item_type.parse_response((self, value))
@@ -176,16 +244,60 @@ def upgrade_object(val, request, context=None):
     context.setdefault('root', val)
     if spec.is_paginator_object(val, context):
         return PaginatorObject(val, request)
-    elif isinstance(val, dict):
+    return _upgrade_value(val, request)
+
+
+def _upgrade_value(val, request):
+    if isinstance(val, (dict, jsonparse.LazyObject)):
         return ResponseObject(val, request)
     elif isinstance(val, str):
         return PermalinkString(val, request=request)
-    elif isinstance(val, list):
+    elif isinstance(val, (list, jsonparse.LazyArray)):
         return ResponseList(val, request=request)
     else:
         return val
 
 
+def upgrade_objects(vals, request):
+    """Upgrades each of ``vals`` like `upgrade_object`, evaluating the
+    site's restspec over all of them at once"""
+    spec = request.site.spec
+    vals = list(vals)
+    paginators = spec.is_paginator_object.many(vals, default=False)
+    ret = []
+    for val, is_paginator in zip(vals, paginators):
+        if is_paginator:
+            ret.append(PaginatorObject(val, request))
+        else:
+            ret.append(_upgrade_value(val, request))
+    _find_permalinks(
+        [(obj, val) for obj, val in zip(ret, vals) if isinstance(val, dict)
+         and isinstance(obj, ResponseObject)],
+        spec)
+    return ret
+
+
+def _find_permalinks(objects, spec):
+    """Records which string attributes of each `ResponseObject` in
+    ``objects``, given with its value, are permalinks, evaluating the
+    restspec for all of them at once"""
+    strings = []
+    contexts = []
+    for obj, val in objects:
+        for name, item in val.items():
+            if isinstance(item, str):
+                strings.append(item)
+                contexts.append({'attribute': name, 'parent': obj})
+    flags = iter(spec.is_permalink_attr.many(strings, contexts))
+    for obj, val in objects:
+        obj.permalinks = {
+            name for name, item in val.items()
+            if isinstance(item, str) and next(flags)}
+
+
+_UPGRADE_BATCH = 256
+
+
 class ResponseList(collections.abc.Sequence):
     def __init__(self, val, request):
         self.request = request
@@ -197,12 +309,23 @@ class ResponseList(collections.abc.Sequence):
     def __getitem__(self, i):
         return self.request.response_type.upgrade(self.val[i], self.request)
 
+    def __iter__(self):
+        upgrade_many = self.request.response_type.upgrade_many
+        for start in range(0, len(self.val), _UPGRADE_BATCH):
+            yield from upgrade_many(self.val[start:start + _UPGRADE_BATCH],
+                                    self.request)
+
     def __len__(self):
         return len(self.val)
 
-    async def __aiter__(self):
+    def __aiter__(self):
         return ResponseListIterator(self)
 
+    async def to_columns(self, fields, **kwargs):
+        """Collects fields of every item into columns. See
+        `.columns.collect`."""
+        return await columns.collect(self, fields, **kwargs)
+
 
 class PaginatorObject(collections.abc.Sequence):
     def __init__(self, val, request):
@@ -229,21 +352,35 @@ class PaginatorObject(collections.abc.Sequence):
             raise IndexError(i)
 
     async def _fetch_next_page(self):
-        try:
-            url = self.spec.paginator_next_url(self.pages[-1])
-        except restspec.NoValue:
+        data = await self._page_after(self.pages[-1])
+        if data is None:
             self.done = True
             return
-        req = request.Request(self.request.site, 'get', url)
-        await req
-        data = await rag(req, 'parsed_response')()
         self.pages.append(data)
         self.cache.extend(self.spec.paginator_content(data))
 
+    async def _page_after(self, page):
+        """Fetches the page following ``page``, or returns None if it is
+        the last one"""
+        try:
+            url = self.spec.paginator_next_url(page)
+        except restspec.NoValue:
+            return None
+        req = request.Request(self.request.site, 'get', url)
+        req.timeout = self.request.timeout
+        req.deadline = self.request.deadline
+        await req
+        return await rag(req, 'parsed_response')()
+
+    async def to_columns(self, fields, **kwargs):
+        """Collects fields of every item into columns, fetching the
+        remaining pages without keeping them. See `.columns.collect`."""
+        return await columns.collect(self, fields, **kwargs)
+
     def __len__(self, i):
         return len(self.val)
 
-    async def __aiter__(self):
+    def __aiter__(self):
         return PaginatorIterator(self)
 
 
@@ -252,7 +389,7 @@ class PaginatorIterator:
         self.p = p
         self.index = 0
 
-    async def __aiter__(self):
+    def __aiter__(self):
         return self
 
     async def __anext__(self):
@@ -268,7 +405,7 @@ class ResponseListIterator:
     def __init__(self, val):
         self.ito = iter(val)
 
-    async def __aiter__(self):
+    def __aiter__(self):
         return self
 
     async def __anext__(self):
@@ -295,6 +432,7 @@ class ResponseObject(collections.abc.Mapping):
     def __init__(self, value, request):
         self.value = value
         self.request = request
+        self.permalinks = None
 
     @metafunc
     def __repr__(self):
@@ -337,8 +475,12 @@ class ResponseObject(collections.abc.Mapping):
         item = self.value[name]
         spec = self.request.site.spec
         if isinstance(item, str):
-            if spec.is_permalink_attr(
-                    item, {'attribute': name, 'parent': self._real_object}):
+            if self.permalinks is not None:
+                is_permalink = name in self.permalinks
+            else:
+                is_permalink = spec.is_permalink_attr(
+                    item, {'attribute': name, 'parent': self._real_object})
+            if is_permalink:
                 return PermalinkString(item, request=self.request)
             return item
         return upgrade_object(item, self.request,
@@ -60,6 +60,80 @@ def no_value(*args, **kwargs):
     raise NoValue
 
 
+_missing = object()
+
+
+class _Contexts:
+    """The contexts of the values `Fetcher.many` evaluates together.
+
+    They are shared, given per value, or made of each value as ``root``
+    and are only built as dicts for steps that need them whole.
+    """
+    def __init__(self, roots, bases=None, shared=None, values=None):
+        self.roots = roots
+        self.bases = bases
+        self.shared = shared
+        self.values = values
+
+    def get(self, i):
+        if self.bases is not None:
+            context = self.bases[i]
+        elif self.shared is not None:
+            context = self.shared
+        else:
+            root = self.roots[i]
+            return {'root': root,
+                    'value': root if self.values is None else self.values[i]}
+        if self.values is not None:
+            context = dict(context)
+            context['value'] = self.values[i]
+        return context
+
+    def lookup(self, key):
+        if key == 'value' and self.values is not None:
+            return self.values
+        if self.bases is not None:
+            return [base.get(key, _missing) for base in self.bases]
+        if self.shared is not None:
+            return [self.shared.get(key, _missing)] * len(self.roots)
+        if key in ('root', 'value'):
+            return self.roots
+        return [_missing] * len(self.roots)
+
+    def select(self, indexes):
+        def pick(seq):
+            return None if seq is None else [seq[i] for i in indexes]
+        return _Contexts(pick(self.roots), pick(self.bases), self.shared,
+                         pick(self.values))
+
+    def with_values(self, values):
+        return _Contexts(self.roots, self.bases, self.shared, values)
+
+
+def _constant(fetcher):
+    """Returns the value ``fetcher`` always returns, or `_missing`"""
+    steps = getattr(fetcher, 'steps', ())
+    if len(steps) == 1 and steps[0].func.__name__ == 'step_value':
+        return steps[0].args[0]
+    return _missing
+
+
+def _evaluate(fetcher, values, contexts):
+    """Evaluates a step's argument for each value"""
+    constant = _constant(fetcher)
+    if constant is not _missing:
+        return [constant] * len(values)
+    if isinstance(fetcher, Fetcher):
+        return fetcher._many(values, contexts)
+    ret = []
+    for i, value in enumerate(values):
+        try:
+            ret.append(fetcher(value, contexts.get(i)))
+        except NoValue:
+            ret.append(_missing)
+    return ret
+
+
 class Matcher:
     def __init__(self):
         self.pattern = None
@@ -127,6 +201,37 @@ class Hint:
         return '<Hint []>'.format(self.fmt)
 
 
+class RateLimit:
+    """The request rate a site allows: ``requests`` per ``per`` seconds,
+    in bursts of up to ``burst`` requests."""
+    def __init__(self):
+        self.requests = None
+        self.per = 1
+        self.burst = 1
+        self.remaining_header = "X-RateLimit-Remaining"
+        self.reset_header = "X-RateLimit-Reset"
+
+    @classmethod
+    def from_restspec(cls, obj):
+        if obj is None:
+            return None
+        ret = cls()
+        with obj:
+            ret.requests = obj['requests']
+            ret.per = obj.get('per', ret.per)
+            ret.burst = obj.get('burst', ret.burst)
+            ret.remaining_header = obj.get(
+                'remaining_header', ret.remaining_header)
+            ret.reset_header = obj.get('reset_header', ret.reset_header)
+        if ret.requests <= 0 or ret.per <= 0 or ret.burst < 1:
+            raise ValueError("Rate limit must allow some requests")
+        return ret
+
+    def __repr__(self):
+        return '<RateLimit [{0.requests}/{0.per}s burst={0.burst}]>'.format(
+            self)
+
+
 @enum.unique
 class Conversion(enum.Enum):
     RAW = 0
@@ -251,6 +356,153 @@ class Fetcher:
             context['value'] = value
         return value
 
+    def many(self, values, context=None, default=None):
+        """Evaluates the fetcher on each of ``values`` in one pass.
+
+        ``context`` is shared by all values, or is a sequence with one
+        context per value. If it is None, each value is its own ``root``.
+        Returns a list of the results, with ``default`` for values the
+        fetcher has none for.
+
+        Each step runs over all values before the next one. Arguments
+        that do not depend on the value, such as attribute names, are
+        evaluated once, and matchers run once per distinct string.
+        """
+        values = list(values)
+        if context is None:
+            contexts = _Contexts(values)
+        elif isinstance(context, abc.Mapping):
+            contexts = _Contexts(values, shared=context)
+        else:
+            contexts = _Contexts(values, bases=list(context))
+            if len(contexts.bases) != len(values):
+                raise ValueError("Need one context per value")
+        return [default if result is _missing else result
+                for result in self._many(values, contexts)]
+
+    def _many(self, values, contexts):
+        count = len(values)
+        positions = None
+        for step in self.steps:
+            try:
+                many = getattr(self, '_many_' + step.func.__name__)
+            except AttributeError:
+                many = self._many_each
+            results = many(step, values, contexts)
+            kept = [i for i, result in enumerate(results)
+                    if result is not _missing]
+            if len(kept) < len(results):
+                positions = kept if positions is None \
+                            else [positions[i] for i in kept]
+                results = [results[i] for i in kept]
+                contexts = contexts.select(kept)
+            values = results
+            contexts = contexts.with_values(values)
+        if positions is None:
+            return values
+        ret = [_missing] * count
+        for i, value in zip(positions, values):
+            ret[i] = value
+        return ret
+
+    def _many_each(self, step, values, contexts):
+        ret = []
+        for i, value in enumerate(values):
+            try:
+                ret.append(step(value, contexts.get(i)))
+            except NoValue:
+                ret.append(_missing)
+        return ret
+
+    def _many_step_value(self, step, values, contexts):
+        return [step.args[0]] * len(values)
+
+    _many_always = _many_step_value
+
+    def _many_step_attr(self, step, values, contexts):
+        ret = []
+        for value, name in zip(values, _evaluate(step.args[0], values,
+                                                 contexts)):
+            try:
+                ret.append(_missing if name is _missing else value[name])
+            except (KeyError, TypeError, IndexError):
+                ret.append(_missing)
+        return ret
+
+    def _many_step_context(self, step, values, contexts):
+        key = _constant(step.args[0])
+        if key is not _missing:
+            return contexts.lookup(key)
+        keys = _evaluate(step.args[0], values, contexts)
+        return [_missing if key is _missing
+                else contexts.get(i).get(key, _missing)
+                for i, key in enumerate(keys)]
+
+    def _many_step_attr_exists(self, step, values, contexts):
+        ret = []
+        for value, name in zip(values, _evaluate(step.args[0], values,
+                                                 contexts)):
+            if name is _missing:
+                ret.append(False)
+                continue
+            try:
+                value[name]
+            except (KeyError, TypeError):
+                ret.append(False)
+            else:
+                ret.append(True)
+        return ret
+
+    def _many_step_is_eq(self, step, values, contexts):
+        return [False if arg is _missing else arg == value
+                for value, arg in zip(values, _evaluate(step.args[0], values,
+                                                        contexts))]
+
+    def _many_step_matches(self, step, values, contexts):
+        matcher = step.args[0]
+        seen = {}
+        ret = []
+        for value in values:
+            if isinstance(value, str):
+                result = seen.get(value)
+                if result is None:
+                    result = seen[value] = matcher(value)
+            else:
+                result = matcher(value)
+            ret.append(result)
+        return ret
+
+    def _many_step_not(self, step, values, contexts):
+        return [False if result is _missing else not result
+                for result in _evaluate(step.args[0], values, contexts)]
+
+    def _many_step_all(self, step, values, contexts):
+        return self._many_shortcircuit(step.args[0], values, contexts, False)
+
+    def _many_step_any(self, step, values, contexts):
+        return self._many_shortcircuit(step.args[0], values, contexts, True)
+
+    def _many_shortcircuit(self, conds, values, contexts, stop):
+        """Evaluates `all` (``stop=False``) or `any` (``stop=True``) of
+        ``conds``, only on the values they are still undecided for"""
+        ret = [not stop] * len(values)
+        pending = range(len(values))
+        for cond in conds:
+            if not pending:
+                break
+            results = _evaluate(cond, [values[i] for i in pending],
+                                contexts.select(pending))
+            undecided = []
+            for i, result in zip(pending, results):
+                if result is _missing:
+                    ret[i] = False
+                elif bool(result) == stop:
+                    ret[i] = stop
+                else:
+                    undecided.append(i)
+            pending = undecided
+        return ret
+
     @boolean_result
     def always(self, ret, value, context):
         return ret
@@ -333,6 +585,9 @@ class Fetcher:
 
 
 class Conditional(Fetcher):
+    def many(self, values, context=None, default=False):
+        return super().many(values, context, default)
+
     @classmethod
     def from_restspec(cls, obj):
         if obj in ["always", "never", None]:
@@ -372,6 +627,7 @@ class RestSpec:
         self.permalink_hint = no_value
         self.get_object_permalink = no_value
         self.paginator_next_url = no_value
+        self.rate_limit = None
 
     @classmethod
     def from_file(cls, f):
@@ -391,6 +647,7 @@ class RestSpec:
                 Fetcher.from_restspec(obj.get('permalink_object'))
             #self.permalink_hint = Hint.from_restspec(obj.get('permalink_object'))
             self._read_paginator(obj.get('paginated_object'))
+            self.rate_limit = RateLimit.from_restspec(obj.get('rate_limit'))
 
     def _read_paginator(self, obj):
         if obj is None:
@@ -403,5 +660,11 @@ class RestSpec:
     def join_path(self, path):
         return self.address + '/' + '/'.join(path)
 
+    def join_path_template(self, path):
+        """Like `join_path`, but the result is a `str.format` template
+        where only the path segments may have replacement fields."""
+        address = self.address.replace('{', '{{').replace('}', '}}')
+        return address + '/' + '/'.join(path)
+
     def is_same_origin(self, url):
         return url.startswith(self.address)
@@ -0,0 +1,177 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Retrying requests that failed with a transient status.
+
+Pass a `RetryPolicy` to the session factory, or set it on a single
+request::
+
+    async with factory(retry=RetryPolicy()) as site:
+        req = site.path.get()
+        req.retry = RetryPolicy({http.ServerError: 5})
+
+Only the ``'response'`` stage of the request is run again: the response
+is released and the same request is sent after a delay. The delay grows
+exponentially with random jitter, unless the server specified one in a
+``Retry-After`` header.
+"""
+import email.utils
+import random
+import time
+
+from .errors import http
+
+
+_unset = object()
+
+
+DEFAULT_STATUSES = {
+    http.TooManyRequests: 5,
+    http.ServiceUnavailable: 3,
+    http.BadGateway: 3,
+    http.GatewayTimeout: 3,
+}
+
+
+class RetryBudget:
+    """Caps retries at a fraction of the requests made.
+
+    Each first attempt deposits ``ratio`` tokens and each retry withdraws
+    one, so that when an upstream is failing the retries stop adding load
+    to it after a while. ``reserve`` tokens are available from the start
+    and the balance never exceeds ``reserve`` plus ``ratio`` times
+    ``window`` requests.
+    """
+    def __init__(self, ratio=0.2, reserve=10, window=1000):
+        self.ratio = ratio
+        self.capacity = reserve + ratio * window
+        self.tokens = float(reserve)
+
+    def __repr__(self):
+        return '<RetryBudget {0:.1f} tokens>'.format(self.tokens)
+
+    def deposit(self):
+        self.tokens = min(self.tokens + self.ratio, self.capacity)
+
+    def withdraw(self):
+        """Takes a token and returns True, or returns False if none
+        are left."""
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RetryPolicy:
+    """Decides whether and when to retry a request.
+
+    :param statuses: maps `.errors.http` status classes to the number of
+        times to retry responses of that class or its subclasses. The most
+        specific class wins, so ``{http.ServerError: 2,
+        http.NotImplemented: 0}`` retries all 5xx responses but 501.
+    :param exceptions: maps exception types raised while obtaining the
+        response, such as connection errors, to a number of retries.
+    :param backoff: the delay before the first retry, in seconds. It is
+        multiplied by ``multiplier`` for each further retry, up to
+        ``max_backoff``.
+    :param jitter: if true, the delay is drawn uniformly between 0 and the
+        computed backoff ("full jitter").
+    :param max_retry_after: delays requested by the server through
+        ``Retry-After`` are honoured up to this many seconds; the request
+        is not retried if the server asks for longer.
+    :param budget: a `RetryBudget` shared by all requests using this
+        policy, or None for no limit.
+    """
+    def __init__(self, statuses=None, *, exceptions=None, backoff=0.1,
+                 multiplier=2, max_backoff=30, jitter=True,
+                 max_retry_after=120, budget=_unset):
+        self.statuses = dict(DEFAULT_STATUSES if statuses is None
+                             else statuses)
+        self.exceptions = dict(exceptions or {})
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.max_retry_after = max_retry_after
+        self.budget = RetryBudget() if budget is _unset else budget
+
+    def __repr__(self):
+        return '<RetryPolicy {0}>'.format(', '.join(
+            '{0}={1}'.format(cls.__name__, n)
+            for cls, n in self.statuses.items()))
+
+    @staticmethod
+    def _lookup(table, cls):
+        for base in cls.__mro__:
+            try:
+                return table[base]
+            except KeyError:
+                pass
+        return 0
+
+    def backoff_delay(self, attempt):
+        """Returns the delay before retry number ``attempt + 1``"""
+        delay = min(self.backoff * self.multiplier ** attempt,
+                    self.max_backoff)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    def retry_after(self, response):
+        """Returns the delay requested by ``response``'s ``Retry-After``
+        header in seconds, or None."""
+        headers = getattr(response, 'headers', None)
+        if not headers:
+            return None
+        value = headers.get('Retry-After')
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if date is None:
+            return None
+        return max(date.timestamp() - time.time(), 0.0)
+
+    def started(self):
+        """Called on every first attempt"""
+        if self.budget is not None:
+            self.budget.deposit()
+
+    def _withdraw(self):
+        return self.budget is None or self.budget.withdraw()
+
+    def delay_for_response(self, response, attempt, expected=http.Success):
+        """Returns how long to wait before retrying after ``response``,
+        or None if it should not be retried.
+
+        :param attempt: how many retries were already made
+        :param expected: responses of this status class are never retried
+        """
+        cls = http.cls_for_code(response.status)
+        if issubclass(cls, expected):
+            return None
+        if attempt >= self._lookup(self.statuses, cls):
+            return None
+        delay = self.retry_after(response)
+        if delay is not None and delay > self.max_retry_after:
+            return None
+        if not self._withdraw():
+            return None
+        if delay is None:
+            return self.backoff_delay(attempt)
+        return delay
+
+    def delay_for_exception(self, exc, attempt):
+        """Returns how long to wait before retrying after ``exc`` was
+        raised, or None if it should be propagated."""
+        if attempt >= self._lookup(self.exceptions, type(exc)):
+            return None
+        if not self._withdraw():
+            return None
+        return self.backoff_delay(attempt)
@@ -0,0 +1,336 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Aggregated request statistics.
+
+Enable with ``factory(stats=True)`` and query with ``site.stats()``,
+which returns the session's `StatsCollector`. Statistics are kept per
+endpoint, that is per request method and path, and use a fixed amount of
+memory: latencies go into fixed-bucket `Histogram` objects and there is
+a cap on the number of endpoints tracked. Prefer request templates (see
+`napper.request.RequestTemplate`) for paths containing identifiers, as
+they are tracked under their template rather than one entry per URL.
+"""
+import bisect
+import collections
+import os
+import tempfile
+
+from .errors import http
+from .instrument import Instrumentation
+from .util import rag
+
+
+#: Upper bounds of the latency buckets, in seconds: 1ms to about 65s
+LATENCY_BUCKETS = tuple(0.001 * 2 ** (i / 2) for i in range(33))
+
+OTHER_ENDPOINT = '<other>'
+
+
+class Histogram:
+    """Counts observations in fixed buckets.
+
+    :param bounds: sorted upper bounds of the buckets. Values above the
+        last bound are counted in an extra overflow bucket.
+    """
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def __repr__(self):
+        return '<Histogram count={0} mean={1}>'.format(self.count, self.mean)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        if other.bounds != self.bounds:
+            raise ValueError("Cannot merge histograms with different buckets")
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.sum += other.sum
+
+    @property
+    def mean(self):
+        if not self.count:
+            return None
+        return self.sum / self.count
+
+    def percentile(self, pct):
+        """Estimates the value below which ``pct`` percent of the
+        observations fall, interpolating within the bucket."""
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                if i == len(self.bounds):
+                    return lower
+                return lower + (self.bounds[i] - lower) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+    def cumulative(self):
+        """Yields ``(upper bound, count of observations <= bound)``,
+        ending with ``(float('inf'), count)``."""
+        total = 0
+        for bound, n in zip(self.bounds + (float('inf'),), self.counts):
+            total += n
+            yield bound, total
+
+
+class EndpointStats:
+    """Statistics for one endpoint.
+
+    ``statuses`` maps the class `.errors.http.cls_for_code` returns for
+    each response's status, or the name of the exception raised when no
+    response was obtained, to a count. ``latency`` covers whole requests,
+    ``response_latency`` only the time until response headers arrived.
+    """
+    __slots__ = ('latency', 'response_latency', 'statuses', 'counters')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.response_latency = Histogram()
+        self.statuses = collections.Counter()
+        self.counters = collections.Counter()
+
+    def __repr__(self):
+        return '<EndpointStats {0}>'.format(self.summary())
+
+    def merge(self, other):
+        self.latency.merge(other.latency)
+        self.response_latency.merge(other.response_latency)
+        self.statuses.update(other.statuses)
+        self.counters.update(other.counters)
+
+    def count(self, cls=http.Any):
+        """Number of responses whose status class is ``cls`` or a
+        subclass, e.g. ``count(http.ClientError)``."""
+        return sum(n for key, n in self.statuses.items()
+                   if isinstance(key, type) and issubclass(key, cls))
+
+    def summary(self):
+        return {
+            'requests': self.latency.count,
+            'statuses': {getattr(k, '__name__', k): n
+                         for k, n in self.statuses.items()},
+            'latency': {
+                'mean': self.latency.mean,
+                'p50': self.latency.percentile(50),
+                'p90': self.latency.percentile(90),
+                'p99': self.latency.percentile(99),
+            },
+            'response_latency': {
+                'p50': self.response_latency.percentile(50),
+                'p95': self.response_latency.percentile(95),
+            },
+            'counters': dict(self.counters),
+        }
+
+
+def endpoint_key(request):
+    """Returns the name ``request`` is tracked under in statistics"""
+    endpoint = rag(request, 'endpoint')
+    if endpoint is None:
+        url = rag(request, 'url')
+        address = rag(request, 'site').spec.address
+        if url.startswith(address):
+            url = url[len(address):]
+        endpoint = url.partition('?')[0] or '/'
+    return rag(request, 'method') + ' ' + endpoint
+
+
+class StatsCollector(Instrumentation):
+    """Collects per-endpoint latency histograms and status counters.
+
+    :param max_endpoints: Number of endpoints tracked separately. Requests
+        to further endpoints are accounted under ``'<other>'``.
+    """
+    def __init__(self, max_endpoints=256):
+        self.max_endpoints = max_endpoints
+        self.endpoints = collections.OrderedDict()
+        self.gauges = {}
+        self.open_circuits = set()
+
+    def __repr__(self):
+        return '<StatsCollector [{0} endpoints]>'.format(len(self.endpoints))
+
+    def __getitem__(self, endpoint):
+        return self.endpoints[endpoint]
+
+    def __iter__(self):
+        return iter(self.endpoints)
+
+    def get(self, endpoint):
+        """Returns the `EndpointStats` for ``endpoint``, creating it or
+        falling back to ``'<other>'`` as needed."""
+        try:
+            return self.endpoints[endpoint]
+        except KeyError:
+            if len(self.endpoints) >= self.max_endpoints:
+                endpoint = OTHER_ENDPOINT
+            return self.endpoints.setdefault(endpoint, EndpointStats())
+
+    def stats_for(self, request):
+        return self.get(endpoint_key(request))
+
+    def stage_finished(self, request, stage, timings, exc):
+        if stage == 'response':
+            stats = self.stats_for(request)
+            if exc is None:
+                stats.statuses[http.cls_for_code(timings.status)] += 1
+                response = timings.response
+                if response is not None:
+                    stats.response_latency.observe(response)
+                return
+            stats.statuses[type(exc).__name__] += 1
+        elif stage != 'upgrade' and exc is None:
+            return
+        else:
+            stats = self.stats_for(request)
+        total = timings.total
+        if total is not None:
+            stats.latency.observe(total)
+
+    def circuit_changed(self, origin, old, new):
+        if new == 'closed':
+            self.open_circuits.discard(origin)
+        else:
+            self.open_circuits.add(origin)
+        self.set_gauge('circuits_open', len(self.open_circuits))
+
+    def incr(self, request, counter, n=1):
+        """Increments a named counter for the endpoint of ``request``"""
+        self.stats_for(request).counters[counter] += n
+
+    def set_gauge(self, name, value):
+        """Records the current value of a session-wide gauge"""
+        self.gauges[name] = value
+
+    def total(self):
+        """Returns the `EndpointStats` of all endpoints combined"""
+        ret = EndpointStats()
+        for stats in self.endpoints.values():
+            ret.merge(stats)
+        return ret
+
+    def count(self, cls=http.Any):
+        """Number of responses of status class ``cls`` on all endpoints"""
+        return self.total().count(cls)
+
+    def snapshot(self):
+        """Returns the statistics as plain data:
+        ``{endpoint: summary dict}``, plus ``'gauges'``."""
+        ret = {endpoint: stats.summary()
+               for endpoint, stats in self.endpoints.items()}
+        ret['gauges'] = dict(self.gauges)
+        return ret
+
+    def prometheus(self, prefix='napper'):
+        """Returns the statistics in the Prometheus text format"""
+        lines = []
+        name = prefix + '_requests_total'
+        lines.append('# HELP {0} Responses by endpoint and status class'
+                     .format(name))
+        lines.append('# TYPE {0} counter'.format(name))
+        for endpoint, stats in self.endpoints.items():
+            for status, n in sorted(stats.statuses.items(), key=_status_key):
+                lines.append('{0}{{endpoint="{1}",status="{2}"}} {3}'.format(
+                    name, _escape(endpoint),
+                    _escape(getattr(status, '__name__', status)), n))
+
+        self._histogram_lines(
+            lines, prefix + '_request_duration_seconds',
+            'Request latency by endpoint', 'latency')
+        self._histogram_lines(
+            lines, prefix + '_response_duration_seconds',
+            'Time until response headers by endpoint', 'response_latency')
+
+        counters = sorted({c for stats in self.endpoints.values()
+                           for c in stats.counters})
+        for counter in counters:
+            name = '{0}_{1}_total'.format(prefix, counter)
+            lines.append('# TYPE {0} counter'.format(name))
+            for endpoint, stats in self.endpoints.items():
+                if counter in stats.counters:
+                    lines.append('{0}{{endpoint="{1}"}} {2}'.format(
+                        name, _escape(endpoint), stats.counters[counter]))
+
+        for gauge, value in sorted(self.gauges.items()):
+            name = '{0}_{1}'.format(prefix, gauge)
+            lines.append('# TYPE {0} gauge'.format(name))
+            lines.append('{0} {1!r}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+
+    def _histogram_lines(self, lines, name, help, attr):
+        lines.append('# HELP {0} {1}'.format(name, help))
+        lines.append('# TYPE {0} histogram'.format(name))
+        for endpoint, stats in self.endpoints.items():
+            histogram = getattr(stats, attr)
+            label = 'endpoint="{0}"'.format(_escape(endpoint))
+            for bound, n in histogram.cumulative():
+                lines.append('{0}_bucket{{{1},le="{2}"}} {3}'.format(
+                    name, label, _format_bound(bound), n))
+            lines.append('{0}_sum{{{1}}} {2!r}'.format(
+                name, label, histogram.sum))
+            lines.append('{0}_count{{{1}}} {2}'.format(
+                name, label, histogram.count))
+
+    def write_prometheus(self, path, prefix='napper'):
+        """Atomically writes `prometheus` output to ``path``, e.g. for the
+        node exporter's textfile collector."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.napper-stats-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.prometheus(prefix))
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    async def serve_prometheus(self, port, host='127.0.0.1',
+                               prefix='napper'):
+        """Serves `prometheus` output over HTTP on ``host:port``.
+
+        :returns: the `aiohttp.web.AppRunner`; call its ``cleanup``
+            method to stop serving.
+        """
+        from aiohttp import web
+
+        async def metrics(request):
+            return web.Response(text=self.prometheus(prefix),
+                                content_type='text/plain')
+
+        app = web.Application()
+        app.router.add_get('/metrics', metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+def _status_key(item):
+    status = item[0]
+    return (getattr(status, 'code', 1000), getattr(status, '__name__', status))
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _format_bound(bound):
+    if bound == float('inf'):
+        return '+Inf'
+    return '{0:.6g}'.format(bound)
@@ -0,0 +1,123 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Using napper from threaded, blocking code.
+
+`SyncSession` runs an event loop on a thread of its own, with one
+session whose connection pool is shared by every thread using it::
+
+    client = SyncSession(factory)
+    site = client.site
+    item = client.wait(site.items['1'].get())
+    for entry in client.iterate(site.pages.get()):
+        ...
+    client.close()
+
+Requests are built as usual from ``client.site`` and objects returned by
+`SyncSession.wait`, in any thread; only waiting for them goes through
+the session.
+"""
+import asyncio
+import concurrent.futures
+import threading
+
+from .util import get_aiter
+
+
+_unset = object()
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+async def _take(itor, n):
+    items = []
+    anext = type(itor).__anext__
+    for _ in range(n):
+        try:
+            items.append(await anext(itor))
+        except StopAsyncIteration:
+            return items, True
+    return items, False
+
+
+class SyncSession:
+    """A session usable from any thread, blocking until results are in.
+
+    :param factory: a `.SessionFactory`, called on the loop's thread with
+        the remaining keyword arguments
+    :param timeout: how long calls wait for a result by default, in
+        seconds, or None to wait as long as it takes
+    """
+    def __init__(self, factory, *, timeout=None, **kwargs):
+        self.timeout = timeout
+        self.loop = asyncio.new_event_loop()
+        self._manager = None
+        self._thread = threading.Thread(
+            target=self._run_loop, name='napper-sync', daemon=True)
+        self._thread.start()
+        try:
+            self.site = self.wait(self._open(factory, kwargs))
+        except BaseException:
+            self.close()
+            raise
+
+    def __repr__(self):
+        return '<SyncSession {0!r}>'.format(self.site)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _open(self, factory, kwargs):
+        self._manager = factory(**kwargs)
+        return await type(self._manager).__aenter__(self._manager)
+
+    def wait(self, awaitable, timeout=_unset):
+        """Waits for ``awaitable``, usually a request, on the session's
+        loop and returns its result.
+
+        If ``timeout`` runs out, `concurrent.futures.TimeoutError` is
+        raised and the awaitable is cancelled.
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError(
+                "SyncSession.wait called from the session's own loop")
+        fut = asyncio.run_coroutine_threadsafe(_await(awaitable), self.loop)
+        try:
+            return fut.result(self.timeout if timeout is _unset else timeout)
+        except concurrent.futures.TimeoutError:
+            fut.cancel()
+            raise
+
+    def iterate(self, obj, prefetch=64):
+        """Iterates over ``obj``, such as a request for a paginated
+        collection, fetching up to ``prefetch`` items per trip to the
+        loop."""
+        itor = self.wait(get_aiter(obj))
+        while True:
+            items, done = self.wait(_take(itor, prefetch))
+            yield from items
+            if done:
+                return
+
+    def close(self):
+        """Closes the session and stops its thread"""
+        if self._thread is None:
+            return
+        try:
+            if self._manager is not None:
+                self.wait(type(self._manager).__aexit__(
+                    self._manager, None, None, None))
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self._thread = None
+            self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, val, tb):
+        self.close()
@@ -0,0 +1,60 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import unittest
+from unittest.mock import patch
+
+from ..bench import report, suite
+
+
+class ReportTests(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(suite.percentile(values, 50), 50)
+        self.assertEqual(suite.percentile(values, 99), 99)
+        self.assertEqual(suite.percentile(values, 100), 100)
+        self.assertEqual(suite.percentile([3], 90), 3)
+
+    def test_compare(self):
+        old = {'requests_per_sec': 100, 'latency_p50': 10,
+               'memory_per_item': 500, 'custom': 1}
+        new = {'requests_per_sec': 150, 'latency_p50': 12,
+               'memory_per_item': 501, 'pagination_items_per_sec': 5}
+        comparisons = report.compare(old, new)
+        self.assertEqual(len(comparisons), 5)
+        verdicts = {c.name: c.verdict for c in comparisons}
+        self.assertEqual(verdicts, {
+            'requests_per_sec': 'better',
+            'latency_p50': 'worse',
+            'memory_per_item': '',
+            'pagination_items_per_sec': 'new',
+            'custom': 'missing',
+        })
+
+    def test_format_comparison(self):
+        text = report.format_comparison(report.compare(
+            {'requests_per_sec': 100}, {'requests_per_sec': 50}))
+        self.assertIn('-50.0%', text)
+        self.assertIn('worse', text)
+
+
+async def bench_broken(ctx):
+    raise ValueError("broken")
+
+
+async def bench_working(ctx):
+    return {'custom': 1}
+
+
+class RunSuiteTests(unittest.TestCase):
+    def test_errors(self):
+        benchmarks = [bench_broken, bench_working]
+        with patch.object(suite, 'BENCHMARKS', benchmarks):
+            errors = {}
+            results = suite.run_suite(address='http://napper.test',
+                                      errors=errors)
+            self.assertEqual(results, {'custom': 1})
+            self.assertEqual(list(errors), ['bench_broken'])
+            self.assertIn('ValueError: broken', errors['bench_broken'])
+            with self.assertRaises(ValueError):
+                suite.run_suite(address='http://napper.test')
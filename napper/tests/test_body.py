@@ -0,0 +1,144 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import hashlib
+import io
+import json
+import mmap
+import tempfile
+
+from .util import Tests
+from .. import body
+from ..bench import server, suite
+from ..transport import AppTransport
+
+
+DATA = bytes(range(256)) * 1000
+TEXT = 'héllo wörld\n' * 1000
+
+
+async def agen(data, size=1000):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class StreamBodyTests(Tests):
+    async def test_buffer(self):
+        b = body.StreamBody(bytearray(DATA), chunk_size=1000)
+        self.assertEqual(b.size, len(DATA))
+        self.assertEqual(await b.read(), DATA)
+        self.assertEqual(await b.read(), DATA)
+
+    async def test_file(self):
+        f = io.BytesIO(DATA)
+        f.seek(10)
+        b = body.StreamBody(f)
+        self.assertEqual(b.size, len(DATA) - 10)
+        self.assertEqual(await b.read(), DATA[10:])
+        self.assertEqual(await b.read(), DATA[10:])
+
+    async def test_mmap(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(DATA)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0) as mapped:
+                b = body.stream_body(mapped)
+                self.assertEqual(b.size, len(DATA))
+                self.assertEqual(await b.read(), DATA)
+                del b
+
+    async def test_iterator_once(self):
+        b = body.StreamBody(agen(DATA))
+        self.assertIsNone(b.size)
+        self.assertFalse(b.replayable)
+        self.assertEqual(await b.read(), DATA)
+        with self.assertRaises(RuntimeError):
+            await b.read()
+
+    def test_stream_body(self):
+        self.assertIs(body.stream_body(b'abc'), b'abc')
+        self.assertEqual(body.stream_body({'a': 1}), {'a': 1})
+        self.assertIsInstance(body.stream_body(io.BytesIO()), body.StreamBody)
+        text = io.StringIO('héllo')
+        self.assertIs(body.stream_body(text), text)
+        with self.assertRaises(TypeError):
+            body.StreamBody(3)
+        with self.assertRaises(TypeError):
+            body.StreamBody(text)
+
+
+async def asgi_upload(scope, receive, send):
+    h = hashlib.sha1()
+    size = 0
+    while True:
+        message = await receive()
+        h.update(message['body'])
+        size += len(message['body'])
+        if not message['more_body']:
+            break
+    headers = dict(scope['headers'])
+    body = json.dumps({
+        'size': size, 'sha1': h.hexdigest(),
+        'chunked': headers.get(b'transfer-encoding') == b'chunked',
+    }).encode()
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class UploadTests(Tests):
+    async def upload(self, data, **factory_kwargs):
+        factory = suite.BenchContext(self.address).factory
+        manager = factory(**factory_kwargs)
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        return dict(await site.upload.post(data))
+
+    def check(self, result, chunked, data=DATA):
+        self.assertEqual(result, {'size': len(data),
+                                  'sha1': hashlib.sha1(data).hexdigest(),
+                                  'chunked': chunked})
+
+
+class NetworkUploadTests(UploadTests):
+    def setUp(self):
+        super().setUp()
+        self.server = server.BenchServer().start()
+        self.addCleanup(self.server.stop)
+        self.address = self.server.address
+
+    async def test_file(self):
+        self.check(await self.upload(io.BytesIO(DATA)), False)
+
+    async def test_async_iterator(self):
+        self.check(await self.upload(agen(DATA)), True)
+
+    async def test_text_file(self):
+        self.check(await self.upload(io.StringIO(TEXT)), False,
+                   TEXT.encode('utf-8'))
+
+    async def test_length_given(self):
+        self.check(await self.upload(
+            body.StreamBody(agen(DATA), size=len(DATA))), False)
+
+
+class InProcessUploadTests(UploadTests):
+    address = 'http://napper.test'
+
+    async def upload(self, data, app=None):
+        return await super().upload(
+            data, transport=AppTransport(app or server.make_app()))
+
+    async def test_file(self):
+        self.check(await self.upload(io.BytesIO(DATA)), False)
+
+    async def test_async_iterator(self):
+        self.check(await self.upload(agen(DATA)), True)
+
+    async def test_text_file(self):
+        self.check(await self.upload(io.StringIO(TEXT)), False,
+                   TEXT.encode('utf-8'))
+
+    async def test_asgi(self):
+        self.check(await self.upload(agen(DATA), asgi_upload), True)
+        self.check(await self.upload(DATA, asgi_upload), False)
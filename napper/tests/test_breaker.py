@@ -0,0 +1,148 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import unittest
+
+from .util import Clock, Tests, FakeTextResponse
+from .. import breaker, instrument
+from ..errors import CircuitOpenError, http
+
+
+class CircuitTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.breaker = breaker.CircuitBreaker(
+            3, 10, half_open_requests=2, clock=self.clock)
+        self.circuit = self.breaker.circuit('http://example.org/a/b?c=d')
+
+    def acquire(self):
+        token, _ = self.circuit.acquire()
+        return token
+
+    def open(self):
+        for _ in range(3):
+            change = self.circuit.failure(self.acquire())
+        return change
+
+    def test_per_origin(self):
+        self.assertIs(self.breaker.circuit('http://EXAMPLE.org/x'),
+                      self.circuit)
+        self.assertIsNot(self.breaker.circuit('https://example.org/a'),
+                         self.circuit)
+        self.assertEqual(self.circuit.origin, 'http://example.org')
+
+    def test_opens_after_threshold(self):
+        self.assertEqual(self.open(), ('closed', 'open'))
+        with self.assertRaises(CircuitOpenError) as cm:
+            self.circuit.acquire()
+        self.assertEqual(cm.exception.retry_in, 10)
+
+    def test_success_resets_failures(self):
+        for _ in range(2):
+            self.circuit.failure(self.acquire())
+        self.circuit.success(self.acquire())
+        self.assertIsNone(self.circuit.failure(self.acquire()))
+        self.assertEqual(self.circuit.state, 'closed')
+
+    def test_half_open_closes(self):
+        self.open()
+        self.clock.now += 10
+        token, change = self.circuit.acquire()
+        self.assertEqual(change, ('open', 'half-open'))
+        self.assertEqual(self.circuit.acquire(), (token, None))
+        with self.assertRaises(CircuitOpenError):
+            self.circuit.acquire()
+        self.assertIsNone(self.circuit.success(token))
+        self.assertEqual(self.circuit.success(token),
+                         ('half-open', 'closed'))
+        self.circuit.acquire()
+
+    def test_half_open_reopens(self):
+        self.open()
+        self.clock.now += 10
+        self.assertEqual(self.circuit.failure(self.acquire()),
+                         ('half-open', 'open'))
+        with self.assertRaises(CircuitOpenError):
+            self.circuit.acquire()
+
+    def test_cancelled_probe(self):
+        self.open()
+        self.clock.now += 10
+        token = self.acquire()
+        self.acquire()
+        self.circuit.cancelled(token)
+        self.acquire()
+
+    def test_stale_outcomes(self):
+        early = [self.acquire() for _ in range(3)]
+        self.open()
+        self.clock.now += 10
+        probe = self.acquire()
+        self.assertIsNone(self.circuit.success(early[0]))
+        self.assertIsNone(self.circuit.success(early[1]))
+        self.assertIsNone(self.circuit.failure(early[2]))
+        self.circuit.cancelled(early[2])
+        self.assertEqual(self.circuit.state, 'half-open')
+        self.assertEqual(self.circuit.probes, 1)
+        self.assertIsNone(self.circuit.success(probe))
+        self.assertEqual(self.circuit.state, 'half-open')
+
+    def test_bad_threshold(self):
+        with self.assertRaises(ValueError):
+            breaker.CircuitBreaker(0)
+
+
+class Recorder(instrument.Instrumentation):
+    def __init__(self):
+        self.changes = []
+
+    def circuit_changed(self, origin, old, new):
+        self.changes.append((origin, old, new))
+
+
+class SessionBreakerTests(Tests):
+    async def test_session(self):
+        recorder = Recorder()
+        clock = Clock()
+        cb = breaker.CircuitBreaker(2, 5, clock=clock)
+        manager = self.sfactory(circuit_breaker=cb, stats=True,
+                                instrumentation=[recorder])
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+
+        for _ in range(2):
+            req = site.path.get()
+            with self.text_response('{}', 503, req=req):
+                with self.assertRaises(http.ServiceUnavailable):
+                    await req
+        self.assertEqual(recorder.changes,
+                         [('http://www.example.org', 'closed', 'open')])
+        self.assertEqual(site.stats().gauges['circuits_open'], 1)
+
+        req = site.path.get()
+        with self.mock_responses(req=req) as mock:
+            with self.assertRaises(CircuitOpenError):
+                await req
+        self.assertFalse(mock.called)
+
+        clock.now += 5
+        req = site.path.get()
+        with self.mock_responses(FakeTextResponse('{}'), req=req):
+            await req
+        self.assertEqual(recorder.changes[1:], [
+            ('http://www.example.org', 'open', 'half-open'),
+            ('http://www.example.org', 'half-open', 'closed'),
+        ])
+        self.assertEqual(site.stats().gauges['circuits_open'], 0)
+
+    async def test_exceptions(self):
+        cb = breaker.CircuitBreaker(1)
+        manager = self.sfactory(circuit_breaker=cb)
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        req = site.path.get()
+        with self.mock_responses(req=req) as mock:
+            mock.side_effect = ConnectionResetError
+            with self.assertRaises(ConnectionResetError):
+                await req
+        self.assertEqual(cb.state('http://www.example.org/'), 'open')
@@ -0,0 +1,124 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import json
+import os
+import tempfile
+
+from .util import Tests
+from .. import cassette, transport
+from ..bench import server, suite
+from ..errors import UnrecordedRequestError, http
+from ..response import BytesResponse, DrippingResponse
+from ..util import get_aiter, rag
+
+
+ADDRESS = 'http://napper.test'
+
+
+class CassetteTests(Tests):
+    def setUp(self):
+        super().setUp()
+        fd, self.path = tempfile.mkstemp(suffix='.cassette')
+        os.close(fd)
+        os.unlink(self.path)
+        self.addCleanup(lambda: os.path.exists(self.path)
+                        and os.unlink(self.path))
+
+    async def site_with(self, tr):
+        factory = suite.BenchContext(ADDRESS).factory
+        manager = factory(transport=tr)
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        return site
+
+    async def record(self):
+        app = transport.AppTransport(server.make_app())
+        tr = cassette.RecordingTransport(self.path, app)
+        site = await self.site_with(tr)
+        item = await site.items['1'].get()
+        paginator = await site.pages.get(per_page=3, pages=2)
+        await suite.drain_paginator(paginator)
+        with self.assertRaises(http.NotFound):
+            await site.nothing.get()
+        req = site.blob.get(size=200000)
+        req.response_type = BytesResponse()
+        blob = await req
+        await tr.close()
+        return item, blob
+
+    async def test_replay(self):
+        item, blob = await self.record()
+        site = await self.site_with(cassette.ReplayTransport(self.path))
+        self.assertEqual(rag(await site.items['1'].get(), 'value'),
+                         rag(item, 'value'))
+        paginator = await site.pages.get(per_page=3, pages=2)
+        self.assertEqual(await suite.drain_paginator(paginator), 6)
+        with self.assertRaises(http.NotFound):
+            await site.nothing.get()
+        req = site.blob.get(size=200000)
+        req.response_type = BytesResponse()
+        self.assertEqual(await req, blob)
+
+    async def test_unrecorded(self):
+        await self.record()
+        site = await self.site_with(cassette.ReplayTransport(self.path))
+        with self.assertRaises(UnrecordedRequestError):
+            await site.items['2'].get()
+
+    async def test_dripping(self):
+        tr = cassette.RecordingTransport(
+            self.path, transport.AppTransport(server.make_app()))
+        site = await self.site_with(tr)
+        req = site.drip.get(lines=3000)
+        req.response_type = BytesResponse()
+        await req
+        await tr.close()
+
+        replay = cassette.ReplayTransport(self.path)
+        site = await self.site_with(replay)
+        req = site.drip.get(lines=3000)
+        req.response_type = DrippingResponse(BytesResponse())
+        count = 0
+        async with await req as dripper:
+            itor = await get_aiter(dripper)
+            while True:
+                try:
+                    line = await type(itor).__anext__(itor)
+                except StopAsyncIteration:
+                    break
+                self.assertEqual(json.loads(line.decode())['id'], count)
+                count += 1
+        self.assertEqual(count, 3000)
+
+    async def test_body_in_key(self):
+        self.assertNotEqual(
+            cassette.request_key('POST', ADDRESS, b'a'),
+            cassette.request_key('POST', ADDRESS, b'b'))
+        self.assertEqual(
+            cassette.request_key('get', ADDRESS),
+            cassette.request_key('GET', ADDRESS))
+
+    async def test_cycle_and_truncation(self):
+        rec = cassette.RecordingTransport(self.path, transport.Transport())
+        key = cassette.request_key('GET', ADDRESS + '/a')
+        for body in (b'1', b'2', b'3'):
+            rec.write(key, {'status': 200, 'reason': 'OK',
+                            'headers': []}, body)
+        rec.file.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+
+        replay = cassette.ReplayTransport(self.path)
+        bodies = []
+        for _ in range(3):
+            resp = await replay.request('GET', ADDRESS + '/a')
+            bodies.append(await resp.read())
+        self.assertEqual(bodies, [b'1', b'2', b'1'])
+        await replay.close()
+
+    def test_not_a_cassette(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'x' * 100)
+        with self.assertRaises(ValueError):
+            cassette.ReplayTransport(self.path)
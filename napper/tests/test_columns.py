@@ -0,0 +1,131 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import array
+import unittest
+
+from .util import Tests
+from .. import columns
+from ..bench import server, suite
+from ..response import PaginatorObject
+from ..transport import AppTransport
+
+
+FIELDS = {
+    'id': {'attr': 'id'},
+    'login': [{'attr': 'owner'}, {'attr': 'login'}],
+    'score': {'attr': 'score'},
+    'public': {'attr': 'public'},
+}
+
+
+class ColumnTests(unittest.TestCase):
+    def column(self, *values):
+        col = columns.Column()
+        for value in values:
+            col.append(value)
+        return col._finish(False)
+
+    def test_int(self):
+        col = self.column(1, 2, 3)
+        self.assertEqual(col.kind, 'int')
+        self.assertEqual(col.values, array.array('q', [1, 2, 3]))
+        self.assertIsNone(col.valid)
+
+    def test_bool(self):
+        col = self.column(True, False)
+        self.assertEqual(col.kind, 'bool')
+        self.assertEqual(col.to_list(), [True, False])
+
+    def test_str(self):
+        col = self.column('a', 'b', 'a', 'c')
+        self.assertEqual(col.kind, 'str')
+        self.assertEqual(col.categories, ['a', 'b', 'c'])
+        self.assertEqual(list(col.values), [0, 1, 0, 2])
+        self.assertEqual(col.to_list(), ['a', 'b', 'a', 'c'])
+
+    def test_missing(self):
+        col = self.column(None, 'a', None)
+        self.assertEqual(list(col.values), [-1, 0, -1])
+        self.assertEqual(col.valid, bytearray([0, 1, 0]))
+        self.assertEqual(col.to_list(), [None, 'a', None])
+
+    def test_all_missing(self):
+        col = self.column(None, None)
+        self.assertIsNone(col.kind)
+        self.assertEqual(col.to_list(), [None, None])
+
+    def test_promote_float(self):
+        col = self.column(1, None, 2.5)
+        self.assertEqual(col.kind, 'float')
+        self.assertEqual(col.values, array.array('d', [1.0, 0.0, 2.5]))
+        self.assertEqual(col.to_list(), [1.0, None, 2.5])
+
+    def test_mixed(self):
+        col = self.column(1, 'a', None, [2])
+        self.assertEqual(col.kind, 'object')
+        self.assertEqual(col.values, [1, 'a', None, [2]])
+
+    def test_large_int(self):
+        col = self.column(1, 2 ** 70)
+        self.assertEqual(col.kind, 'object')
+        self.assertEqual(col.to_list(), [1, 2 ** 70])
+
+    @unittest.skipIf(columns._numpy is None, "NumPy is not installed")
+    def test_numpy(self):
+        col = columns.Column()
+        for value in (0.5, None, 1.5):
+            col.append(value)
+        col._finish(True)
+        self.assertEqual(str(col.values.dtype), 'float64')
+        self.assertEqual(col.to_list(), [0.5, None, 1.5])
+
+
+class CollectTests(Tests):
+    async def test_sequence(self):
+        items = [server.make_item(i) for i in range(5)]
+        items[3] = {'id': 3}
+        cols = await columns.collect(items, FIELDS, numpy=False)
+        self.assertEqual(cols['id'].to_list(), [0, 1, 2, 3, 4])
+        self.assertEqual(cols['login'].to_list(),
+                         ['user0', 'user1', 'user2', None, 'user4'])
+        self.assertEqual(cols['public'].kind, 'bool')
+        self.assertEqual(cols['score'].values,
+                         array.array('d', [0, 0.5, 1, 0, 2]))
+
+    async def test_response_list(self):
+        resp = await self.request('[{"a": 1}, {"a": 2}, {"b": 3}]')
+        cols = await resp.to_columns({'a': {'attr': 'a'}}, numpy=False)
+        self.assertEqual(cols['a'].to_list(), [1, 2, None])
+
+    async def test_numpy_unavailable(self):
+        if columns._numpy is not None:
+            self.skipTest("NumPy is installed")
+        with self.assertRaises(RuntimeError):
+            await columns.collect([], FIELDS, numpy=True)
+
+
+class PaginatorColumnsTests(Tests):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        factory = suite.BenchContext('http://napper.test').factory
+        manager = factory(transport=AppTransport(server.make_app()))
+        self.bench_site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+
+    async def test_paginator(self):
+        paginator = await self.bench_site.pages.get(per_page=4, pages=3)
+        self.assertIsInstance(paginator, PaginatorObject)
+        cols = await paginator.to_columns(FIELDS, numpy=False)
+        self.assertEqual(cols['id'].to_list(), list(range(12)))
+        self.assertEqual(cols['login'].categories,
+                         ['user{0}'.format(i) for i in range(12)])
+        self.assertEqual(len(paginator.pages), 1)
+        self.assertEqual(len(paginator.cache), 4)
+
+    async def test_request(self):
+        cols = await columns.collect(
+            self.bench_site.pages.get(per_page=2, pages=2),
+            {'name': {'attr': 'name'}}, numpy=False)
+        self.assertEqual(cols['name'].to_list(),
+                         ['item-0', 'item-1', 'item-2', 'item-3'])
@@ -0,0 +1,84 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import asyncio
+import time
+import unittest
+
+from .util import Tests
+from .. import crawl
+from ..bench import server, suite
+from ..transport import AppTransport
+
+
+def make_session():
+    factory = suite.BenchContext('http://napper.test').factory
+    return factory(transport=AppTransport(server.make_app()))
+
+
+async def item_name(site, i):
+    item = await site.items[str(i)].get()
+    return item.name
+
+
+async def page_ids(site, page):
+    req = site.pages.get(page=page, per_page=3, pages=page)
+    paginator = await req
+    return [(await paginator.item(i))['id'] for i in range(3)]
+
+
+async def fail_on_7(site, i):
+    if i == 7:
+        raise ValueError(i)
+    return i
+
+
+async def slow_after_0(site, i):
+    if i:
+        await asyncio.sleep(2)
+    return i
+
+
+class BatchesTests(unittest.TestCase):
+    def test_range(self):
+        self.assertEqual(list(crawl.batches(range(0, 10), 4)),
+                         [range(0, 4), range(4, 8), range(8, 10)])
+
+    def test_iterable(self):
+        self.assertEqual(list(crawl.batches(iter('abcde'), 2)),
+                         [['a', 'b'], ['c', 'd'], ['e']])
+
+
+class CrawlTests(Tests):
+    async def collect(self, *args, **kwargs):
+        kwargs.setdefault('processes', 2)
+        return [result async for result in crawl.crawl(*args, **kwargs)]
+
+    async def test_ordered(self):
+        names = await self.collect(make_session, item_name, range(50),
+                                   batch_size=7)
+        self.assertEqual(names, ['item-{0}'.format(i) for i in range(50)])
+
+    async def test_unordered(self):
+        names = await self.collect(make_session, item_name, range(50),
+                                   batch_size=7, ordered=False)
+        self.assertEqual(sorted(names),
+                         sorted('item-{0}'.format(i) for i in range(50)))
+
+    async def test_pages(self):
+        pages = await self.collect(make_session, page_ids, [1, 2, 3],
+                                   batch_size=1)
+        self.assertEqual(pages, [[0, 1, 2], [3, 4, 5], [6, 7, 8]])
+
+    async def test_error(self):
+        with self.assertRaises(ValueError):
+            await self.collect(make_session, fail_on_7, range(20),
+                               batch_size=5)
+
+    async def test_stop_early(self):
+        results = crawl.crawl(make_session, slow_after_0, range(4),
+                              processes=2, batch_size=1)
+        self.assertEqual(await results.__anext__(), 0)
+        start = time.monotonic()
+        await results.aclose()
+        self.assertLess(time.monotonic() - start, 1)
@@ -0,0 +1,215 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import hashlib
+import io
+import json
+import mmap
+import os
+import tempfile
+
+import aiohttp
+
+from .util import Tests
+from .. import download
+from ..bench import server, suite
+from ..errors import (
+    BodyTooLargeError, ChecksumError, ResourceChangedError, http)
+from ..transport import AppTransport
+
+
+SIZE = 300000
+BLOB = bytes(range(256)) * (SIZE // 256) + bytes(range(SIZE % 256))
+SHA256 = hashlib.sha256(BLOB).hexdigest()
+
+
+class RecordingTransport(AppTransport):
+    """Records the ranges asked for and drops the connection for those
+    in ``fail``"""
+    def __init__(self, app, fail=()):
+        super().__init__(app)
+        self.ranges = []
+        self.fail = set(fail)
+
+    async def request(self, method, url, *, headers=None, **kwargs):
+        requested = (headers or {}).get('Range')
+        self.ranges.append(requested)
+        if requested in self.fail:
+            raise aiohttp.ServerDisconnectedError()
+        return await super().request(method, url, headers=headers, **kwargs)
+
+
+class DownloadTests(Tests):
+    address = 'http://napper.test'
+
+    def setUp(self):
+        super().setUp()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'blob')
+
+    async def make_site(self, **kwargs):
+        factory = suite.BenchContext(self.address).factory
+        kwargs.setdefault('transport', AppTransport(server.make_app()))
+        manager = factory(**kwargs)
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        return site
+
+    def read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+
+class FileResponseTests(DownloadTests):
+    async def fetch(self, response_type, path='blob', **kwargs):
+        site = await self.make_site(**kwargs)
+        req = site[path].get(size=SIZE)
+        req.response_type = response_type
+        return await req
+
+    async def test_path(self):
+        result = await self.fetch(download.FileResponse(
+            self.path, checksum='sha256', expected=SHA256, chunk_size=1000))
+        self.assertEqual(result, (self.path, SIZE, SHA256))
+        self.assertEqual(self.read(), BLOB)
+
+    async def test_mismatch(self):
+        with self.assertRaises(ChecksumError):
+            await self.fetch(download.FileResponse(
+                self.path, checksum='sha256', expected='00' * 32))
+        self.assertFalse(os.path.exists(self.path))
+
+    async def test_fd(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT)
+        try:
+            os.write(fd, b'head')
+            result = await self.fetch(download.FileResponse(fd))
+        finally:
+            os.close(fd)
+        self.assertEqual(result, (None, SIZE, None))
+        self.assertEqual(self.read(), b'head' + BLOB)
+
+    async def test_file_object(self):
+        f = io.BytesIO()
+        await self.fetch(download.FileResponse(f))
+        self.assertEqual(f.getvalue(), BLOB)
+
+    async def test_error(self):
+        with self.assertRaises(http.NotFound):
+            await self.fetch(download.FileResponse(self.path), 'nothing')
+        self.assertFalse(os.path.exists(self.path))
+
+    async def test_max_size(self):
+        with self.assertRaises(BodyTooLargeError):
+            await self.fetch(download.FileResponse(self.path,
+                                                   max_size=SIZE - 1))
+        self.assertFalse(os.path.exists(self.path))
+
+    async def test_max_size_nothing_written(self):
+        f = io.BytesIO()
+        with self.assertRaises(BodyTooLargeError):
+            await self.fetch(download.FileResponse(f, max_size=SIZE - 1))
+        self.assertEqual(f.getvalue(), b'')
+
+    async def test_network(self):
+        with server.BenchServer() as bench_server:
+            self.address = bench_server.address
+            result = await self.fetch(download.FileResponse(self.path),
+                                      transport=None)
+        self.assertEqual(result.size, SIZE)
+        self.assertEqual(self.read(), BLOB)
+
+    def test_expected_needs_algorithm(self):
+        with self.assertRaises(ValueError):
+            download.FileResponse(self.path, expected=SHA256)
+
+    def test_preallocate(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT)
+        try:
+            download.preallocate(fd, 5000)
+        finally:
+            os.close(fd)
+        self.assertEqual(os.path.getsize(self.path), 5000)
+
+
+class DownloadRangesTests(DownloadTests):
+    async def fetch(self, target, fail=(), ranges=1, **kwargs):
+        self.transport = RecordingTransport(server.make_app(), fail)
+        site = await self.make_site(transport=self.transport)
+        kwargs.setdefault('part_size', 65536)
+        return await download.download_ranges(
+            site.blob.get(size=SIZE, ranges=ranges), target, **kwargs)
+
+    async def test_path(self):
+        result = await self.fetch(self.path, connections=3,
+                                  checksum='sha256', expected=SHA256)
+        self.assertEqual(result, (self.path, SIZE, SHA256))
+        self.assertEqual(self.read(), BLOB)
+        self.assertEqual(len(self.transport.ranges), 5)
+        self.assertEqual(self.transport.ranges[0], 'bytes=0-65535')
+        self.assertFalse(os.path.exists(self.path + '.parts'))
+
+    async def test_mmap(self):
+        with mmap.mmap(-1, SIZE) as target:
+            result = await self.fetch(target)
+            self.assertEqual(result, (None, SIZE, None))
+            self.assertEqual(target[:], BLOB)
+
+    async def test_target_too_small(self):
+        with mmap.mmap(-1, SIZE - 1) as target:
+            with self.assertRaises(ValueError):
+                await self.fetch(target)
+
+    async def test_no_ranges(self):
+        result = await self.fetch(self.path, ranges=0)
+        self.assertEqual(result.size, SIZE)
+        self.assertEqual(self.read(), BLOB)
+        self.assertEqual(len(self.transport.ranges), 1)
+
+    async def test_small(self):
+        result = await self.fetch(self.path, part_size=1 << 20)
+        self.assertEqual(result.size, SIZE)
+        self.assertEqual(self.read(), BLOB)
+
+    async def test_resume(self):
+        with self.assertRaises(aiohttp.ServerDisconnectedError):
+            await self.fetch(self.path, connections=1,
+                             fail={'bytes=131072-196607'})
+        with open(self.path + '.parts') as f:
+            self.assertEqual(json.load(f)['done'], [0, 1])
+        result = await self.fetch(self.path, checksum='sha256',
+                                  expected=SHA256)
+        self.assertEqual(result.size, SIZE)
+        self.assertEqual(self.read(), BLOB)
+        self.assertEqual(sorted(self.transport.ranges), [
+            'bytes=131072-196607', 'bytes=196608-262143',
+            'bytes=262144-299999'])
+        self.assertFalse(os.path.exists(self.path + '.parts'))
+
+    async def test_resume_changed(self):
+        with self.assertRaises(aiohttp.ServerDisconnectedError):
+            await self.fetch(self.path, connections=1,
+                             fail={'bytes=131072-196607'})
+        with open(self.path + '.parts') as f:
+            state = json.load(f)
+        state['validator'] = '"older"'
+        with open(self.path + '.parts', 'w') as f:
+            json.dump(state, f)
+        result = await self.fetch(self.path)
+        self.assertEqual(result.size, SIZE)
+        self.assertEqual(self.read(), BLOB)
+        self.assertEqual(len(self.transport.ranges), 1)
+
+    async def test_changed(self):
+        class Growing(RecordingTransport):
+            async def request(self, method, url, *, params, **kwargs):
+                if self.ranges:
+                    params = dict(params, size=SIZE + 1)
+                return await super().request(
+                    method, url, params=params, **kwargs)
+        site = await self.make_site(transport=Growing(server.make_app()))
+        with self.assertRaises(ResourceChangedError):
+            await download.download_ranges(
+                site.blob.get(size=SIZE), self.path, part_size=65536)
+        self.assertFalse(os.path.exists(self.path + '.parts'))
@@ -0,0 +1,167 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from .util import Tests, FakeTextResponse
+from .. import hedge, instrument, retry, stats
+from ..util import rag
+
+
+def later(delay, result):
+    """Returns a future resolving ``delay`` seconds after it is first
+    passed to `SessionHedgingTests.responses`'s mock"""
+    ret = asyncio.Future()
+    ret.delay = delay
+    if isinstance(result, Exception):
+        ret.resolve = lambda: ret.set_exception(result)
+    else:
+        ret.resolve = lambda: ret.set_result(result)
+    return ret
+
+
+class HedgePolicyTests(unittest.TestCase):
+    def test_fixed_delay(self):
+        self.assertEqual(hedge.HedgePolicy(0.5).delay_for(None), 0.5)
+
+    def test_percentile(self):
+        policy = hedge.HedgePolicy(min_samples=10, min_delay=0.001)
+        endpoint = stats.EndpointStats()
+        self.assertIsNone(policy.delay_for(None))
+        self.assertIsNone(policy.delay_for(endpoint))
+        for _ in range(10):
+            endpoint.response_latency.observe(0.1)
+        delay = policy.delay_for(endpoint)
+        self.assertGreater(delay, 0.05)
+        self.assertLessEqual(delay, 0.13)
+
+    def test_min_delay(self):
+        policy = hedge.HedgePolicy(min_samples=1, min_delay=0.5)
+        endpoint = stats.EndpointStats()
+        endpoint.response_latency.observe(0.0001)
+        self.assertEqual(policy.delay_for(endpoint), 0.5)
+
+    def test_budget(self):
+        policy = hedge.HedgePolicy(
+            0.1, budget=retry.RetryBudget(ratio=0.5, reserve=0))
+        self.assertFalse(policy.withdraw())
+        policy.started()
+        policy.started()
+        self.assertTrue(policy.withdraw())
+        self.assertFalse(policy.withdraw())
+
+
+class SessionHedgingTests(Tests):
+    async def make_hedged_site(self, policy, **kwargs):
+        manager = self.sfactory(hedging=policy, stats=True, **kwargs)
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        return site
+
+    def responses(self, site, *responses):
+        responses = iter(responses)
+
+        def request(*args, **kwargs):
+            ret = next(responses)
+            if hasattr(ret, 'delay'):
+                asyncio.get_event_loop().call_later(ret.delay, ret.resolve)
+            return ret
+        return patch.object(
+            rag(site, 'session'), 'request', side_effect=request)
+
+    async def test_hedge_wins(self):
+        site = await self.make_hedged_site(hedge.HedgePolicy(0.01))
+        slow = asyncio.Future()
+        with self.responses(site, slow, later(0, FakeTextResponse('[1]'))
+                            ) as mock:
+            self.assertEqual(list(await site.res.get()), [1])
+        self.assertEqual(mock.call_count, 2)
+        self.assertTrue(slow.cancelled())
+        counters = site.stats()['GET /res'].counters
+        self.assertEqual(counters, {'hedges_sent': 1, 'hedges_won': 1})
+
+    async def test_winner_timings(self):
+        site = await self.make_hedged_site(
+            hedge.HedgePolicy(0.01),
+            instrumentation=[instrument.Instrumentation()])
+        req = site.res.get()
+        slow = asyncio.Future()
+        fast = asyncio.Future()
+        fast.set_result(FakeTextResponse('[1]'))
+        first, second = [], []
+
+        def request(*args, trace_request_ctx, **kwargs):
+            if not first:
+                first.append(trace_request_ctx)
+                trace_request_ctx.mark('connect_start', 1.0)
+                return slow
+            second.append(trace_request_ctx)
+            trace_request_ctx.mark('reused_connection', True)
+            trace_request_ctx.mark('headers_sent', 2.0)
+            return fast
+        with patch.object(rag(site, 'session'), 'request',
+                          side_effect=request):
+            self.assertEqual(list(await req), [1])
+        timings = rag(req, 'timings')
+        self.assertIsNot(first[0], timings)
+        self.assertIsNot(second[0], timings)
+        self.assertIsNone(timings.connect_start)
+        self.assertTrue(timings.reused_connection)
+        self.assertEqual(timings.headers_sent, 2.0)
+        second[0].mark('body_end', 3.0)
+        first[0].mark('body_end', 4.0)
+        self.assertEqual(timings.body_end, 3.0)
+
+    async def test_first_wins(self):
+        site = await self.make_hedged_site(hedge.HedgePolicy(0.01))
+        late = later(0.1, FakeTextResponse('[2]'))
+        with self.responses(site, later(0.02, FakeTextResponse('[1]')),
+                            late):
+            self.assertEqual(list(await site.res.get()), [1])
+        self.assertTrue(late.cancelled())
+        counters = site.stats()['GET /res'].counters
+        self.assertEqual(counters, {'hedges_sent': 1})
+
+    async def test_fast_response(self):
+        site = await self.make_hedged_site(hedge.HedgePolicy(1))
+        with self.responses(site, later(0, FakeTextResponse('[1]'))) as mock:
+            self.assertEqual(list(await site.res.get()), [1])
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(site.stats()['GET /res'].counters, {})
+
+    async def test_first_fails(self):
+        site = await self.make_hedged_site(hedge.HedgePolicy(0.01))
+        with self.responses(site, later(0.02, ConnectionResetError()),
+                            later(0.02, FakeTextResponse('[2]'))):
+            self.assertEqual(list(await site.res.get()), [2])
+
+    async def test_both_fail(self):
+        site = await self.make_hedged_site(hedge.HedgePolicy(0.01))
+        with self.responses(site, later(0.02, ConnectionResetError()),
+                            later(0.01, ConnectionResetError())):
+            with self.assertRaises(ConnectionResetError):
+                await site.res.get()
+
+    async def test_budget_exhausted(self):
+        policy = hedge.HedgePolicy(
+            0.01, budget=retry.RetryBudget(ratio=0, reserve=0))
+        site = await self.make_hedged_site(policy)
+        with self.responses(site, later(0.02, FakeTextResponse('[1]'))
+                            ) as mock:
+            self.assertEqual(list(await site.res.get()), [1])
+        self.assertEqual(mock.call_count, 1)
+
+    async def test_post_not_hedged(self):
+        site = await self.make_hedged_site(hedge.HedgePolicy(0.01))
+        with self.responses(site, later(0.02, FakeTextResponse('[1]'))
+                            ) as mock:
+            self.assertEqual(list(await site.res.post()), [1])
+        self.assertEqual(mock.call_count, 1)
+
+    async def test_percentile_requires_stats(self):
+        manager = self.sfactory(hedging=hedge.HedgePolicy())
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        with self.assertRaises(ValueError):
+            await type(manager).__aenter__(manager)
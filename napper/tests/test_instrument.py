@@ -0,0 +1,98 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+from types import SimpleNamespace
+
+import aiohttp
+
+from .util import Tests
+from .. import instrument, response, util
+
+
+class Recorder(instrument.Instrumentation):
+    def __init__(self):
+        self.events = []
+
+    def request_started(self, request, timings):
+        self.events.append(('started', request, timings.response_start))
+
+    def stage_finished(self, request, stage, timings, exc):
+        self.events.append((stage, request, exc))
+
+
+class InstrumentationTests(Tests):
+    async def instrumented_site(self, *instrumentation):
+        manager = self.sfactory(instrumentation=instrumentation)
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        return site
+
+    def test_no_instrumentation(self):
+        self.assertIsNone(util.rag(self.req, 'timings'))
+
+    async def test_stages(self):
+        rec = Recorder()
+        site = await self.instrumented_site(rec)
+        req = site.path.get()
+        with self.text_response('{"a": 1}', req=req) as mock:
+            await req
+        mock.assert_called_once_with(
+            'GET', 'http://www.example.org/path', params={},
+            trace_request_ctx=util.rag(req, 'timings'))
+        self.assertEqual([e[0] for e in rec.events],
+                         ['started', 'response', 'parse', 'upgrade'])
+        self.assertTrue(all(e[1] is req for e in rec.events))
+        self.assertIsNotNone(rec.events[0][2])
+        self.assertEqual([e[2] for e in rec.events[1:]], [None] * 3)
+
+        timings = util.rag(req, 'timings')
+        self.assertEqual(timings.status, 200)
+        self.assertEqual(timings.attempts, 1)
+        durations = timings.as_dict()
+        for name in ['queueing', 'ttfb', 'response', 'parse', 'upgrade',
+                     'total']:
+            self.assertGreaterEqual(durations[name], 0, name)
+        self.assertIsNone(durations['connect'])
+        self.assertGreaterEqual(
+            timings.total,
+            timings.queueing + timings.response + timings.parse)
+
+    async def test_stage_exception(self):
+        class Error(Exception):
+            pass
+
+        class ErrorOnParse(response.ResponseType):
+            async def parse_response(self, response):
+                raise Error
+
+        rec = Recorder()
+        site = await self.instrumented_site(rec)
+        req = site.path.get()
+        req.response_type = ErrorOnParse()
+        with self.text_response('{}', req=req):
+            with self.assertRaises(Error):
+                await req
+        stage, _, exc = rec.events[-1]
+        self.assertEqual(stage, 'parse')
+        self.assertIsInstance(exc, Error)
+        self.assertIsNone(util.rag(req, 'timings').upgrade_start)
+
+    async def test_trace_config(self):
+        config = instrument.trace_config()
+        self.assertIsInstance(config, aiohttp.TraceConfig)
+        timings = instrument.RequestTimings()
+        ctx = SimpleNamespace(trace_request_ctx=timings)
+        for handler in config.on_connection_create_start:
+            await handler(None, ctx, None)
+        for handler in config.on_connection_create_end:
+            await handler(None, ctx, None)
+        for handler in config.on_connection_reuseconn:
+            await handler(None, ctx, None)
+        self.assertGreaterEqual(timings.connect, 0)
+        self.assertTrue(timings.reused_connection)
+
+    async def test_trace_config_ignores_other_ctx(self):
+        config = instrument.trace_config()
+        ctx = SimpleNamespace(trace_request_ctx=None)
+        for handler in config.on_connection_create_start:
+            await handler(None, ctx, None)
@@ -1,10 +1,13 @@
 # napper -- A REST Client for Python
 # Copyright (C) 2016 by Yann Kaiser and contributors.
 # See AUTHORS and COPYING for details.
+import asyncio
+import concurrent.futures
 import json
+from unittest.mock import patch
 
 from .util import Tests
-from .. import request, response, util, restspec
+from .. import request, response, util, restspec, jsonparse
 
 
 class JsonResponseTests(Tests):
@@ -92,3 +95,216 @@ class JsonResponseTests(Tests):
         self.assertIsInstance(req, request.Request)
         self.assertEqual(util.m(req).url, 'http://www.example.org/snakes')
         self.assertEqual(util.m(req).method, 'GET')
+
+
+    def test_list(self):
+        self.sfactory.spec.is_permalink_attr = \
+            self.attr_matcher(suffix='_url')
+        resp = response.upgrade_object(
+            [json.loads(self.json_object)] * 3 + ["abc"], util.m(self.req))
+        items = list(resp)
+        self.assertEqual(len(items), 4)
+        for item in items[:3]:
+            self.assertIsInstance(item, response.ResponseObject)
+            self.assertIsInstance(item['snakes_url'],
+                                  response.PermalinkString)
+            self.assertNotIsInstance(item['ham'], response.PermalinkString)
+            self.assertIsInstance(item.object['eggs_url'],
+                                  response.PermalinkString)
+        self.assertIsInstance(items[3], response.PermalinkString)
+
+    def test_list_paginator(self):
+        self.read_restspec(paginated_object={
+            "when": {"attr_exists": "list"},
+            "content": {"attr": "list"},
+            "next": {"attr": "after"},
+        })
+        resp = response.upgrade_object(
+            [[{"list": [1, 2]}, {"num": 3}]], util.m(self.req))
+        paginator, obj = list(resp)[0]
+        self.assertIsInstance(paginator, response.PaginatorObject)
+        self.assertEqual(list(paginator.cache), [1, 2])
+        self.assertEqual(obj.num, 3)
+
+
+class LazyJsonResponseTests(JsonResponseTests):
+    def make_response(self):
+        return response.upgrade_object(
+            jsonparse.lazy_loads(self.json_object, inline_size=0),
+            util.m(self.req))
+
+
+class CountingExecutor(concurrent.futures.ThreadPoolExecutor):
+    submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+class JsonOffloadTests(Tests):
+    body = '{"nums": [1, 2, 3], "name": "spam"}'
+
+    def executor(self, cls=CountingExecutor):
+        executor = cls(1)
+        self.addCleanup(executor.shutdown)
+        return executor
+
+    async def test_offloaded(self):
+        executor = self.executor()
+        self.req.response_type = response.JsonResponse(
+            offload_size=10, executor=executor)
+        resp = await self.request(self.body)
+        self.assertEqual(list(resp.nums), [1, 2, 3])
+        self.assertEqual(resp.name, 'spam')
+        self.assertEqual(executor.submitted, 1)
+
+    async def test_small_inline(self):
+        executor = self.executor()
+        self.req.response_type = response.JsonResponse(
+            offload_size=len(self.body) + 1, executor=executor)
+        resp = await self.request(self.body)
+        self.assertEqual(resp.name, 'spam')
+        self.assertEqual(executor.submitted, 0)
+
+    async def test_process_pool(self):
+        self.req.response_type = response.JsonResponse(
+            offload_size=0,
+            executor=self.executor(concurrent.futures.ProcessPoolExecutor))
+        resp = await self.request(self.body)
+        self.assertEqual(list(resp.nums), [1, 2, 3])
+
+
+class GcPauseTests(Tests):
+    def loads(self, *args):
+        with patch('gc.disable') as disable, patch('gc.enable'):
+            self.assertEqual(jsonparse.loads(*args), [1])
+        return disable.called
+
+    def test_not_paused_by_default(self):
+        self.assertFalse(self.loads('[1]'))
+
+    def test_paused(self):
+        self.assertTrue(self.loads('[1]', True))
+
+    def test_not_paused_in_threads(self):
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            self.assertFalse(
+                executor.submit(self.loads, '[1]', True).result())
+
+    async def test_inline_not_paused(self):
+        with patch('gc.disable') as disable:
+            resp = await self.request('{"name": "spam"}')
+            self.assertEqual(resp.name, 'spam')
+        self.assertFalse(disable.called)
+
+
+class JsonParseTests(Tests):
+    documents = [
+        '{"items": [{"a": 1}, {"b": [2, 3]}, 4, "x"], "next": null}',
+        ' [ [1, 2] , {"k" : {"deep": [1, {"deeper": true}]}} ,[] ] ',
+        '{}', '[]', '"string"', '3.5', '{"a": {}, "b": []}',
+        '{"dup": 1, "dup": 2}',
+    ]
+
+    async def test_same_as_json(self):
+        for doc in self.documents:
+            for depth in range(4):
+                with self.subTest(doc=doc, depth=depth):
+                    self.assertEqual(
+                        await jsonparse.loads_in_slices(doc, 0, depth),
+                        json.loads(doc))
+
+    async def test_errors(self):
+        for doc in ['', '[1, 2', '[1 2]', '{"a" 1}', '{1: 2}', '[1,]',
+                    '{"a": 1,}', '[1] x']:
+            with self.subTest(doc=doc):
+                with self.assertRaises(json.JSONDecodeError):
+                    json.loads(doc)
+                with self.assertRaises(json.JSONDecodeError):
+                    await jsonparse.loads_in_slices(doc)
+
+    async def test_gives_way(self):
+        doc = json.dumps({"items": list(range(1000))})
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+        task = asyncio.ensure_future(ticker())
+        await asyncio.sleep(0)
+        ticks = 0
+        try:
+            result = await jsonparse.loads_in_slices(doc, timeslice=0)
+        finally:
+            task.cancel()
+        self.assertEqual(result, json.loads(doc))
+        self.assertGreater(ticks, 10)
+
+    async def test_sliced_response(self):
+        self.req.response_type = response.JsonResponse(offload_size=10)
+        resp = await self.request('{"nums": [1, 2, 3], "name": "spam"}')
+        self.assertEqual(list(resp.nums), [1, 2, 3])
+
+
+class LazyJsonTests(Tests):
+    documents = JsonParseTests.documents + [
+        r'{"s": "a \"quoted\" ]}", "b": "\\", "c": ["\\\"", 1]}',
+        '{"u": "\u00e9\u2603", "n": [-1, 2e3, false, null]}',
+    ]
+
+    def test_same_as_json(self):
+        for doc in self.documents:
+            for inline_size in [0, 8, 512]:
+                with self.subTest(doc=doc, inline_size=inline_size):
+                    value = jsonparse.lazy_loads(doc, inline_size)
+                    self.assertEqual(value, json.loads(doc))
+                    if not isinstance(value, (str, float)):
+                        self.assertEqual(value.load(), json.loads(doc))
+
+    def test_duplicate_keys(self):
+        large = '"{0}"'.format('x' * 600)
+        for doc in ['{"a": 1, "b": 2, "a": ' + large + '}',
+                    '{"a": ' + large + ', "b": 2, "a": 1}',
+                    '{"a": [1], "a": [2, 3], "a": 4}']:
+            for inline_size in [0, 8, 512]:
+                with self.subTest(doc=doc[:30], inline_size=inline_size):
+                    value = jsonparse.lazy_loads(doc, inline_size)
+                    expected = json.loads(doc)
+                    self.assertEqual(value['a'], expected['a'])
+                    self.assertEqual(list(value), list(expected))
+                    self.assertEqual(value.load(), expected)
+
+    def test_errors(self):
+        for doc in ['', '[1, 2', '[1 2]', '{"a" 1}', '{1: 2}', '[1,]',
+                    '{"a": 1,}', '[1] x', '["unterminated']:
+            with self.subTest(doc=doc):
+                with self.assertRaises(json.JSONDecodeError):
+                    jsonparse.lazy_loads(doc, 0)
+
+    def test_lazy(self):
+        value = jsonparse.lazy_loads(
+            '{"small": [1], "large": [1, 2, {"a": 3}], "s": "long",'
+            ' "broken": "bad \\x"}', 4)
+        self.assertEqual(value['small'], [1])
+        self.assertEqual(value['s'], 'long')
+        self.assertEqual(value['large'][:2], [1, 2])
+        self.assertEqual(value['large'][-1], {'a': 3})
+        self.assertIs(value['large'], value['large'])
+        with self.assertRaises(json.JSONDecodeError):
+            value['broken']
+        with self.assertRaises(IndexError):
+            value['large'][3]
+        with self.assertRaises(TypeError):
+            value['large']['x']
+        self.assertEqual(list(value), ['small', 'large', 's', 'broken'])
+        self.assertNotIn('missing', value)
+
+    async def test_lazy_response(self):
+        self.req.response_type = response.JsonResponse(lazy=True)
+        resp = await self.request('{"nums": [1, 2, 3], "name": "spam"}')
+        self.assertIsInstance(resp['nums'], response.ResponseList)
+        self.assertEqual(list(resp.nums), [1, 2, 3])
+        self.assertEqual(resp.name, 'spam')
@@ -0,0 +1,362 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import asyncio
+import time
+import unittest
+
+from aiohttp import web
+
+from .util import Clock, Tests, FakeTextResponse
+from .. import limit, util
+from ..bench import server, suite
+from ..errors import BodyTooLargeError, http
+from ..response import (
+    BytesResponse, DrippingResponse, JsonResponse, TextResponse)
+from ..transport import AppTransport
+
+
+class TokenBucketTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+
+    def bucket(self, rate, burst=1, **kwargs):
+        return limit.TokenBucket(rate, burst, clock=self.clock, **kwargs)
+
+    def test_burst(self):
+        b = self.bucket(10, 3)
+        self.assertEqual([b.reserve() for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(b.reserve(), 0.1)
+        self.assertAlmostEqual(b.reserve(), 0.2)
+
+    def test_refill(self):
+        b = self.bucket(10, 2)
+        b.reserve()
+        b.reserve()
+        self.clock.now += 0.1
+        self.assertEqual(b.reserve(), 0)
+        self.clock.now += 10
+        b.reserve()
+        self.assertEqual(b.tokens, 1)
+
+    def test_bad_rate(self):
+        with self.assertRaises(ValueError):
+            self.bucket(0)
+
+    def test_update_rate(self):
+        b = self.bucket(100, 10)
+        b.update(5, 10)
+        self.assertEqual(b.rate, 0.5)
+        self.assertEqual(b.tokens, 5)
+
+    def test_update_exhausted(self):
+        b = self.bucket(100, 10)
+        b.update(0, 30)
+        self.assertAlmostEqual(b.reserve(), 30.01)
+        self.clock.now += 30
+        self.assertAlmostEqual(b.reserve(), 0.02)
+
+    def test_headers_delta(self):
+        b = self.bucket(100, 10, remaining_header='R', reset_header='T')
+        b.update_from_headers({'R': '10', 'T': '20'})
+        self.assertEqual(b.rate, 0.5)
+
+    def test_headers_epoch(self):
+        b = self.bucket(100, 10, remaining_header='R', reset_header='T')
+        b.update_from_headers({'R': '10', 'T': str(int(time.time()) + 100)})
+        self.assertAlmostEqual(b.rate, 0.1, delta=0.01)
+
+    def test_headers_missing(self):
+        b = self.bucket(100, 10, remaining_header='R', reset_header='T')
+        b.update_from_headers({'R': 'many'})
+        b.update_from_headers({})
+        b.update_from_headers(None)
+        self.assertEqual(b.rate, 100)
+
+
+class TokenBucketAcquireTests(Tests):
+    async def test_cancelled(self):
+        clock = Clock()
+        bucket = limit.TokenBucket(1, clock=clock)
+        await bucket.acquire()
+        for i in range(5):
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(bucket.acquire(), 0.01)
+        self.assertEqual(bucket.tokens, 0)
+        clock.now += 1
+        await asyncio.wait_for(bucket.acquire(), 0.01)
+        self.assertEqual(bucket.tokens, 0)
+
+
+class SessionRateLimitTests(Tests):
+    async def test_from_spec(self):
+        self.read_restspec(rate_limit={"requests": 50, "per": 10, "burst": 5})
+        manager = self.sfactory()
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        limiter = util.rag(site, 'rate_limiter')
+        self.assertIsInstance(limiter, limit.TokenBucket)
+        self.assertEqual(limiter.rate, 5)
+        self.assertEqual(limiter.capacity, 5)
+
+        resp = FakeTextResponse('{}')
+        resp.headers['X-RateLimit-Remaining'] = '4'
+        resp.headers['X-RateLimit-Reset'] = '2'
+        req = site.path.get()
+        with self.mock_responses(resp, req=req):
+            await req
+        self.assertEqual(limiter.rate, 2)
+        self.assertLessEqual(limiter.tokens, 4)
+
+    def test_no_limit(self):
+        self.assertIsNone(util.rag(self.site, 'rate_limiter'))
+
+
+class AdaptiveConcurrencyTests(Tests):
+    def setUp(self):
+        super().setUp()
+        self.clock = Clock()
+
+    def limiter(self, initial=2, **kwargs):
+        return limit.AdaptiveConcurrency(initial, clock=self.clock, **kwargs)
+
+    async def test_limit_reached(self):
+        c = self.limiter(2)
+        t1 = await c.acquire()
+        await c.acquire()
+        waiter = asyncio.ensure_future(c.acquire())
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+        c.release(t1)
+        await asyncio.sleep(0)
+        self.assertTrue(waiter.done())
+        self.assertEqual(c.in_flight, 2)
+
+    async def test_cancel_waiter(self):
+        c = self.limiter(1)
+        t1 = await c.acquire()
+        waiter = asyncio.ensure_future(c.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        c.release(t1)
+        self.assertEqual(c.in_flight, 0)
+        await c.acquire()
+        self.assertEqual(c.in_flight, 1)
+
+    async def test_additive_increase(self):
+        c = self.limiter(2)
+        for _ in range(4):
+            t1 = await c.acquire()
+            t2 = await c.acquire()
+            self.clock.now += 0.01
+            c.release(t1)
+            c.release(t2)
+        self.assertGreater(c.limit, 3)
+        self.assertLess(c.limit, 4)
+
+    async def test_no_increase_unsaturated(self):
+        c = self.limiter(4)
+        for _ in range(10):
+            t = await c.acquire()
+            self.clock.now += 0.01
+            c.release(t)
+        self.assertEqual(c.limit, 4)
+
+    async def test_multiplicative_decrease(self):
+        c = self.limiter(8)
+        t1 = await c.acquire()
+        t2 = await c.acquire()
+        self.clock.now += 0.01
+        c.release(t1, overloaded=True)
+        self.assertEqual(c.limit, 4)
+        c.release(t2, overloaded=True)
+        self.assertEqual(c.limit, 4)
+        self.clock.now += 0.01
+        t3 = await c.acquire()
+        c.release(t3, overloaded=True)
+        self.assertEqual(c.limit, 2)
+        for _ in range(3):
+            self.clock.now += 0.01
+            c.release(await c.acquire(), overloaded=True)
+        self.assertEqual(c.limit, 1)
+
+    async def test_latency_spike(self):
+        c = self.limiter(8, tolerance=2)
+        for _ in range(5):
+            t = await c.acquire()
+            self.clock.now += 0.01
+            c.release(t)
+        t = await c.acquire()
+        self.clock.now += 0.05
+        c.release(t)
+        self.assertEqual(c.limit, 4)
+
+    async def test_not_measured(self):
+        c = self.limiter(8)
+        t = await c.acquire()
+        c.release(t, measure=False)
+        self.assertEqual(c.limit, 8)
+        self.assertIsNone(c.baseline)
+        self.assertEqual(c.in_flight, 0)
+
+    async def test_session(self):
+        c = limit.AdaptiveConcurrency(8)
+        manager = self.sfactory(concurrency=c, stats=True)
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        req = site.path.get()
+        with self.text_response('{}', 503, req=req):
+            with self.assertRaises(http.ServiceUnavailable):
+                await req
+        self.assertEqual(c.limit, 4)
+        self.assertEqual(c.in_flight, 0)
+        self.assertEqual(site.stats().gauges,
+                         {'concurrency_limit': 4, 'requests_in_flight': 0})
+
+
+class MemoryBudgetTests(Tests):
+    async def test_wait(self):
+        budget = limit.MemoryBudget(100)
+        await budget.wait()
+        budget.admitted()
+        budget.charge(100)
+        waiter = asyncio.ensure_future(budget.wait())
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+        budget.credit(1)
+        await asyncio.sleep(0)
+        self.assertTrue(waiter.done())
+        self.assertEqual(budget.used, 99)
+        self.assertEqual(budget.peak, 100)
+
+    async def test_one_at_a_time(self):
+        budget = limit.MemoryBudget(100)
+        await budget.wait()
+        second = asyncio.ensure_future(budget.wait())
+        await asyncio.sleep(0)
+        self.assertFalse(second.done())
+        budget.admitted()
+        await asyncio.sleep(0)
+        self.assertTrue(second.done())
+
+    async def test_average_body(self):
+        budget = limit.MemoryBudget(100)
+        for i in range(5):
+            budget.observe(30)
+        self.assertEqual(budget.window, 6)
+        for i in range(4):
+            await asyncio.wait_for(budget.wait(), 0.01)
+        fifth = asyncio.ensure_future(budget.wait())
+        await asyncio.sleep(0)
+        self.assertFalse(fifth.done())
+        budget.charge(20)
+        budget.admitted()
+        await asyncio.sleep(0)
+        self.assertFalse(fifth.done())
+        budget.credit(20)
+        await asyncio.sleep(0)
+        self.assertTrue(fifth.done())
+
+    async def test_cancel_waiter(self):
+        budget = limit.MemoryBudget(10)
+        budget.charge(10)
+        first = asyncio.ensure_future(budget.wait())
+        second = asyncio.ensure_future(budget.wait())
+        await asyncio.sleep(0)
+        first.cancel()
+        budget.credit(10)
+        await asyncio.sleep(0)
+        self.assertTrue(second.done())
+
+    def test_bad_limit(self):
+        with self.assertRaises(ValueError):
+            limit.MemoryBudget(0)
+
+
+class BodyLimitTests(Tests):
+    async def make_site(self, address='http://napper.test', **kwargs):
+        factory = suite.BenchContext(address).factory
+        kwargs.setdefault('transport', AppTransport(server.make_app()))
+        manager = factory(**kwargs)
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        return site
+
+    async def test_session_limit(self):
+        site = await self.make_site(max_body_size=1000)
+        item = await site.items['1'].get()
+        self.assertEqual(item.name, 'item-1')
+        with self.assertRaises(BodyTooLargeError) as cm:
+            await site.items['1'].get(size=5000)
+        self.assertEqual(cm.exception.limit, 1000)
+        self.assertGreater(cm.exception.size, 5000)
+
+    async def test_streamed(self):
+        site = await self.make_site()
+        req = site.drip.get(lines=2000)
+        req.response_type = BytesResponse(max_size=1000)
+        with self.assertRaises(BodyTooLargeError) as cm:
+            await req
+        self.assertLessEqual(cm.exception.size, 2 ** 16)
+
+    async def test_content_length(self):
+        site = await self.make_site()
+        req = site.blob.get(size=300000)
+        req.response_type = DrippingResponse(BytesResponse(), max_size=1000)
+        with self.assertRaises(BodyTooLargeError) as cm:
+            await req
+        self.assertEqual(cm.exception.size, 300000)
+
+    async def test_dripped(self):
+        site = await self.make_site()
+        req = site.drip.get(lines=2000)
+        req.response_type = DrippingResponse(JsonResponse(), max_size=1000)
+        async with await req as dripper:
+            itor = await util.get_aiter(dripper)
+            with self.assertRaises(BodyTooLargeError):
+                while True:
+                    await itor.__anext__()
+
+    async def test_text_without_charset(self):
+        async def text(request):
+            return web.Response(body='héllo'.encode('utf-8'),
+                                headers={'Content-Type': 'text/plain'})
+        app = web.Application()
+        app.router.add_get('/text', text)
+        with server.BenchServer(app) as bench_server:
+            for transport in [None, AppTransport(app)]:
+                with self.subTest(transport=transport):
+                    site = await self.make_site(
+                        address=bench_server.address, transport=transport,
+                        max_body_size=100)
+                    req = site.text.get()
+                    req.response_type = TextResponse()
+                    self.assertEqual(await req, 'héllo')
+
+    async def test_response_type_overrides(self):
+        site = await self.make_site(max_body_size=1000)
+        req = site.blob.get(size=300000)
+        req.response_type = BytesResponse(max_size=300000)
+        self.assertEqual(len(await req), 300000)
+
+    async def test_budget(self):
+        budget = limit.MemoryBudget(1000)
+        site = await self.make_site(memory_budget=budget)
+        req = site.blob.get(size=300000)
+        req.response_type = BytesResponse()
+        self.assertEqual(len(await req), 300000)
+        self.assertEqual(budget.used, 0)
+        self.assertEqual(budget.peak, 300000)
+
+    async def test_budget_backpressure(self):
+        site = await self.make_site(memory_budget=1000)
+        budget = util.rag(site, 'memory_budget')
+        budget.charge(1000)
+        req = asyncio.ensure_future(site.items['1'].get())
+        await asyncio.sleep(0.01)
+        self.assertFalse(req.done())
+        budget.credit(1000)
+        item = await req
+        self.assertEqual(item.name, 'item-1')
+        self.assertEqual(budget.used, 0)
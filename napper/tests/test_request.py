@@ -84,6 +84,81 @@ class RequestBuilderTests(Tests):
             self.assertEqual(ureq_attr.address, 'http://www.example.org/apath')
 
 
+class RequestTemplateTests(Tests):
+    def test_attr_builder_cached(self):
+        self.assertIs(self.site.spam, self.site.spam)
+        self.assertIs(self.site.spam.ham, self.site.spam.ham)
+        self.assertIsNot(self.site['spam'], self.site['spam'])
+
+    def test_static(self):
+        tmpl = self.site.path.subpath.prepare('get')
+        self.assertIsInstance(tmpl, request.RequestTemplate)
+        self.assertEqual(tmpl.fields, frozenset())
+        self.assertRequestEqual(
+            tmpl(), 'get', 'http://www.example.org/path/subpath')
+
+    def test_placeholders(self):
+        tmpl = self.site.repos['{owner}']['{repo}'].issues.prepare('get')
+        self.assertEqual(tmpl.fields, {'owner', 'repo'})
+        req = tmpl(owner='epsy', repo='napper', state='open')
+        self.assertRequestEqual(
+            req, 'get', 'http://www.example.org/repos/epsy/napper/issues')
+        self.assertEqual(util.rag(req, 'kwargs'), {'params': {'state': 'open'}})
+        self.assertRequestEqual(
+            tmpl(owner='a', repo='b'),
+            'get', 'http://www.example.org/repos/a/b/issues')
+
+    def test_same_as_builder(self):
+        tmpl = self.site.users['{user}'].prepare('post')
+        req1 = tmpl({'data': 1}, user='eggs', param='val')
+        req2 = self.site.users.eggs.post({'data': 1}, param='val')
+        for attr in ['method', 'url', 'kwargs']:
+            self.assertEqual(util.rag(req1, attr), util.rag(req2, attr))
+
+    def test_missing_placeholder(self):
+        tmpl = self.site.users['{user}'].prepare('get')
+        with self.assertRaises(TypeError):
+            tmpl(login='eggs')
+
+    def test_bad_method(self):
+        with self.assertRaises(TypeError):
+            self.site.path.prepare('fetch')
+
+    async def test_braces_in_address(self):
+        async with self.make_site('http://www.example.org/{x}') as site:
+            self.assertRequestEqual(
+                site['{y}'].prepare('get')(y='z'),
+                'get', 'http://www.example.org/{x}/z')
+
+    async def test_send(self):
+        tmpl = self.site.path['{id}'].prepare('get')
+        req = tmpl(id=3, spam='ham')
+        with self.text_response('{"a": 1}') as mock:
+            self.assertEqual((await req).a, 1)
+            self.assertRequestMade(
+                mock, 'GET', 'http://www.example.org/path/3',
+                params={'spam': 'ham'})
+
+
+class DemagifyTests(Tests):
+    def test_view_shares_dict(self):
+        view = util.m(self.req)
+        view.spam = 'ham'
+        self.assertEqual(util.rag(self.req, 'spam'), 'ham')
+        self.assertEqual(view.method, 'GET')
+        self.assertIsInstance(self.req.method, request.MultiRequestBuilder)
+
+    def test_view_repr(self):
+        self.assertEqual(repr(util.m(self.req)), 'm({0!r})'.format(self.req))
+
+    async def test_run_once_shared_with_view(self):
+        with self.text_response('{"a": 1}') as mock:
+            await self.req
+            await util.rag(self.req, 'parsed_response')()
+            await util.m(self.req).upgraded_response()
+        self.assertEqual(mock.call_count, 1)
+
+
 class RequestTests(Tests):
     def setUp(self):
         super().setUp()
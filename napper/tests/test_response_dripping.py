@@ -123,7 +123,7 @@ class DrippingResponseTests(Tests):
 
         with await self.mock_dripping_response(p) as resp:
             async with await self.req as dripping_response:
-                itor = await type(dripping_response).__aiter__(dripping_response)
+                itor = type(dripping_response).__aiter__(dripping_response)
                 self.assertEqual('abc\n', await type(itor).__anext__(itor))
                 with self.assertRaises(ValueError):
                     await type(itor).__anext__(itor)
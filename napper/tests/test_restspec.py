@@ -29,6 +29,30 @@ class ConfigTests(Tests):
         spec = self.make_spec(base_address="http://an.address.com/")
         self.assertEqual(spec.address, "http://an.address.com")
 
+    def test_rate_limit_default(self):
+        self.assertIsNone(self.make_spec().rate_limit)
+
+    def test_rate_limit(self):
+        spec = self.make_spec(rate_limit={
+            "requests": 5000, "per": 3600, "burst": 100,
+            "remaining_header": "RateLimit-Remaining"})
+        rl = spec.rate_limit
+        self.assertEqual(rl.requests, 5000)
+        self.assertEqual(rl.per, 3600)
+        self.assertEqual(rl.burst, 100)
+        self.assertEqual(rl.remaining_header, "RateLimit-Remaining")
+        self.assertEqual(rl.reset_header, "X-RateLimit-Reset")
+
+    def test_rate_limit_invalid(self):
+        with self.assertRaises(ValueError):
+            self.make_spec(rate_limit={"requests": 0})
+        with self.assertRaises(KeyError):
+            self.make_spec(rate_limit={"per": 1})
+
+    def test_rate_limit_unknown_params(self):
+        with self.assertWarns(UnknownParameters):
+            self.make_spec(rate_limit={"requests": 1, "window": 3})
+
     def test_permalink_attr_suffix(self):
         spec = self.make_spec(permalink_attribute=[
             {"context": "attribute"}, {"matches": {"suffix": "_url"}}])
@@ -313,6 +337,76 @@ class ConditionalTests(Tests):
                 c.attr_name_hint("test")
 
 
+class ManyTests(Tests):
+    values = [
+        {'spam': 'ham', 'ham': 'spam', 'abc': 0}, {'spam': {'ham': 'eggs'}},
+        'link_a_url', 'stuff', 'link_a_url', 42, ['a', 'b'], {},
+    ]
+
+    def f(self, obj, cls=restspec.Fetcher):
+        obj = json.loads(json.dumps(obj), object_hook=restspec.WarnOnUnusedKeys)
+        return cls.from_restspec(obj)
+
+    def assertManyEqual(self, f, context=None, default=None):
+        expected = []
+        for i, value in enumerate(self.values):
+            c = context[i] if isinstance(context, list) else context
+            try:
+                expected.append(f(value, c))
+            except restspec.NoValue:
+                expected.append(default)
+        self.assertEqual(f.many(self.values, context), expected)
+
+    def test_fetchers(self):
+        for obj in [
+                42, {'attr': 'spam'}, [{'attr': 'spam'}, {'attr': 'ham'}],
+                {'attr': {'attr': 'ham'}}, {'item': 1},
+                [{'attr': 'ham'}, {'context': 'root'}, {'attr': 'spam'}],
+                {'context': 'attribute'},
+                {'if': {'is_eq': 42}, 'then': 'abc', 'else': 'def'}]:
+            with self.subTest(obj=obj):
+                f = self.f(obj)
+                self.assertManyEqual(f)
+                self.assertManyEqual(f, {'attribute': 'spam'})
+
+    def test_conditionals(self):
+        contexts = [{'attribute': name}
+                    for name in 'a_url b c_url d e f g h'.split()]
+        for obj in [
+                'always', None, {'attr_exists': 'spam'}, {'is_eq': 42},
+                {'not': {'is_eq': 'stuff'}},
+                {'any': [{'eq': ['ham', {'context': 'attribute'}]},
+                         {'is_eq': 42}]},
+                {'all': [{'attr_exists': 'spam'}, {'attr_exists': 'abc'}]},
+                [{'context': 'attribute'}, {'matches': {'suffix': '_url'}}]]:
+            with self.subTest(obj=obj):
+                c = self.f(obj, restspec.Conditional)
+                self.assertManyEqual(c, default=False)
+                self.assertManyEqual(c, contexts, default=False)
+
+    def test_default(self):
+        f = self.f({'attr': 'spam'})
+        self.assertEqual(f.many([{'spam': 1}, {}], default=0), [1, 0])
+
+    def test_context_count(self):
+        with self.assertRaises(ValueError):
+            self.f({'attr': 'spam'}).many([{}, {}], [{}])
+
+    def test_matcher_cached(self):
+        c = self.f({'matches': {'suffix': '_url'}}, restspec.Conditional)
+        matcher = c.steps[0].args[0]
+        matched = []
+        pattern = matcher.pattern
+        class CountingPattern:
+            def match(self, value):
+                matched.append(value)
+                return pattern.match(value)
+        matcher.pattern = CountingPattern()
+        self.assertEqual(c.many(['a_url', 'b', 'a_url', 'b']),
+                         [True, False, True, False])
+        self.assertEqual(matched, ['a_url', 'b'])
+
+
 class MatcherTests(Tests):
     def m(self, spec):
         return restspec.Matcher.from_restspec(self.to_config_dict(spec))
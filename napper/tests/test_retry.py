@@ -0,0 +1,164 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import email.utils
+import time
+import unittest
+
+from .util import Tests, FakeTextResponse, fut_result
+from .. import retry, util
+from ..errors import http
+
+
+def policy(statuses=None, **kwargs):
+    kwargs.setdefault('backoff', 0)
+    return retry.RetryPolicy(statuses, **kwargs)
+
+
+class PolicyTests(unittest.TestCase):
+    def test_lookup_most_specific(self):
+        p = policy({http.ServerError: 2, http.NotImplemented: 0})
+        self.assertEqual(p._lookup(p.statuses, http.BadGateway), 2)
+        self.assertEqual(p._lookup(p.statuses, http.NotImplemented), 0)
+        self.assertEqual(p._lookup(p.statuses, http.NotFound), 0)
+
+    def test_backoff(self):
+        p = retry.RetryPolicy(backoff=1, multiplier=2, max_backoff=5,
+                              jitter=False)
+        self.assertEqual([p.backoff_delay(i) for i in range(5)],
+                         [1, 2, 4, 5, 5])
+        p.jitter = True
+        for i in range(5):
+            self.assertLessEqual(p.backoff_delay(i), min(2 ** i, 5))
+
+    def test_retry_after_seconds(self):
+        resp = FakeTextResponse('', 429)
+        resp.headers['Retry-After'] = '7'
+        self.assertEqual(policy().retry_after(resp), 7)
+        self.assertEqual(policy().delay_for_response(resp, 0), 7)
+
+    def test_retry_after_date(self):
+        resp = FakeTextResponse('', 503)
+        resp.headers['Retry-After'] = email.utils.formatdate(
+            time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(policy().retry_after(resp), 30, delta=2)
+
+    def test_retry_after_bad(self):
+        resp = FakeTextResponse('', 503)
+        resp.headers['Retry-After'] = 'soon'
+        self.assertIsNone(policy().retry_after(resp))
+
+    def test_retry_after_too_long(self):
+        resp = FakeTextResponse('', 429)
+        resp.headers['Retry-After'] = '3600'
+        self.assertIsNone(policy(max_retry_after=60).delay_for_response(
+            resp, 0))
+
+    def test_budget(self):
+        budget = retry.RetryBudget(ratio=0.5, reserve=1, window=2)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        for _ in range(10):
+            budget.deposit()
+        self.assertEqual(budget.tokens, 2)
+
+
+class RetryTests(Tests):
+    async def retry_site(self, policy, **kwargs):
+        manager = self.sfactory(retry=policy, **kwargs)
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        return site
+
+    def responses(self, *statuses, req):
+        return self.mock_responses(
+            *(FakeTextResponse('{"status": %d}' % s, s) for s in statuses),
+            req=req)
+
+    async def test_retry_then_success(self):
+        site = await self.retry_site(policy())
+        req = site.path.get()
+        with self.responses(429, 503, 200, req=req) as mock:
+            self.assertEqual((await req).status, 200)
+        self.assertEqual(mock.call_count, 3)
+
+    async def test_released(self):
+        site = await self.retry_site(policy())
+        req = site.path.get()
+        first = FakeTextResponse('{}', 429)
+        with self.mock_responses(first, FakeTextResponse('{}'), req=req):
+            await req
+        self.assertTrue(first.closed)
+
+    async def test_exhausted(self):
+        site = await self.retry_site(policy({http.TooManyRequests: 2}))
+        req = site.path.get()
+        with self.responses(429, 429, 429, 200, req=req) as mock:
+            with self.assertRaises(http.TooManyRequests) as r:
+                await req
+        self.assertEqual(mock.call_count, 3)
+        self.assertEqual(r.exception.response.status, 429)
+
+    async def test_not_retried(self):
+        site = await self.retry_site(policy())
+        req = site.path.get()
+        with self.responses(404, 200, req=req) as mock:
+            with self.assertRaises(http.NotFound):
+                await req
+        self.assertEqual(mock.call_count, 1)
+
+    async def test_expected_not_retried(self):
+        site = await self.retry_site(policy())
+        req = site.path.get()
+        req.expected = http.Any
+        with self.responses(503, 200, req=req) as mock:
+            self.assertEqual((await req).status, 503)
+        self.assertEqual(mock.call_count, 1)
+
+    async def test_request_override(self):
+        site = await self.retry_site(policy())
+        req = site.path.get()
+        req.retry = False
+        with self.responses(503, 200, req=req) as mock:
+            with self.assertRaises(http.ServiceUnavailable):
+                await req
+        self.assertEqual(mock.call_count, 1)
+
+        req = self.site.path.get()
+        req.retry = policy()
+        with self.responses(503, 200, req=req) as mock:
+            await req
+        self.assertEqual(mock.call_count, 2)
+
+    async def test_exception(self):
+        site = await self.retry_site(
+            policy(exceptions={ConnectionError: 1}))
+        req = site.path.get()
+        with self.mock_responses(req=req) as mock:
+            mock.side_effect = [
+                ConnectionResetError(), fut_result(FakeTextResponse('1'))]
+            self.assertEqual(await req, 1)
+        self.assertEqual(mock.call_count, 2)
+
+    async def test_budget_shared(self):
+        site = await self.retry_site(
+            policy(budget=retry.RetryBudget(ratio=0, reserve=1)))
+        req1 = site.path.get()
+        with self.responses(503, 200, req=req1):
+            await req1
+        req2 = site.path.get()
+        with self.responses(503, 200, req=req2):
+            with self.assertRaises(http.ServiceUnavailable):
+                await req2
+
+    async def test_stats(self):
+        site = await self.retry_site(policy(), stats=True)
+        req = site.path.get()
+        with self.responses(429, 429, 200, req=req):
+            await req
+        endpoint = site.stats()['GET /path']
+        self.assertEqual(endpoint.counters['retries'], 2)
+        self.assertEqual(endpoint.count(http.TooManyRequests), 2)
+        self.assertEqual(endpoint.count(http.OK), 1)
+        self.assertEqual(endpoint.latency.count, 1)
+        self.assertEqual(util.rag(req, 'timings').attempts, 3)
@@ -0,0 +1,96 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import asyncio
+import random
+import statistics
+import unittest
+
+import aiohttp
+
+from .util import Tests
+from .. import retry
+from ..bench import sim
+from ..errors import http
+from ..response import BytesResponse
+
+
+class DistributionTests(unittest.TestCase):
+    def test_lognormal(self):
+        rng = random.Random(1)
+        dist = sim.lognormal(0.05, 0.5)
+        samples = [dist(rng) for _ in range(2000)]
+        self.assertAlmostEqual(statistics.median(samples), 0.05, delta=0.005)
+        self.assertGreater(max(samples), 0.15)
+
+    def test_outcome_rates(self):
+        server = sim.SimulatedServer(
+            errors={429: 0.2, 503: 0.1}, resets=0.1, seed=1)
+        outcomes = [server.outcome() for _ in range(5000)]
+        self.assertAlmostEqual(outcomes.count(429) / 5000, 0.2, delta=0.03)
+        self.assertAlmostEqual(outcomes.count(503) / 5000, 0.1, delta=0.03)
+        self.assertAlmostEqual(
+            outcomes.count('reset') / 5000, 0.1, delta=0.03)
+
+
+class SimulatedServerTests(Tests):
+    def setUp(self):
+        super().setUp()
+        self.req = self.site.items['1'].get()
+
+    async def test_pass_through(self):
+        server = sim.SimulatedServer()
+        with self.simulate(server):
+            item = await self.req
+        self.assertEqual(item.name, 'item-1')
+        self.assertEqual(server.stats['ok'], 1)
+
+    async def test_latency(self):
+        loop = asyncio.get_event_loop()
+        with self.simulate(sim.SimulatedServer(latency=sim.fixed(0.05))):
+            start = loop.time()
+            await self.req
+        self.assertGreaterEqual(loop.time() - start, 0.05)
+
+    async def test_errors(self):
+        server = sim.SimulatedServer(errors={429: 1}, retry_after=7)
+        with self.simulate(server):
+            with self.assertRaises(http.TooManyRequests) as cm:
+                await self.req
+        self.assertEqual(
+            cm.exception.request._response.headers['Retry-After'], '7')
+
+    async def test_retried(self):
+        server = sim.SimulatedServer(errors={503: 0.5}, seed=3)
+        self.req.retry = retry.RetryPolicy(
+            {http.ServiceUnavailable: 20}, backoff=0)
+        with self.simulate(server):
+            item = await self.req
+        self.assertEqual(item.id, 1)
+        self.assertGreater(server.stats[503], 0)
+        self.assertEqual(server.stats['ok'], 1)
+
+    async def test_reset(self):
+        with self.simulate(sim.SimulatedServer(resets=1)):
+            with self.assertRaises(aiohttp.ServerDisconnectedError):
+                await self.req
+
+    async def test_bandwidth(self):
+        loop = asyncio.get_event_loop()
+        server = sim.SimulatedServer(bandwidth=200000, chunk_size=10000)
+        req = self.site.blob.get(size=20000)
+        req.response_type = BytesResponse()
+        with self.simulate(server, req=req):
+            start = loop.time()
+            body = await req
+        self.assertGreaterEqual(loop.time() - start, 0.1)
+        self.assertEqual(len(body), 20000)
+        self.assertEqual(body[:3], b'\x00\x01\x02')
+
+    async def test_capacity(self):
+        server = sim.SimulatedServer(latency=0.01, capacity=2)
+        reqs = [self.site.items[str(i)].get() for i in range(6)]
+        with self.simulate(server):
+            items = await asyncio.gather(*reqs)
+        self.assertEqual([item.id for item in items], list(range(6)))
+        self.assertEqual(server.peak_in_flight, 2)
@@ -0,0 +1,135 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import os
+import tempfile
+import unittest
+
+from .util import Tests
+from .. import stats, errors
+
+
+class HistogramTests(unittest.TestCase):
+    def test_observe(self):
+        h = stats.Histogram((1, 2, 4))
+        for value in [0.5, 1, 1.5, 3, 10]:
+            h.observe(value)
+        self.assertEqual(h.counts, [2, 1, 1, 1])
+        self.assertEqual(h.count, 5)
+        self.assertEqual(h.sum, 16)
+        self.assertEqual(list(h.cumulative()),
+                         [(1, 2), (2, 3), (4, 4), (float('inf'), 5)])
+
+    def test_percentile(self):
+        h = stats.Histogram((1, 2, 4))
+        self.assertIsNone(h.percentile(50))
+        for _ in range(10):
+            h.observe(1.5)
+        self.assertEqual(h.percentile(50), 1.5)
+        self.assertEqual(h.percentile(100), 2)
+        h.observe(100)
+        self.assertEqual(h.percentile(100), 4)
+
+    def test_merge(self):
+        h1 = stats.Histogram((1, 2))
+        h2 = stats.Histogram((1, 2))
+        h1.observe(0.5)
+        h2.observe(1.5)
+        h1.merge(h2)
+        self.assertEqual(h1.counts, [1, 1, 0])
+        with self.assertRaises(ValueError):
+            h1.merge(stats.Histogram((1, 3)))
+
+
+class StatsTests(Tests):
+    async def stats_site(self, **kwargs):
+        manager = self.sfactory(stats=stats.StatsCollector(**kwargs))
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        return site
+
+    def test_disabled(self):
+        with self.assertRaises(ValueError):
+            self.site.stats()
+
+    def test_stats_path(self):
+        self.assertRequestEqual(
+            self.site['stats'].get(), 'get', 'http://www.example.org/stats')
+
+    async def test_counts(self):
+        site = await self.stats_site()
+        tmpl = site.items['{id}'].prepare('get')
+        for i, status in enumerate([200, 200, 404, 429, 503]):
+            req = tmpl(id=i)
+            with self.text_response('{}', status, req=req):
+                try:
+                    await req
+                except errors.http.Any:
+                    pass
+        req = site.other.get(page=2)
+        with self.text_response('{}', req=req):
+            await req
+
+        collector = site.stats()
+        self.assertEqual(list(collector), ['GET /items/{id}', 'GET /other'])
+        items = collector['GET /items/{id}']
+        self.assertEqual(items.count(), 5)
+        self.assertEqual(items.count(errors.http.Success), 2)
+        self.assertEqual(items.count(errors.http.ClientError), 2)
+        self.assertEqual(items.count(errors.http.TooManyRequests), 1)
+        self.assertEqual(items.count(errors.http.ServerError), 1)
+        self.assertEqual(items.latency.count, 5)
+        self.assertEqual(collector.count(errors.http.OK), 3)
+
+        snap = collector.snapshot()
+        self.assertEqual(snap['GET /items/{id}']['statuses'],
+                         {'OK': 2, 'NotFound': 1, 'TooManyRequests': 1,
+                          'ServiceUnavailable': 1})
+        self.assertEqual(snap['GET /other']['requests'], 1)
+
+    async def test_max_endpoints(self):
+        site = await self.stats_site(max_endpoints=2)
+        for name in ['a', 'b', 'c', 'd']:
+            req = site[name].get()
+            with self.text_response('{}', req=req):
+                await req
+        collector = site.stats()
+        self.assertEqual(list(collector), ['GET /a', 'GET /b', '<other>'])
+        self.assertEqual(collector['<other>'].count(), 2)
+
+    async def test_exception(self):
+        site = await self.stats_site()
+        req = site.a.get()
+        with self.mock_responses(req=req) as mock:
+            mock.side_effect = ConnectionResetError
+            with self.assertRaises(ConnectionResetError):
+                await req
+        summary = site.stats()['GET /a'].summary()
+        self.assertEqual(summary['statuses'], {'ConnectionResetError': 1})
+        self.assertEqual(summary['requests'], 1)
+
+    async def test_prometheus(self):
+        site = await self.stats_site()
+        req = site['a"b'].get()
+        with self.text_response('{}', req=req):
+            await req
+        collector = site.stats()
+        collector.incr(req, 'retries')
+        collector.set_gauge('concurrency_limit', 8)
+        text = collector.prometheus()
+        self.assertIn(
+            'napper_requests_total{endpoint="GET /a\\"b",status="OK"} 1\n',
+            text)
+        self.assertIn('napper_request_duration_seconds_bucket'
+                      '{endpoint="GET /a\\"b",le="+Inf"} 1\n', text)
+        self.assertIn('napper_request_duration_seconds_count'
+                      '{endpoint="GET /a\\"b"} 1\n', text)
+        self.assertIn('napper_retries_total{endpoint="GET /a\\"b"} 1\n', text)
+        self.assertIn('napper_concurrency_limit 8\n', text)
+
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'napper.prom')
+            collector.write_prometheus(path)
+            with open(path) as f:
+                self.assertEqual(f.read(), text)
+            self.assertEqual(os.listdir(d), ['napper.prom'])
@@ -0,0 +1,51 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import asyncio
+import concurrent.futures
+import unittest
+
+from ..bench import server, suite
+from ..errors import http
+from ..sync import SyncSession
+from ..transport import AppTransport
+
+
+class SyncSessionTests(unittest.TestCase):
+    def setUp(self):
+        factory = suite.BenchContext('http://napper.test').factory
+        self.client = SyncSession(
+            factory, transport=AppTransport(server.make_app()))
+        self.addCleanup(self.client.close)
+
+    def test_wait(self):
+        item = self.client.wait(self.client.site.items['4'].get())
+        self.assertEqual(item.name, 'item-4')
+
+    def test_error(self):
+        with self.assertRaises(http.NotFound):
+            self.client.wait(self.client.site.nothing.get())
+
+    def test_iterate(self):
+        req = self.client.site.pages.get(per_page=4, pages=3)
+        ids = [item['id'] for item in self.client.iterate(req, prefetch=5)]
+        self.assertEqual(ids, list(range(12)))
+
+    def test_threads(self):
+        site = self.client.site
+
+        def fetch(i):
+            return self.client.wait(site.items[str(i)].get()).id
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            self.assertEqual(list(pool.map(fetch, range(40))),
+                             list(range(40)))
+
+    def test_timeout(self):
+        with self.assertRaises(concurrent.futures.TimeoutError):
+            self.client.wait(asyncio.sleep(10), timeout=0.01)
+
+    def test_close(self):
+        loop = self.client.loop
+        self.client.close()
+        self.assertTrue(loop.is_closed())
+        self.client.close()
@@ -0,0 +1,149 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from .util import Tests, FakeTextResponse, fut_result
+from .. import breaker, limit, restspec, retry, util
+from ..errors import RequestTimeoutError, http
+from ..timeout import Deadline, Timeout, time_left
+
+
+class HangingResponse(FakeTextResponse):
+    async def text(self, encoding=None):
+        await asyncio.Future()
+
+
+class DeadlineTests(unittest.TestCase):
+    def test_earliest(self):
+        a = Deadline(10, now=0)
+        b = Deadline(5, now=0)
+        self.assertIs(Deadline.earliest(a, None, b), b)
+        self.assertIsNone(Deadline.earliest(None, None))
+
+    def test_time_left(self):
+        self.assertIsNone(time_left(None, None))
+        self.assertEqual(time_left(3, None), 3)
+        self.assertEqual(time_left(3, Deadline(100)), 3)
+        self.assertLessEqual(time_left(100, Deadline(3)), 3)
+        self.assertLessEqual(time_left(None, Deadline(3)), 3)
+
+    def test_client_timeout(self):
+        self.assertIsNone(Timeout(10, headers=5, parse=1).client_timeout())
+        ct = Timeout(connect=2, body=3).client_timeout()
+        self.assertEqual((ct.total, ct.sock_connect, ct.sock_read),
+                         (None, 2, 3))
+
+
+class RequestTimeoutTests(Tests):
+    def responses(self, *responses, req=None):
+        """Like `mock_responses`, but futures are returned as-is so that
+        they can be left pending"""
+        site = util.rag(self.req if req is None else req, 'site')
+        return patch.object(site.session, 'request', side_effect=[
+            r if isinstance(r, asyncio.Future) else fut_result(r)
+            for r in responses])
+
+    async def test_headers(self):
+        self.req.timeout = Timeout(headers=0.01)
+        with self.responses(asyncio.Future()):
+            with self.assertRaises(RequestTimeoutError) as cm:
+                await self.req
+        self.assertEqual(cm.exception.stage, 'headers')
+        self.assertIsInstance(cm.exception, asyncio.TimeoutError)
+
+    async def test_session_timeout(self):
+        manager = self.sfactory(timeout=Timeout(headers=0.01))
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        req = site.path.get()
+        with self.responses(asyncio.Future(), req=req):
+            with self.assertRaises(RequestTimeoutError):
+                await req
+
+    async def test_parse(self):
+        self.req.timeout = Timeout(parse=0.01)
+        resp = HangingResponse('{}')
+        with self.mock_responses(resp):
+            with self.assertRaises(RequestTimeoutError) as cm:
+                await self.req
+        self.assertEqual(cm.exception.stage, 'parse')
+        self.assertTrue(resp.closed)
+
+    async def test_client_timeout(self):
+        timeout = Timeout(connect=2, body=3)
+        self.req.timeout = timeout
+        with self.text_response('{}') as mock:
+            await self.req
+        self.assertRequestMade(mock, 'GET', 'http://www.example.org/res',
+                               timeout=timeout.client_timeout())
+
+    async def test_deadline(self):
+        self.req.deadline = Deadline(0.01)
+        with self.responses(asyncio.Future()):
+            with self.assertRaises(RequestTimeoutError) as cm:
+                await self.req
+        self.assertEqual(cm.exception.stage, 'deadline')
+
+    async def test_parse_deadline(self):
+        self.req.deadline = Deadline(0.01)
+        with self.mock_responses(HangingResponse('{}')):
+            with self.assertRaises(RequestTimeoutError) as cm:
+                await self.req
+        self.assertEqual(cm.exception.stage, 'deadline')
+
+    async def test_limits_see_timeouts(self):
+        cb = breaker.CircuitBreaker(3)
+        c = limit.AdaptiveConcurrency(8)
+        manager = self.sfactory(timeout=Timeout(headers=0.01),
+                                circuit_breaker=cb, concurrency=c)
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        for _ in range(3):
+            req = site.path.get()
+            with self.responses(asyncio.Future(), req=req):
+                with self.assertRaises(RequestTimeoutError):
+                    await req
+        self.assertEqual(cb.state('http://www.example.org/'), 'open')
+        self.assertEqual(c.limit, 1)
+        self.assertEqual(c.in_flight, 0)
+
+    async def test_deadline_stops_retries(self):
+        self.req.retry = retry.RetryPolicy(backoff=10, jitter=False)
+        self.req.timeout = Timeout(1)
+        with self.text_response('{}', 503) as mock:
+            with self.assertRaises(http.ServiceUnavailable):
+                await self.req
+        self.assertEqual(mock.call_count, 1)
+
+    async def test_chain(self):
+        util.rag(self.site, 'spec').is_permalink_attr = \
+            restspec.Conditional.from_restspec(self.to_config_dict(
+                [{'context': 'attribute'},
+                 {'matches': {'pattern': '^thing$'}}]))
+        self.req.deadline = Deadline(0.05)
+        with self.responses(
+                FakeTextResponse(
+                    '{"thing": "http://www.example.org/other_res"}'),
+                asyncio.Future()):
+            with self.assertRaises(RequestTimeoutError):
+                await self.req.thing.get()
+
+    async def test_paginator(self):
+        self.read_restspec(paginated_object={
+                "when": {"attr_exists": "list"},
+                "content": {"attr": "list"},
+                "next": {"attr": "after"}
+            })
+        req = self.site.path.get()
+        req.deadline = Deadline(0.05)
+        with self.responses(
+                FakeTextResponse('{"list": [1, 2, 3],'
+                                 ' "after": "http://www.example.org/eggs"}'),
+                asyncio.Future(), req=req):
+            paginator = await req
+            self.assertEqual(await paginator.item(2), 3)
+            with self.assertRaises(RequestTimeoutError):
+                await paginator.item(3)
@@ -0,0 +1,104 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import json
+
+from .util import Tests
+from .. import transport
+from ..bench import server, suite
+from ..errors import http
+from ..response import BytesResponse, DrippingResponse
+from ..util import get_aiter, rag
+
+
+ADDRESS = 'http://napper.test'
+
+
+async def asgi_app(scope, receive, send):
+    message = await receive()
+    body = json.dumps({
+        'method': scope['method'],
+        'path': scope['path'],
+        'query': scope['query_string'].decode(),
+        'body': message['body'].decode(),
+    }).encode()
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': body[:10],
+                'more_body': True})
+    await send({'type': 'http.response.body', 'body': body[10:]})
+
+
+class BodyStreamTests(Tests):
+    async def test_read(self):
+        stream = transport.BodyStream()
+        stream.feed_data(b'ab\ncd')
+        self.assertEqual(await stream.readline(), b'ab\n')
+        self.assertEqual(await stream.read(1), b'c')
+        stream.feed_eof()
+        self.assertEqual(await stream.read(), b'd')
+        self.assertTrue(stream.at_eof())
+
+    async def test_exception(self):
+        stream = transport.BodyStream()
+        stream.set_exception(ValueError())
+        with self.assertRaises(ValueError):
+            await stream.read()
+
+
+class AppTransportTests(Tests):
+    async def app_site(self, app):
+        factory = suite.BenchContext(ADDRESS).factory
+        manager = factory(transport=transport.AppTransport(app))
+        self.assertIsNone(manager.http_session)
+        site = await type(manager).__aenter__(manager)
+        self.addAsyncCleanup(type(manager).__aexit__(manager, None, None, None))
+        return site
+
+    async def test_aiohttp_app(self):
+        site = await self.app_site(server.make_app())
+        item = await site.items['3'].get()
+        self.assertEqual(item.name, 'item-3')
+        self.assertIsNone(rag(site, 'session'))
+
+    async def test_not_found(self):
+        site = await self.app_site(server.make_app())
+        with self.assertRaises(http.NotFound):
+            await site.nothing.get()
+
+    async def test_pagination(self):
+        site = await self.app_site(server.make_app())
+        paginator = await site.pages.get(per_page=5, pages=3)
+        self.assertEqual(await suite.drain_paginator(paginator), 15)
+
+    async def test_dripping(self):
+        site = await self.app_site(server.make_app())
+        req = site.drip.get(lines=50, every=7)
+        req.response_type = DrippingResponse(BytesResponse())
+        ids = []
+        async with await req as dripper:
+            itor = await get_aiter(dripper)
+            while True:
+                try:
+                    item = await type(itor).__anext__(itor)
+                except StopAsyncIteration:
+                    break
+                ids.append(json.loads(item.decode())['id'])
+        self.assertEqual(ids, list(range(50)))
+
+    async def test_asgi_app(self):
+        site = await self.app_site(asgi_app)
+        resp = await site.echo.post('data', q='1')
+        self.assertEqual(dict(resp), {
+            'method': 'POST', 'path': '/echo', 'query': 'q=1',
+            'body': 'data'})
+
+    async def test_release_unread(self):
+        app_transport = transport.AppTransport(server.make_app())
+        resp = await app_transport.request(
+            'GET', ADDRESS + '/drip', params={'lines': 100000})
+        self.assertEqual(resp.status, 200)
+        await resp.release()
+        self.assertTrue(resp.closed)
+        self.assertTrue(resp.content.at_eof())
+        await app_transport.close()
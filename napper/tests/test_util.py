@@ -0,0 +1,57 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+import asyncio
+import unittest
+from unittest.mock import patch
+
+from .. import util
+
+
+class FakeUvloop:
+    class EventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+        loop = None
+
+        def get_event_loop(self):
+            if self.loop is None:
+                raise RuntimeError("There is no current event loop")
+            return self.loop
+
+        def set_event_loop(self, loop):
+            self.loop = loop
+
+
+class RunTests(unittest.TestCase):
+    def setUp(self):
+        policy = asyncio.get_event_loop_policy()
+        loop = asyncio.get_event_loop()
+        self.addCleanup(asyncio.set_event_loop, loop)
+        self.addCleanup(asyncio.set_event_loop_policy, policy)
+
+    async def answer(self):
+        return 42
+
+    def test_tune(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        loop.set_debug(True)
+        util.tune_loop(loop, debug=False, slow_callback_duration=0.5)
+        self.assertFalse(loop.get_debug())
+        self.assertEqual(loop.slow_callback_duration, 0.5)
+        util.tune_loop(loop)
+        self.assertFalse(loop.get_debug())
+
+    def test_no_uvloop(self):
+        with patch.object(util, '_uvloop', None):
+            self.assertFalse(util.install_uvloop())
+            self.assertEqual(util.run(self.answer(), uvloop=True), 42)
+
+    def test_uvloop(self):
+        with patch.object(util, '_uvloop', FakeUvloop):
+            self.assertTrue(util.install_uvloop())
+            policy = asyncio.get_event_loop_policy()
+            self.assertIsInstance(policy, FakeUvloop.EventLoopPolicy)
+            self.assertTrue(util.install_uvloop())
+            self.assertIs(asyncio.get_event_loop_policy(), policy)
+            self.assertEqual(util.run(self.answer(), uvloop=True), 42)
+            asyncio.get_event_loop().close()
@@ -11,7 +11,7 @@ import warnings
 import io
 import sys
 
-import aiohttp
+from multidict import CIMultiDict
 
 from ..util import rag
 from ..request import Request, SessionFactory
@@ -39,7 +39,7 @@ class FakeTextResponse(object):
             hdr = ctype
             if charset is not None:
                 hdr += "; charset=" + charset
-            self.headers = aiohttp.CIMultiDict([
+            self.headers = CIMultiDict([
                 ("Content-Type", hdr)
             ])
         self.closed = False
@@ -60,6 +60,16 @@ class FakeTextResponse(object):
         self.closed = True
 
 
+class Clock:
+    """A clock for the ``clock`` parameter of limiters and breakers that
+    only moves when ``now`` is set"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
 def fut_result(result):
     ret = asyncio.Future()
     ret.set_result(result)
@@ -146,13 +156,22 @@ class Tests(unittest.TestCase, metaclass=TestsMeta):
         return patch.object(site.session, 'request', side_effect=(
             fut_result(response) for response in responses))
 
+    def simulate(self, sim, *, req=None):
+        """Routes the requests of ``req``'s session to ``sim``, a
+        `napper.bench.sim.SimulatedServer`"""
+        if req is None:
+            req = self.req
+        site = rag(req, 'site')
+        return patch.object(site.session, 'request', side_effect=sim.request)
+
     def text_response(self, text, status=200, *, req=None):
         return self.text_responses(text, final_status=status, req=req)
 
     def text_responses(self, *responses, final_status=200, req=None):
         return self.mock_responses(*(
             FakeTextResponse(text, final_status if not i else 200)
-            for i, text in enumerate(responses, 1 - len(responses))))
+            for i, text in enumerate(responses, 1 - len(responses))),
+            req=req)
 
     def assertRequestMade(self, mock, method, url, params={}, **kwargs):
         return mock.assert_called_once_with(
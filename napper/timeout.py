@@ -0,0 +1,126 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""Bounding how long requests take.
+
+A `Timeout` limits each stage of a request. Pass one to the session
+factory, or set it on a single request::
+
+    async with factory(timeout=Timeout(30, headers=10)) as site:
+        req = site.path.get()
+        req.timeout = Timeout(parse=5)
+
+A `Deadline` bounds a request along with the requests that follow from
+it: those made by chaining attributes and calls on the request, and the
+page fetches of a paginated response::
+
+    req = site.items.get()
+    req.deadline = Deadline(60)
+    async for item in await req:
+        ...
+
+Exceeding either raises `.errors.RequestTimeoutError`.
+"""
+import asyncio
+
+import aiohttp
+
+from .errors import RequestTimeoutError
+from .instrument import clock
+
+
+class Timeout:
+    """Time limits for the stages of a request, in seconds. None means
+    no limit.
+
+    :param total: the whole request, including retries and parsing
+    :param connect: establishing a connection to the server
+    :param headers: each attempt at obtaining the response headers,
+        including waiting on the session's rate and concurrency limits
+    :param body: the longest pause while reading the response body
+    :param parse: the ``'parse'`` stage, which reads and decodes the body
+
+    ``connect`` and ``body`` are enforced by the HTTP session. When either
+    is set, they replace the session's own ``aiohttp.ClientTimeout``.
+    """
+    __slots__ = ('total', 'connect', 'headers', 'body', 'parse')
+
+    def __init__(self, total=None, *, connect=None, headers=None,
+                 body=None, parse=None):
+        self.total = total
+        self.connect = connect
+        self.headers = headers
+        self.body = body
+        self.parse = parse
+
+    def __repr__(self):
+        return '<Timeout {0}>'.format(', '.join(
+            '{0}={1}'.format(name, getattr(self, name))
+            for name in self.__slots__ if getattr(self, name) is not None))
+
+    def client_timeout(self):
+        """Returns the `aiohttp.ClientTimeout` enforcing ``connect`` and
+        ``body``, or None if neither is set"""
+        if self.connect is None and self.body is None:
+            return None
+        return aiohttp.ClientTimeout(
+            total=None, sock_connect=self.connect, sock_read=self.body)
+
+
+class Deadline:
+    """A point in time, ``seconds`` from now, by which requests must
+    complete."""
+    __slots__ = ('when',)
+
+    def __init__(self, seconds, *, now=None):
+        self.when = (clock() if now is None else now) + seconds
+
+    def __repr__(self):
+        return '<Deadline in {0:.3f}s>'.format(self.remaining())
+
+    def remaining(self):
+        return self.when - clock()
+
+    @staticmethod
+    def earliest(*deadlines):
+        """Returns the earliest of ``deadlines``, ignoring Nones"""
+        ret = None
+        for deadline in deadlines:
+            if deadline is not None and (ret is None
+                                         or deadline.when < ret.when):
+                ret = deadline
+        return ret
+
+
+def time_left(seconds, deadline):
+    """Returns the smallest of ``seconds`` and the time left before
+    ``deadline``, either of which may be None"""
+    if deadline is None:
+        return seconds
+    remaining = deadline.remaining()
+    if seconds is None or remaining < seconds:
+        return remaining
+    return seconds
+
+
+async def within(awaitable, seconds, stage, deadline=None):
+    """Awaits ``awaitable``, raising `.errors.RequestTimeoutError` if it
+    takes more than ``seconds``, unless that is None, or runs past
+    ``deadline``. The error's stage is ``'deadline'`` if the deadline ran
+    out first."""
+    if deadline is not None:
+        remaining = deadline.remaining()
+        if seconds is None or remaining < seconds:
+            seconds, stage = remaining, 'deadline'
+    if seconds is None:
+        return await awaitable
+    if seconds <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise RequestTimeoutError(stage, 0.0)
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except asyncio.TimeoutError as exc:
+        if isinstance(exc, (RequestTimeoutError, aiohttp.ClientError)):
+            raise
+        raise RequestTimeoutError(stage, seconds) from None
@@ -0,0 +1,524 @@
+# napper -- A REST Client for Python
+# Copyright (C) 2016 by Yann Kaiser and contributors.
+# See AUTHORS and COPYING for details.
+"""How a `Session` sends its requests.
+
+By default requests go through an `aiohttp.ClientSession`, wrapped in an
+`AiohttpTransport`. Other transports can be passed to the session
+factory::
+
+    async with factory(transport=AppTransport(app)) as site:
+        ...
+
+`AppTransport` hands requests straight to an `aiohttp.web.Application`
+or an ASGI application in the same process, without sockets. Responses
+are delivered as the application produces them, so streamed bodies work
+with `.response.DrippingResponse`.
+
+A transport's ``request`` method takes the same arguments as
+``aiohttp.ClientSession.request`` and returns an awaitable resolving to
+a response once its headers are available. Responses need the ``status``
+and ``headers`` attributes, ``read``, ``text``, ``json`` and ``release``
+coroutine methods, and a ``content`` stream, like
+`aiohttp.ClientResponse`. The ``data`` argument may also be a
+`.body.StreamBody`, to be sent as it is read.
+"""
+import asyncio
+import json
+import urllib.parse
+
+import aiohttp
+import aiohttp.abc
+from aiohttp import web
+from aiohttp.http import HttpVersion11
+from aiohttp.http_parser import RawRequestMessage
+from multidict import CIMultiDict, CIMultiDictProxy
+import yarl
+
+from .body import StreamBody
+
+
+class Transport:
+    """Base class for transports"""
+    def request(self, method, url, *args, **kwargs):
+        raise NotImplementedError
+
+    async def close(self):
+        """Frees the resources held by the transport"""
+
+
+class AiohttpTransport(Transport):
+    """Sends requests over the network with an `aiohttp.ClientSession`,
+    which remains available as ``session``."""
+    def __init__(self, session):
+        self.session = session
+
+    def __repr__(self):
+        return '<AiohttpTransport {0!r}>'.format(self.session)
+
+    def request(self, method, url, *args, **kwargs):
+        data = kwargs.get('data')
+        if isinstance(data, StreamBody):
+            kwargs['data'] = data.chunks()
+            if data.size is not None:
+                kwargs['headers'] = _with_length(
+                    kwargs.get('headers'), data.size)
+        return self.session.request(method, url, *args, **kwargs)
+
+
+def _with_length(headers, size):
+    headers = CIMultiDict(headers or {})
+    headers.setdefault('Content-Length', str(size))
+    return headers
+
+
+class BodyStream:
+    """An in-memory response body, read with the same methods as
+    `aiohttp.StreamReader`.
+
+    Writers wait in `drain` while more than ``limit`` bytes are buffered.
+    """
+    def __init__(self, limit=2 ** 16):
+        self.limit = limit
+        self._buffer = bytearray()
+        self._eof = False
+        self._exception = None
+        self._waiter = None
+        self._drain_waiter = None
+
+    def __repr__(self):
+        return '<BodyStream {0} bytes{1}>'.format(
+            len(self._buffer), ', eof' if self._eof else '')
+
+    @staticmethod
+    def _wake(waiter):
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def feed_data(self, data):
+        if self._eof:
+            return
+        self._buffer.extend(data)
+        self._wake(self._waiter)
+
+    def feed_eof(self):
+        self._eof = True
+        self._wake(self._waiter)
+        self._wake(self._drain_waiter)
+
+    def set_exception(self, exc):
+        self._exception = exc
+        self.feed_eof()
+
+    def exception(self):
+        return self._exception
+
+    def at_eof(self):
+        return self._eof and not self._buffer
+
+    def is_eof(self):
+        return self._eof
+
+    def close(self):
+        """Discards the buffered data and anything written later"""
+        self._buffer.clear()
+        self.feed_eof()
+
+    async def drain(self):
+        while len(self._buffer) > self.limit and not self._eof:
+            self._drain_waiter = asyncio.Future()
+            try:
+                await self._drain_waiter
+            finally:
+                self._drain_waiter = None
+
+    async def _wait_for_data(self, func_name):
+        if self._exception is not None:
+            raise self._exception
+        if self._eof:
+            return
+        self._waiter = asyncio.Future()
+        try:
+            await self._waiter
+        finally:
+            self._waiter = None
+        if self._exception is not None:
+            raise self._exception
+
+    def _take(self, n):
+        if n < 0 or n >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:n])
+            del self._buffer[:n]
+        self._wake(self._drain_waiter)
+        return data
+
+    async def read(self, n=-1):
+        if n < 0:
+            chunks = []
+            while True:
+                if self._buffer:
+                    chunks.append(self._take(-1))
+                if self._eof:
+                    break
+                await self._wait_for_data('read')
+            if self._exception is not None:
+                raise self._exception
+            return b''.join(chunks)
+        while not self._buffer and not self._eof:
+            await self._wait_for_data('read')
+        if self._exception is not None:
+            raise self._exception
+        return self._take(n)
+
+    async def readany(self):
+        return await self.read(len(self._buffer) or self.limit)
+
+    async def readline(self):
+        while b'\n' not in self._buffer and not self._eof:
+            await self._wait_for_data('readline')
+        end = self._buffer.find(b'\n')
+        return self._take(-1 if end < 0 else end + 1)
+
+
+class InProcessResponse:
+    """A response produced in this process, by an `AppTransport` or a
+    `.cassette.ReplayTransport`.
+
+    ``producer`` may be set to the task feeding ``content``. It is
+    cancelled when the response is released.
+    """
+    def __init__(self, method, url):
+        self.method = method
+        self.url = url
+        self.status = None
+        self.reason = None
+        self.headers = None
+        self.content = BodyStream()
+        self.closed = False
+        self._body = None
+        self._started = asyncio.Future()
+        self.producer = None
+
+    def __repr__(self):
+        return '<InProcessResponse [{0} {1}] {2}>'.format(
+            self.method, self.url, self.status)
+
+    def start(self, status, reason, headers):
+        """Makes the response available with the given status line and
+        headers. The body is then fed to ``content``."""
+        if self._started.done():
+            return
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._started.set_result(self)
+
+    def fail(self, exc):
+        """Raises ``exc`` to whoever awaits the response or reads its
+        body"""
+        if not self._started.done():
+            self._started.set_exception(exc)
+        else:
+            self.content.set_exception(exc)
+
+    def get_encoding(self):
+        ctype = self.headers.get('Content-Type', '')
+        for param in ctype.split(';')[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.lower() == 'charset' and value:
+                return value.strip('"')
+        return 'utf-8'
+
+    async def read(self):
+        if self._body is None:
+            self._body = await self.content.read()
+            await self.release()
+        return self._body
+
+    async def text(self, encoding=None):
+        body = await self.read()
+        return body.decode(encoding or self.get_encoding())
+
+    async def json(self, encoding=None, loads=json.loads):
+        return loads(await self.text(encoding))
+
+    def close(self):
+        self.closed = True
+        if self.producer is not None and not self.producer.done():
+            self.producer.cancel()
+        if self._body is None:
+            self.content.close()
+
+    async def release(self):
+        self.close()
+
+
+class _Writer(aiohttp.abc.AbstractStreamWriter):
+    """Passes what an `aiohttp.web.StreamResponse` writes on to an
+    `InProcessResponse`"""
+    def __init__(self, response):
+        self.response = response
+        self.buffer_size = 0
+        self.output_size = 0
+        self.length = None
+
+    async def write(self, chunk):
+        self.output_size += len(chunk)
+        self.response.content.feed_data(chunk)
+        await self.response.content.drain()
+
+    async def write_eof(self, chunk=b''):
+        if chunk:
+            self.response.content.feed_data(chunk)
+        self.response.content.feed_eof()
+
+    async def drain(self):
+        await self.response.content.drain()
+
+    def enable_compression(self, encoding='deflate', strategy=None):
+        pass
+
+    def enable_chunking(self):
+        pass
+
+    async def write_headers(self, status_line, headers):
+        _, status, reason = status_line.split(' ', 2)
+        self.response.start(int(status), reason, _headers(headers))
+
+
+class _SocketlessTransport:
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def is_closing(self):
+        return False
+
+
+class _Protocol:
+    max_field_size = 8190
+    max_line_length = 8190
+    max_headers = 128
+    peername = None
+    sockname = None
+    ssl_context = None
+
+    def __init__(self, transport, writer):
+        self.transport = transport
+        self.writer = writer
+
+
+def _headers(headers):
+    return CIMultiDictProxy(CIMultiDict(headers))
+
+
+def encode_request(url, params=None, data=None, json_data=None,
+                   headers=None):
+    """Returns the full URL, headers and body bytes of a request, given
+    arguments in the form ``aiohttp.ClientSession.request`` takes"""
+    url = yarl.URL(url)
+    if params:
+        url = url.update_query(params)
+    headers = dict(headers or {})
+    headers.setdefault('Host', url.raw_host or '')
+    return url, headers, _encode_body(data, json_data, headers)
+
+
+def _encode_body(data, json_data, headers):
+    if json_data is not None:
+        headers.setdefault('Content-Type', 'application/json')
+        return json.dumps(json_data).encode('utf-8')
+    if data is None:
+        return b''
+    if hasattr(data, 'read'):
+        data = data.read()
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    if isinstance(data, dict):
+        headers.setdefault('Content-Type',
+                           'application/x-www-form-urlencoded')
+        return urllib.parse.urlencode(data).encode('utf-8')
+    return bytes(data)
+
+
+async def _feed(payload, stream):
+    try:
+        async for chunk in stream.chunks():
+            payload.feed_data(bytes(chunk))
+            await payload.drain()
+    except Exception as exc:
+        payload.set_exception(exc)
+    else:
+        payload.feed_eof()
+
+
+class AppTransport(Transport):
+    """Dispatches requests to an application in the same process.
+
+    :param app: an `aiohttp.web.Application`, started on the first
+        request and cleaned up by `close`, or an ASGI application
+
+    aiohttp applications are called through the internals of aiohttp 3
+    (``RawRequestMessage``, ``web.Request`` and ``Application._handle``),
+    which is why napper requires an aiohttp 3 release.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.is_aiohttp = isinstance(app, web.Application)
+        self._startup = None
+        self._socket = _SocketlessTransport()
+
+    def __repr__(self):
+        return '<AppTransport {0!r}>'.format(self.app)
+
+    async def _ensure_started(self):
+        if self._startup is None:
+            self.app.freeze()
+            self._startup = asyncio.ensure_future(self.app.startup())
+        await asyncio.shield(self._startup)
+
+    async def close(self):
+        if self._startup is not None and self.is_aiohttp:
+            await self.app.shutdown()
+            await self.app.cleanup()
+            self._startup = None
+
+    async def request(self, method, url, *, params=None, data=None,
+                      json=None, headers=None, **kwargs):
+        """Sends a request to the application. Arguments that only
+        matter to network transports, such as ``timeout``, are
+        ignored."""
+        stream = None
+        if isinstance(data, StreamBody):
+            stream, data = data, None
+        url, headers, body = encode_request(url, params, data, json, headers)
+        if stream is not None:
+            if stream.size is None:
+                headers.setdefault('Transfer-Encoding', 'chunked')
+            else:
+                headers.setdefault('Content-Length', str(stream.size))
+        response = InProcessResponse(method.upper(), str(url))
+        if self.is_aiohttp:
+            await self._ensure_started()
+            run = self._run_aiohttp(response, url, headers, body, stream)
+        else:
+            run = self._run_asgi(response, url, headers, body, stream)
+        response.producer = asyncio.ensure_future(run)
+        try:
+            return await response._started
+        except asyncio.CancelledError:
+            response.close()
+            raise
+
+    async def _run_aiohttp(self, response, url, headers, body, stream):
+        payload = BodyStream()
+        feeder = None
+        if stream is None:
+            payload.feed_data(body)
+            payload.feed_eof()
+        else:
+            feeder = asyncio.ensure_future(_feed(payload, stream))
+        writer = _Writer(response)
+        headers = _headers(headers)
+        path = url.raw_path_qs
+        message = RawRequestMessage(
+            response.method, path, HttpVersion11, headers,
+            tuple((k.encode('utf-8'), v.encode('utf-8'))
+                  for k, v in headers.items()),
+            False, None, False, 'Transfer-Encoding' in headers,
+            yarl.URL(path))
+        request = web.Request(
+            message, payload, _Protocol(self._socket, writer), writer,
+            asyncio.current_task(), asyncio.get_event_loop())
+        try:
+            await self._handle_aiohttp(response, request)
+        finally:
+            if feeder is not None:
+                feeder.cancel()
+
+    async def _handle_aiohttp(self, response, request):
+        try:
+            try:
+                resp = await self.app._handle(request)
+            except web.HTTPException as exc:
+                text = exc.text or ''
+                response.start(exc.status, exc.reason, _headers(exc.headers))
+                response.content.feed_data(text.encode('utf-8'))
+                response.content.feed_eof()
+                return
+            if not resp.prepared and (resp.body is None
+                                      or isinstance(resp.body, bytes)):
+                response.start(resp.status, resp.reason,
+                                _headers(resp.headers))
+                if resp.body:
+                    response.content.feed_data(resp.body)
+                response.content.feed_eof()
+                return
+            await resp.prepare(request)
+            await resp.write_eof()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            response.fail(exc)
+
+    async def _run_asgi(self, response, url, headers, body, stream):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': response.method,
+            'scheme': url.scheme,
+            'path': url.path,
+            'raw_path': url.raw_path.encode('ascii'),
+            'query_string': url.raw_query_string.encode('ascii'),
+            'root_path': '',
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                        for k, v in headers.items()],
+            'client': None,
+            'server': (url.host, url.port),
+        }
+        received = False
+        chunks = None if stream is None else stream.chunks()
+
+        async def receive():
+            nonlocal received
+            if chunks is not None and not received:
+                try:
+                    chunk = await type(chunks).__anext__(chunks)
+                except StopAsyncIteration:
+                    received = True
+                    return {'type': 'http.request', 'body': b'',
+                            'more_body': False}
+                return {'type': 'http.request', 'body': bytes(chunk),
+                        'more_body': True}
+            if not received:
+                received = True
+                return {'type': 'http.request', 'body': body,
+                        'more_body': False}
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response.start(
+                    message['status'], None, _headers(
+                        (k.decode('latin-1'), v.decode('latin-1'))
+                        for k, v in message.get('headers', ())))
+            elif message['type'] == 'http.response.body':
+                response.content.feed_data(message.get('body', b''))
+                if message.get('more_body', False):
+                    await response.content.drain()
+                else:
+                    response.content.feed_eof()
+
+        try:
+            await self.app(scope, receive, send)
+            if not response._started.done():
+                raise RuntimeError("ASGI application returned without"
+                                   " starting a response")
+            response.content.feed_eof()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            response.fail(exc)
@@ -3,6 +3,7 @@
 # See AUTHORS and COPYING for details.
 import asyncio
 import functools
+import inspect
 import weakref
 
 
@@ -15,6 +16,12 @@ except ImportError:
 UniversalDetector = chardet.universaldetector.UniversalDetector
 
 
+try:
+    import uvloop as _uvloop
+except ImportError:
+    _uvloop = None
+
+
 def getattribute_common(func):
     @functools.wraps(func)
     def _wrapper(self, attr):
@@ -61,6 +68,10 @@ class DemagifiedObject(object):
         return "m({0!r})".format(self._real_object)
 
 
+# A view is made per call on purpose. Keeping one in the object's
+# __dict__ saves the allocation, but makes each object part of a
+# reference cycle, which costs more than it saves on the short-lived
+# objects that traversing a response creates.
 m = DemagifiedObject
 
 
@@ -89,11 +100,70 @@ def requestmethods(cls):
     return cls
 
 
-def run(coro):
-    loop = asyncio.get_event_loop()
+def install_uvloop():
+    """Makes event loops created from now on uvloop loops, including the
+    ones napper creates for `.sync.SyncSession` and crawl workers.
+
+    Returns False, changing nothing, if uvloop is not installed.
+
+    This is opt-in because it isn't shown to help napper: in the benchmark
+    suite, the differences between asyncio and uvloop mostly stayed
+    within the noise between two runs on the same loop. Compare
+    ``python -m napper.bench run`` with and without ``--uvloop`` on the
+    machine that matters before relying on it."""
+    if _uvloop is None:
+        return False
+    if not isinstance(asyncio.get_event_loop_policy(),
+                      _uvloop.EventLoopPolicy):
+        asyncio.set_event_loop_policy(_uvloop.EventLoopPolicy())
+    return True
+
+
+def tune_loop(loop, *, debug=None, slow_callback_duration=None):
+    """Sets ``loop``'s debug mode and the duration above which callbacks
+    are logged as slow in debug mode. Arguments left to None keep the
+    loop's setting."""
+    if debug is not None:
+        loop.set_debug(debug)
+    if slow_callback_duration is not None:
+        loop.slow_callback_duration = slow_callback_duration
+    return loop
+
+
+def run(coro, *, uvloop=False, debug=None, slow_callback_duration=None):
+    """Runs ``coro`` on the current event loop until it completes,
+    setting a new one if there is none.
+
+    :param uvloop: if true, switch to uvloop loops beforehand when uvloop
+        is installed; see `install_uvloop`. Only the first call should
+        ask for it, as the loop used until then is left behind.
+    :param debug: turn the loop's debug mode on or off; debug mode slows
+        down every callback
+    :param slow_callback_duration: see `tune_loop`
+    """
+    if uvloop:
+        install_uvloop()
+    try:
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        # uvloop's policy, unlike asyncio's, doesn't create loops here
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    tune_loop(loop, debug=debug, slow_callback_duration=slow_callback_duration)
     return loop.run_until_complete(coro)
 
 
+async def get_aiter(obj):
+    """Returns the asynchronous iterator of ``obj``.
+
+    Accepts both ``__aiter__`` methods that return the iterator directly
+    and ones that are coroutines, as written for Python 3.6 and earlier."""
+    ret = type(obj).__aiter__(obj)
+    if inspect.isawaitable(ret):
+        ret = await ret
+    return ret
+
+
 def run_once_as_task(func):
     tasks = weakref.WeakKeyDictionary()
     @functools.wraps(func)
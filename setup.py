@@ -10,15 +10,17 @@ setup(
     url='https://github.com/epsy/napper',
     author='Yann Kaiser',
     author_email='kaiser.yann@gmail.com',
-    install_requires=['aiohttp', 'chardet'],
-    packages=('napper', 'napper.tests'),
+    python_requires='>=3.7',
+    install_requires=['aiohttp>=3.3,<4', 'chardet'],
+    packages=('napper', 'napper.bench', 'napper.tests'),
     keywords=[
         'http', 'requests', 'api', 'asyncio', 'asynchronous'
         ],
     classifiers=[
         "Development Status :: 3 - Alpha",
         "License :: OSI Approved :: MIT License",
-        "Programming Language :: Python :: 3.5",
+        "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3.7",
         "Intended Audience :: Developers",
         "Intended Audience :: Information Technology",
         "Intended Audience :: Science/Research",